@@ -0,0 +1 @@
+# Off-chain helpers for working with a deployed Rocket Lend contract
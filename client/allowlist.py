@@ -0,0 +1,69 @@
+from eth_utils import keccak, to_checksum_address
+
+# Merkle trees for pool borrower allowlists (setAllowedToBorrowRoot, and the _proof of borrow).
+#
+# A leaf is keccak256(abi_encode(node)), i.e. the hash of the node address
+# left-padded to 32 bytes. Each level hashes pairs in sorted order (so a proof
+# needs no left/right flags), and an odd node at the end of a level is carried
+# up unchanged.
+
+def leaf(node):
+    return keccak(bytes.fromhex(to_checksum_address(str(node))[2:]).rjust(32, b'\0'))
+
+def hash_pair(a, b):
+    return keccak(a + b) if a < b else keccak(b + a)
+
+class MerkleTree:
+    """A tree of 32-byte leaves with pairs hashed in sorted order, as Rocket Pool's rewards trees."""
+
+    def __init__(self, leaves):
+        self.levels = [list(leaves)]
+        if not self.levels[0]:
+            raise ValueError('no leaves')
+        while 1 < len(self.levels[-1]):
+            level = self.levels[-1]
+            self.levels.append([hash_pair(*level[i:i + 2]) if i + 1 < len(level) else level[i]
+                                for i in range(0, len(level), 2)])
+
+    @property
+    def root(self):
+        return self.levels[-1][0]
+
+    def proof_at(self, i):
+        """The proof for the leaf at position i."""
+        proof = []
+        for level in self.levels[:-1]:
+            sibling = i ^ 1
+            if sibling < len(level):
+                proof.append(level[sibling])
+            i //= 2
+        return proof
+
+class AllowlistTree(MerkleTree):
+    def __init__(self, nodes):
+        self.index = {}
+        for node in nodes:
+            self.index.setdefault(to_checksum_address(str(node)), len(self.index))
+        if not self.index:
+            raise ValueError('empty allowlist')
+        super().__init__(leaf(node) for node in self.index)
+
+    def __contains__(self, node):
+        return to_checksum_address(str(node)) in self.index
+
+    def proof(self, node):
+        """The _proof argument of borrow (or proof of a BorrowArgument) for node."""
+        node = to_checksum_address(str(node))
+        if node not in self.index:
+            raise ValueError(f'{node} is not in the allowlist')
+        return self.proof_at(self.index[node])
+
+def verify_leaf(root, leaf, proof):
+    hash = leaf
+    for sibling in proof:
+        hash = hash_pair(hash, sibling)
+    return hash == root
+
+def verify(root, node, proof):
+    """Whether borrow would accept proof for node against root."""
+    return verify_leaf(root, leaf(node), proof)
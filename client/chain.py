@@ -0,0 +1,20 @@
+from web3.exceptions import ContractLogicError
+try:
+    # what reverted calls raise on a local eth-tester chain
+    from eth_tester.exceptions import TransactionFailed
+except ImportError:
+    TransactionFailed = ContractLogicError
+
+# What the other helpers share for talking to the chain: the exceptions a
+# reverted call raises, ABI entries for the few Rocket Pool views they read,
+# and the MinipoolAction flag bits.
+
+# MinipoolAction flag bits
+Distribute = 0
+NotRewardsOnly = 1
+Refund = 2
+
+def view_abi(name, inputs, outputs):
+    return {'type': 'function', 'name': name, 'stateMutability': 'view',
+            'inputs': [{'name': '', 'type': t} for t in inputs],
+            'outputs': [{'name': '', 'type': t} for t in outputs]}
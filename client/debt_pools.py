@@ -0,0 +1,127 @@
+from eth_utils import keccak, to_checksum_address
+from web3.exceptions import Web3TypeError
+
+# Hints for the _prevIndex arguments of borrow, repay, transferDebt, forceRepayRPL, etc.
+#
+# Each node's debtPools is a linked list of pool ids sorted by end time. Item 0
+# is the head: its next is the first item, and its poolId is the number of items
+# ever allocated. Removed items are left in place pointing to themselves.
+#
+# A node's list is loaded with one batched read of all its items and cached until
+# an event that may change it is handled. Pool end times never change, so they
+# are cached for good.
+
+def selector(signature):
+    return keccak(signature.encode())[:4]
+
+debtPoolsSelector = selector('debtPools(address,uint256)')
+paramsSelector = selector('params(uint256)')
+
+# events from functions that can insert into or remove from a node's list
+listEvents = frozenset(['Borrow', 'BorrowMany', 'Repay', 'RepayInOrder', 'TransferDebt',
+                        'ForceRepayRPL', 'ForceRepayETH', 'ForceRepayRPLMany', 'ForceRepayETHMany',
+                        'ForceClaimRewards', 'ForceDistributeRefund'])
+
+def words(data):
+    return [int.from_bytes(data[i:i + 32], 'big') for i in range(0, len(data), 32)]
+
+def encode_address(address):
+    return bytes.fromhex(to_checksum_address(address)[2:]).rjust(32, b'\0')
+
+class DebtPoolHints:
+    def __init__(self, w3, rocketlend):
+        self.w3 = w3
+        self.address = to_checksum_address(str(getattr(rocketlend, 'address', rocketlend)))
+        self.lists = {}
+        self.endTimes = {}
+        self.batching = True
+
+    def call(self, data):
+        return self.w3.eth.call({'to': self.address, 'data': data})
+
+    def call_batch(self, datas):
+        if self.batching and 1 < len(datas):
+            try:
+                with self.w3.batch_requests() as batch:
+                    for data in datas:
+                        batch.add(self.w3.eth.call({'to': self.address, 'data': data}))
+                    return batch.execute()
+            except Web3TypeError:
+                # the provider does not support batches (e.g. the local test provider)
+                self.batching = False
+        return [self.call(data) for data in datas]
+
+    def debt_pools_input(self, node, index):
+        return debtPoolsSelector + encode_address(node) + index.to_bytes(32, 'big')
+
+    def load(self, node):
+        head = tuple(words(self.call(self.debt_pools_input(node, 0))))
+        count = head[1]
+        items = [head] + [tuple(words(result)) for result in
+                          self.call_batch([self.debt_pools_input(node, index) for index in range(1, count + 1)])]
+        order = []
+        index = items[0][0]
+        while index != 0:
+            order.append((index, items[index][1]))
+            index = items[index][0]
+        self.load_end_times(poolId for _, poolId in order)
+        return order
+
+    def load_end_times(self, poolIds):
+        missing = sorted(set(poolIds) - self.endTimes.keys())
+        results = self.call_batch([paramsSelector + poolId.to_bytes(32, 'big') for poolId in missing])
+        for poolId, result in zip(missing, results):
+            self.endTimes[poolId] = words(result)[1]
+
+    def items(self, node):
+        """(index, poolId) for each item in a node's list, in order."""
+        node = to_checksum_address(str(node))
+        if node not in self.lists:
+            self.lists[node] = self.load(node)
+        return self.lists[node]
+
+    def end_time(self, poolId):
+        self.load_end_times([poolId])
+        return self.endTimes[poolId]
+
+    def insert_hint(self, node, poolId):
+        """_prevIndex for inserting poolId, i.e. when the node's loan from it is empty."""
+        endTime = self.end_time(poolId)
+        prev = 0
+        for index, itemPoolId in self.items(node):
+            if endTime < self.endTimes[itemPoolId]:
+                break
+            prev = index
+        return prev
+
+    def remove_hint(self, node, poolId):
+        """_prevIndex for removing poolId, i.e. when the node's loan from it is repaid in full."""
+        prev = 0
+        for index, itemPoolId in self.items(node):
+            if itemPoolId == poolId:
+                return prev
+            prev = index
+        raise ValueError(f'pool {poolId} is not in the debt pools of {node}')
+
+    def hint(self, node, poolId):
+        """_prevIndex for poolId: for removing it if it is in the node's list, otherwise for inserting it."""
+        if any(itemPoolId == poolId for _, itemPoolId in self.items(node)):
+            return self.remove_hint(node, poolId)
+        return self.insert_hint(node, poolId)
+
+    def invalidate(self, node=None):
+        if node is None:
+            self.lists.clear()
+        else:
+            self.lists.pop(to_checksum_address(str(node)), None)
+
+    def handle_logs(self, logs):
+        """Drop cached lists if any of logs (ape ContractLogs or web3 event data) may have changed them.
+
+        The events do not say which node they are for, so all lists are dropped.
+        """
+        for log in logs:
+            name = getattr(log, 'event_name', None) or log['event']
+            if name in listEvents:
+                self.invalidate()
+                return
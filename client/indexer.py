@@ -0,0 +1,141 @@
+import json
+import sqlite3
+from eth_utils import event_abi_to_log_topic, to_checksum_address
+from web3.exceptions import BlockNotFound
+
+# Incremental indexer of a Rocket Lend contract's logs into SQLite.
+#
+# Logs are fetched in chunks of blocks and each chunk is committed together with
+# the checkpoint (the last block indexed), so an interrupted sync resumes from the
+# last complete chunk. The hash of every block logs were taken from, and of every
+# checkpoint, is kept; a sync first checks the recent ones against the chain and,
+# if any were reorged out, drops everything indexed after the last block before
+# them, so those logs are replaced by the ones on the new chain.
+
+schema = '''
+create table if not exists logs (
+  blockNumber integer not null,
+  logIndex integer not null,
+  blockHash text not null,
+  transactionHash text not null,
+  event text not null,
+  args text not null,
+  primary key (blockNumber, logIndex)
+);
+create index if not exists logsByEvent on logs (event, blockNumber);
+create table if not exists blocks (
+  number integer primary key,
+  hash text not null
+);
+create table if not exists checkpoint (
+  id integer primary key check (id = 0),
+  blockNumber integer not null
+);
+'''
+
+def to_json(value):
+    if isinstance(value, bytes):
+        return '0x' + value.hex()
+    if isinstance(value, (list, tuple)):
+        return [to_json(item) for item in value]
+    if isinstance(value, dict):
+        return {key: to_json(item) for key, item in value.items()}
+    return value
+
+def hex_hash(value):
+    return '0x' + bytes(value).hex()
+
+class Indexer:
+    def __init__(self, w3, address, abi, path, startBlock=0, chunkSize=2000, reorgDepth=64):
+        self.w3 = w3
+        self.address = to_checksum_address(str(address))
+        self.contract = w3.eth.contract(address=self.address, abi=abi)
+        self.eventNames = {event_abi_to_log_topic(item): item['name'] for item in abi if item['type'] == 'event'}
+        self.startBlock = startBlock
+        self.chunkSize = chunkSize
+        self.reorgDepth = reorgDepth
+        self.db = sqlite3.connect(path)
+        self.db.executescript(schema)
+
+    def close(self):
+        self.db.close()
+
+    @property
+    def checkpoint(self):
+        row = self.db.execute('select blockNumber from checkpoint').fetchone()
+        return self.startBlock - 1 if row is None else row[0]
+
+    def block_hash(self, number):
+        try:
+            return hex_hash(self.w3.eth.get_block(number)['hash'])
+        except BlockNotFound:
+            # the chain is now shorter than it was
+            return None
+
+    def rollback(self):
+        """Drop everything indexed after the last stored block before any reorg.
+
+        Stored blocks within reorgDepth of the checkpoint are checked against the
+        chain. Returns the number of logs dropped.
+        """
+        blocks = self.db.execute('select number, hash from blocks order by number').fetchall()
+        recent = [(number, hash) for number, hash in blocks if self.checkpoint - self.reorgDepth < number]
+        reorged = next((number for number, hash in recent if self.block_hash(number) != hash), None)
+        if reorged is None:
+            return 0
+        keep = self.startBlock - 1
+        for number, hash in reversed(blocks):
+            if number < reorged and self.block_hash(number) == hash:
+                keep = number
+                break
+        with self.db:
+            dropped = self.db.execute('delete from logs where blockNumber > ?', (keep,)).rowcount
+            self.db.execute('delete from blocks where number > ?', (keep,))
+            self.save_checkpoint(keep)
+        return dropped
+
+    def save_checkpoint(self, blockNumber):
+        self.db.execute('insert or replace into checkpoint (id, blockNumber) values (0, ?)', (blockNumber,))
+
+    def decode(self, log):
+        name = self.eventNames.get(bytes(log['topics'][0])) if log['topics'] else None
+        if name is None:
+            return None, {}
+        return name, dict(self.contract.events[name]().process_log(log)['args'])
+
+    def sync(self, toBlock=None):
+        """Index logs up to toBlock (default: the latest block). Returns the number of logs added."""
+        self.rollback()
+        if toBlock is None:
+            toBlock = self.w3.eth.block_number
+        added = 0
+        fromBlock = self.checkpoint + 1
+        while fromBlock <= toBlock:
+            chunkEnd = min(fromBlock + self.chunkSize - 1, toBlock)
+            logs = self.w3.eth.get_logs({'address': self.address, 'fromBlock': fromBlock, 'toBlock': chunkEnd})
+            endHash = self.block_hash(chunkEnd)
+            with self.db:
+                for log in logs:
+                    name, args = self.decode(log)
+                    if name is None:
+                        continue
+                    self.db.execute('insert into logs values (?, ?, ?, ?, ?, ?)',
+                                    (log['blockNumber'], log['logIndex'], hex_hash(log['blockHash']),
+                                     hex_hash(log['transactionHash']), name, json.dumps(to_json(args))))
+                    self.db.execute('insert or replace into blocks values (?, ?)',
+                                    (log['blockNumber'], hex_hash(log['blockHash'])))
+                    added += 1
+                self.db.execute('insert or replace into blocks values (?, ?)', (chunkEnd, endHash))
+                self.save_checkpoint(chunkEnd)
+            fromBlock = chunkEnd + 1
+        return added
+
+    def logs(self, event=None, fromBlock=0):
+        """(blockNumber, event, args) for the indexed logs, in chain order."""
+        query = 'select blockNumber, event, args from logs where blockNumber >= ?'
+        params = [fromBlock]
+        if event is not None:
+            query += ' and event = ?'
+            params.append(event)
+        rows = self.db.execute(query + ' order by blockNumber, logIndex', params)
+        return [(blockNumber, name, json.loads(args)) for blockNumber, name, args in rows]
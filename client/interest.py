@@ -0,0 +1,46 @@
+import numpy as np
+
+# Projection of loan interest, with the same integer arithmetic as the contract's
+# _chargeInterest and _outstandingInterest.
+#
+# The functions work elementwise on arrays (or anything np.asarray accepts) and
+# broadcast, so e.g. loans[:, None] against timestamps[None, :] gives a table of
+# loans by timestamp. Amounts are uint256 in the contract and their products
+# overflow int64, so arrays are of Python ints (dtype object): exact, and still
+# computed a whole array per operation.
+
+SECONDS_PER_YEAR = 365 * 24 * 60 * 60
+
+def as_ints(values):
+    array = np.asarray(values, dtype=object)
+    return np.vectorize(int, otypes=[object])(array) if array.size else array
+
+def outstanding_interest(borrowed, rate, startTime, endTime):
+    # rate is percentage RPL per RPL per year
+    return borrowed * rate * (endTime - startTime) // 100 // SECONDS_PER_YEAR
+
+def charge_interest(borrowed, accountedUntil, rate, endTime, timestamp):
+    """The interest _chargeInterest adds to a loan's interestDue at timestamp.
+
+    Raises ValueError where the contract would revert: for a timestamp before
+    accountedUntil, or after endTime with a rate too high to double in a uint8.
+    """
+    borrowed, accountedUntil, rate, endTime, timestamp = np.broadcast_arrays(
+        *map(as_ints, (borrowed, accountedUntil, rate, endTime, timestamp)))
+    if (timestamp < accountedUntil).any():
+        raise ValueError('timestamp before accountedUntil')
+    if ((endTime <= timestamp) & (255 < 2 * rate)).any():
+        raise ValueError('rate overflows when doubled after endTime')
+    # every branch is computed for every element (the ones not taken are discarded), as in:
+    # if timestamp < endTime: ... elif accountedUntil < endTime: ... else: ...
+    return np.where(
+        timestamp < endTime,
+        outstanding_interest(borrowed, rate, accountedUntil, timestamp),
+        np.where(accountedUntil < endTime,
+                 outstanding_interest(borrowed, rate, accountedUntil, endTime) +
+                 outstanding_interest(borrowed, 2 * rate, endTime, timestamp),
+                 outstanding_interest(borrowed, 2 * rate, accountedUntil, timestamp)))
+
+def project_debt(borrowed, interestDue, accountedUntil, rate, endTime, timestamp):
+    """A loan's total debt (borrowed plus interest due) if its interest were charged at timestamp."""
+    return as_ints(borrowed) + as_ints(interestDue) + charge_interest(borrowed, accountedUntil, rate, endTime, timestamp)
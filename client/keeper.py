@@ -0,0 +1,252 @@
+import asyncio
+from typing import NamedTuple
+from eth_utils import to_checksum_address
+from client.chain import view_abi, ContractLogicError, TransactionFailed, Refund
+from client.debt_pools import DebtPoolHints
+from client.interest import project_debt
+
+# Keeper that forces repayment of loans from pools past their end time.
+#
+# The keeper finds the loans itself, from the contract's public state: it reads the
+# pools' params for those past their end time, and each one's nodes (poolNodes) and
+# their loans. For every such loan that still owes, it builds the candidate force*
+# calls, estimates how much of the debt (in RPL) each would recover from the
+# borrower's current balances (and, given a ClaimBuilder, its unclaimed rewards),
+# simulates them all concurrently with eth_call (dropping those that would revert),
+# and submits the one that recovers the most. Only one call is made per node per
+# round, as it changes what the others would recover and the node's debtPools hints.
+# The transactions are submitted one after another, so a failed one can give its nonce
+# back before the next is numbered.
+#
+# The web3 calls are blocking; they are run in threads, at most concurrency at once.
+
+oneEther = 10 ** 18
+
+# the functions of the Rocket Pool contracts used to estimate recoveries
+rocketPoolABI = [
+    view_abi('getRPLPrice', [], ['uint256']),
+    view_abi('getNodeRPLStake', ['address'], ['uint256']),
+    view_abi('getNodeMinipoolCount', ['address'], ['uint256']),
+    view_abi('getNodeMinipoolAt', ['address', 'uint256'], ['address']),
+    view_abi('getNodeRefundBalance', [], ['uint256']),
+    view_abi('getProxyAddress', ['address'], ['address']),
+    view_abi('getNodeShare', [], ['uint256']),
+]
+
+class Action(NamedTuple):
+    function: str
+    args: tuple
+    recoveredRPL: int
+
+    @property
+    def poolId(self):
+        return self.args[0]
+
+    @property
+    def node(self):
+        return self.args[1]
+
+class NonceManager:
+    """Consecutive nonces for an account, starting from its pending transaction count."""
+
+    def __init__(self, w3, address):
+        self.w3 = w3
+        self.address = to_checksum_address(address)
+        self.locks = {}
+        self.nonce = None
+
+    @property
+    def lock(self):
+        # an asyncio.Lock belongs to the event loop it is first used in, and each asyncio.run has its own
+        return self.locks.setdefault(asyncio.get_running_loop(), asyncio.Lock())
+
+    async def next(self):
+        async with self.lock:
+            if self.nonce is None:
+                self.nonce = await asyncio.to_thread(self.w3.eth.get_transaction_count, self.address, 'pending')
+            nonce = self.nonce
+            self.nonce += 1
+            return nonce
+
+    async def reset(self):
+        """Start again from the pending transaction count, e.g. after a nonce was not used."""
+        async with self.lock:
+            self.nonce = None
+
+class Keeper:
+    def __init__(self, w3, rocketlend, abi, sender=None, account=None, dryRun=False, concurrency=8,
+                 poolIds=None, claims=None, log=print):
+        """Submits transactions signed by account (an eth_account LocalAccount), or only logs them if dryRun.
+
+        Calls are simulated from sender (default: account's address); only a
+        pool's lender can force repayment with the node's ETH. The loans of
+        all pools are considered, or only those of poolIds if given. With
+        claims (a client.rewards.ClaimBuilder), forceClaimMerkleRewards is
+        considered too, repaying with the claimed RPL.
+        """
+        assert dryRun or account is not None, 'an account is needed unless dryRun'
+        self.w3 = w3
+        self.contract = w3.eth.contract(address=to_checksum_address(str(getattr(rocketlend, 'address', rocketlend))),
+                                        abi=abi)
+        self.sender = to_checksum_address(sender or account.address)
+        self.account = account
+        self.dryRun = dryRun
+        self.log = log
+        self.hints = DebtPoolHints(w3, self.contract.address)
+        self.nonces = None if dryRun else NonceManager(w3, self.sender)
+        self.concurrency = concurrency
+        self.semaphores = {}
+        self.rocketPool = {name: w3.eth.contract(address=self.contract.functions[name]().call(), abi=rocketPoolABI)
+                           for name in ['rocketNodeStaking', 'rocketNetworkPrices',
+                                        'rocketNodeDistributorFactory', 'rocketMinipoolManager']}
+        self.poolIds = poolIds if poolIds is None else set(poolIds)
+        self.claims = claims
+
+    async def call(self, fn, *args, **kwargs):
+        # like a Lock, a Semaphore belongs to the event loop it is first used in
+        semaphore = self.semaphores.setdefault(asyncio.get_running_loop(), asyncio.Semaphore(self.concurrency))
+        async with semaphore:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+
+    async def pool_loans(self, poolId):
+        """(node, loan) for each node with a loan from the pool."""
+        functions = self.contract.functions
+        count = await self.call(functions.poolNodeCount(poolId).call)
+        nodes = await asyncio.gather(*(self.call(functions.poolNodes(poolId, i).call) for i in range(count)))
+        loans = await asyncio.gather(*(self.call(functions.loans(poolId, node).call) for node in nodes))
+        return list(zip(nodes, loans))
+
+    async def expired_loans(self):
+        """(poolId, node, debt) for each loan from a pool past its end time that still owes, debt as of the latest block."""
+        timestamp = (await self.call(self.w3.eth.get_block, 'latest'))['timestamp']
+        functions = self.contract.functions
+        poolIds = [poolId for poolId in range(await self.call(functions.nextPoolId().call))
+                   if self.poolIds is None or poolId in self.poolIds]
+        params = await asyncio.gather(*(self.call(functions.params(poolId).call) for poolId in poolIds))
+        ended = [(poolId, poolParams) for poolId, poolParams in zip(poolIds, params) if poolParams[1] < timestamp]
+        loans = await asyncio.gather(*(self.pool_loans(poolId) for poolId, _ in ended))
+        expired = []
+        for (poolId, (rate, endTime)), poolLoans in zip(ended, loans):
+            for node, (borrowed, interestDue, accountedUntil) in poolLoans:
+                try:
+                    debt = int(project_debt(borrowed, interestDue, accountedUntil, rate, endTime, timestamp))
+                except ValueError as e:
+                    # the contract cannot charge its interest either, so none of the force* calls can succeed
+                    self.log(f'skipping pool {poolId} node {node}: {e}')
+                    continue
+                expired.append((poolId, node, debt))
+        return expired
+
+    async def candidates(self, poolId, node, debt):
+        """The force* calls that could recover some of debt, with estimates of how much."""
+        _, _, _, _, lender, _ = await self.call(self.contract.functions.pools(poolId).call)
+        _, _, balanceRPL, balanceETH, *_ = await self.call(self.contract.functions.borrowers(node).call)
+        prev = await self.call(self.hints.hint, node, poolId)
+        stake = await self.call(self.rocketPool['rocketNodeStaking'].functions.getNodeRPLStake(node).call)
+        actions = [Action('forceRepayRPL', (poolId, node, prev, 0), min(debt, balanceRPL))]
+        unstake = min(stake, max(0, debt - balanceRPL))
+        if 0 < unstake:
+            actions.append(Action('forceRepayRPL', (poolId, node, prev, unstake), min(debt, balanceRPL + unstake)))
+        if self.claims is not None:
+            actions.extend(await self.claim_candidates(poolId, node, debt, prev, balanceRPL))
+        if self.sender == lender:
+            price = await self.call(self.rocketPool['rocketNetworkPrices'].functions.getRPLPrice().call)
+            actions.append(Action('forceRepayETH', (poolId, node, prev), min(debt, balanceETH * oneEther // price)))
+            nodeShare, refunded, refunds = await self.claimable(node)
+            if 0 < nodeShare or refunds:
+                # the contract credits the distributor's node share and the refunds to the node's balance,
+                # then repays with all of its ETH
+                actions.append(Action('forceDistributeRefund', (poolId, node, prev, 0 < nodeShare, refunds),
+                                      min(debt, (balanceETH + nodeShare + refunded) * oneEther // price)))
+        return [action for action in actions if 0 < action.recoveredRPL]
+
+    async def claim_candidates(self, poolId, node, debt, prev, balanceRPL):
+        """forceClaimMerkleRewards of the node's first batch of unclaimed rewards, repaying with its RPL."""
+        try:
+            batches = await self.call(self.claims.arguments, node)
+        except ValueError as e:
+            self.log(f'not claiming rewards for node {node}: {e}')
+            return []
+        if not batches:
+            return []
+        rewardIndex, amountRPL, amountETH, proof = batches[0]
+        # the contract only allows it if the claim is needed for the repayment
+        repayRPL = min(debt, balanceRPL + sum(amountRPL))
+        if repayRPL <= balanceRPL:
+            return []
+        return [Action('forceClaimMerkleRewards',
+                       (poolId, node, prev, repayRPL, 0, rewardIndex, amountRPL, amountETH, proof), repayRPL)]
+
+    async def claimable(self, node):
+        """The node share of the node's fee distributor, the total of its minipools' refund balances,
+        and MinipoolArguments for the minipools with refunds."""
+        factory = self.rocketPool['rocketNodeDistributorFactory']
+        distributor = self.w3.eth.contract(address=await self.call(factory.functions.getProxyAddress(node).call),
+                                           abi=rocketPoolABI)
+        nodeShare = await self.call(distributor.functions.getNodeShare().call)
+        manager = self.rocketPool['rocketMinipoolManager']
+        count = await self.call(manager.functions.getNodeMinipoolCount(node).call)
+        minipools = await asyncio.gather(*(self.call(manager.functions.getNodeMinipoolAt(node, index).call)
+                                           for index in range(count)))
+        balances = await asyncio.gather(*(self.call(self.w3.eth.contract(address=minipool, abi=rocketPoolABI)
+                                                    .functions.getNodeRefundBalance().call)
+                                          for minipool in minipools))
+        return nodeShare, sum(balances), [(index, 1 << Refund) for index, balance in enumerate(balances) if 0 < balance]
+
+    async def simulate(self, action):
+        try:
+            await self.call(self.contract.functions[action.function](*action.args).call, {'from': self.sender})
+            return True
+        except (ContractLogicError, TransactionFailed):
+            return False
+
+    async def submit(self, action):
+        nonce = await self.nonces.next()
+        try:
+            tx = await self.call(self.contract.functions[action.function](*action.args).build_transaction,
+                                 {'from': self.sender, 'nonce': nonce})
+            signed = self.account.sign_transaction(tx)
+            txHash = await self.call(self.w3.eth.send_raw_transaction, signed.raw_transaction)
+        except Exception:
+            await self.nonces.reset()
+            raise
+        self.hints.invalidate(action.node)
+        return txHash
+
+    async def plan(self):
+        """The action to take for each node with expired loans: the one recovering the most."""
+        expired = await self.expired_loans()
+        candidates = [action for actions in await asyncio.gather(*(self.candidates(*loan) for loan in expired))
+                      for action in actions]
+        succeeds = await asyncio.gather(*(self.simulate(action) for action in candidates))
+        best = {}
+        for action, ok in zip(candidates, succeeds):
+            if ok and action.recoveredRPL > getattr(best.get(action.node), 'recoveredRPL', 0):
+                best[action.node] = action
+        return list(best.values())
+
+    async def run_once(self):
+        """Plan and (unless dryRun) submit one round of actions.
+
+        Returns (action, transaction hash) pairs, with None for the hash if
+        dryRun or if the transaction could not be sent.
+        """
+        actions = await self.plan()
+        for action in actions:
+            self.log(f'{"would call" if self.dryRun else "calling"} {action.function}{action.args} '
+                     f'to recover ~{action.recoveredRPL} RPL')
+        if self.dryRun:
+            return [(action, None) for action in actions]
+        results = []
+        for action in actions:
+            try:
+                results.append((action, await self.submit(action)))
+            except Exception as e:
+                self.log(f'{action.function}{action.args} failed: {e}')
+                results.append((action, None))
+        return results
+
+    async def run(self, interval=12):
+        while True:
+            await self.run_once()
+            await asyncio.sleep(interval)
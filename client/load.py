@@ -0,0 +1,402 @@
+import math
+import time
+import random
+import asyncio
+from typing import NamedTuple
+from eth_utils import to_checksum_address
+from web3.logs import DISCARD
+from client.debt_pools import DebtPoolHints
+from client.chain import view_abi
+from client.keeper import NonceManager
+
+# Load generator: drives a weighted mix of createPool, borrow, repay,
+# transferDebt, distributeRefund and withdraw from many accounts at once, and
+# reports the throughput, the gas used by each function, and how that grows with
+# the length of the node's debtPools list.
+#
+# Each operation is planned from the chain's current state (the node's list, with
+# DebtPoolHints for the _prevIndex arguments, and the pools' funds), so that it
+# should succeed. A node has one operation at a time, held from planning until its
+# receipt, so plans do not go stale; lenders' createPool calls are not held, so a
+# lender can have several in flight, with consecutive nonces from a NonceManager.
+# Each account's sends are serialized from taking the nonce to handing over the
+# signed transaction, so they reach the node in nonce order (a node that rejects
+# nonce gaps, like the test chain, would otherwise refuse one sent early).
+# Transactions are sent with a fixed gas limit instead of an estimate: a plan that
+# went stale anyway shows as a reverted transaction rather than a failed estimate
+# leaving a gap in the sender's nonces.
+#
+# The web3 calls are blocking; they are run in threads, one operation per worker
+# at a time and concurrency workers. callThreads caps the calls in flight at once,
+# e.g. 1 for an in-process test chain, which is not thread-safe.
+
+oneRPL = 10 ** 18
+oneEther = 10 ** 18
+week = 7 * 24 * 60 * 60
+
+ZERO_ADDRESS = '0x' + '00' * 20
+
+defaultMix = dict(createPool=1, borrow=6, repay=3, transferDebt=2, distributeRefund=1, withdraw=1)
+
+# the functions whose gas may depend on the node's debtPools list
+listFunctions = ['borrow', 'repay', 'transferDebt', 'distributeRefund', 'withdraw']
+
+def transaction_abi(name, inputs):
+    return {'type': 'function', 'name': name, 'stateMutability': 'nonpayable',
+            'inputs': [{'name': '', 'type': t} for t in inputs], 'outputs': []}
+
+# the functions of RPL and the Rocket Pool stand-ins used to set up the accounts
+rocketPoolABI = [
+    transaction_abi('transfer', ['address', 'uint256']),
+    transaction_abi('approve', ['address', 'uint256']),
+    transaction_abi('setNodeETHProvided', ['address', 'uint256']),
+    view_abi('getNodeRPLStake', ['address'], ['uint256']),
+    view_abi('getProxyAddress', ['address'], ['address']),
+]
+
+class Operation(NamedTuple):
+    function: str
+    sender: object # an eth_account LocalAccount
+    args: tuple
+    node: str = None
+    listLength: int = None
+    fund: tuple = None # (address, value) to send ETH to first, not measured
+
+class Result(NamedTuple):
+    function: str
+    gasUsed: int
+    status: int
+    seconds: float # from sending to the receipt
+    listLength: int = None
+
+def percentile(values, p):
+    """The nearest-rank p-th percentile of values, which must be sorted."""
+    return values[max(0, math.ceil(p * len(values) / 100) - 1)]
+
+def length_bucket(length):
+    """The smallest length in length's power-of-two bucket: 0, 1, 2-3, 4-7, ..."""
+    return 1 << (length.bit_length() - 1) if length else 0
+
+def slope(points):
+    """The least-squares slope of y over x for (x, y) points, or None if all x are the same."""
+    n = len(points)
+    meanX = sum(x for x, _ in points) / n
+    meanY = sum(y for _, y in points) / n
+    varX = sum((x - meanX) ** 2 for x, _ in points)
+    if varX == 0:
+        return None
+    return sum((x - meanX) * (y - meanY) for x, y in points) / varX
+
+def report(results, seconds):
+    """Summary of results: counts and rate, gas percentiles by function, and gas by debtPools length."""
+    gas = {}
+    for function in sorted({result.function for result in results}):
+        ok = sorted(result.gasUsed for result in results if result.function == function and result.status)
+        count = sum(1 for result in results if result.function == function)
+        latency = sorted(result.seconds for result in results if result.function == function)
+        gas[function] = dict(count=count, reverted=count - len(ok),
+                             latency50=percentile(latency, 50), latency90=percentile(latency, 90))
+        if ok:
+            gas[function].update(p50=percentile(ok, 50), p90=percentile(ok, 90), p99=percentile(ok, 99),
+                                 max=ok[-1])
+    lengths = {}
+    for function in listFunctions:
+        points = [(result.listLength, result.gasUsed) for result in results
+                  if result.function == function and result.status and result.listLength is not None]
+        if not points:
+            continue
+        buckets = {}
+        for length, gasUsed in points:
+            buckets.setdefault(length_bucket(length), []).append(gasUsed)
+        lengths[function] = dict(perItem=slope(points), maxLength=max(length for length, _ in points),
+                                 buckets={bucket: dict(count=len(values), p50=percentile(sorted(values), 50))
+                                          for bucket, values in sorted(buckets.items())})
+    confirmed = sum(1 for result in results if result.status)
+    return dict(transactions=len(results), reverted=len(results) - confirmed, seconds=seconds,
+                tps=len(results) / seconds if seconds else 0, gas=gas, debtPools=lengths)
+
+def format_report(summary):
+    def bucket_name(bucket):
+        return str(bucket) if bucket < 2 else f'{bucket}-{2 * bucket - 1}'
+    lines = [f'{summary["transactions"]} transactions ({summary["reverted"]} reverted) '
+             f'in {summary["seconds"]:.1f}s: {summary["tps"]:.1f} per second',
+             '',
+             f'{"function":<18}{"count":>7}{"reverted":>9}{"p50":>9}{"p90":>9}{"p99":>9}{"max":>9}'
+             f'{"latency p50/p90":>18}']
+    for function, entry in summary['gas'].items():
+        gas = ''.join(f'{entry.get(key, "-"):>9}' for key in ['p50', 'p90', 'p99', 'max'])
+        lines.append(f'{function:<18}{entry["count"]:>7}{entry["reverted"]:>9}{gas}'
+                     f'{entry["latency50"]:>11.2f}/{entry["latency90"]:.2f}s')
+    if summary['debtPools']:
+        lines += ['', 'median gas by debtPools length:']
+        for function, entry in summary['debtPools'].items():
+            perItem = '-' if entry['perItem'] is None else f'{entry["perItem"]:+.0f}'
+            buckets = ', '.join(f'{bucket_name(bucket)}: {values["p50"]} ({values["count"]})'
+                                for bucket, values in entry['buckets'].items())
+            lines.append(f'  {function:<16} {perItem} gas per item (up to {entry["maxLength"]}); {buckets}')
+    return '\n'.join(lines)
+
+class LoadGenerator:
+    def __init__(self, w3, rocketlend, abi, lenders, nodes, poolIds=(), mix=None,
+                 amount=oneRPL, supply=10_000 * oneRPL, refund=oneEther // 100,
+                 gas=3_000_000, concurrency=16, callThreads=None, seed=None, log=print):
+        """Sends from lenders and nodes (eth_account LocalAccounts) against the pools poolIds (and those it creates).
+
+        mix weights the functions (default defaultMix). amount is the RPL of each
+        borrow, supply that of each new pool, and refund the ETH sent to a node's
+        fee distributor before each distributeRefund. The nodes must have joined;
+        prepare gives all the accounts the RPL, ETH and approvals they need.
+        callThreads, if given, is the most web3 calls run (in threads) at once.
+        """
+        self.w3 = w3
+        self.contract = w3.eth.contract(address=to_checksum_address(str(getattr(rocketlend, 'address', rocketlend))),
+                                        abi=abi)
+        self.lenders = list(lenders)
+        self.nodes = {node.address: node for node in nodes}
+        self.poolIds = list(poolIds)
+        self.mix = dict(mix or defaultMix)
+        self.amount = amount
+        self.supply = supply
+        self.refund = refund
+        self.gas = gas
+        self.concurrency = concurrency
+        self.callThreads = callThreads
+        self.callLimits = {}
+        self.rng = random.Random(seed)
+        self.log = log
+        self.hints = DebtPoolHints(w3, self.contract.address)
+        self.nonces = {}
+        self.sendLocks = {}
+        self.params = {}
+        self.distributors = {}
+        self.busy = set()
+        self.remaining = 0
+        self.inFlight = 0
+        self.chainId = w3.eth.chain_id
+        self.RPL = self.rocket_pool(self.contract.functions.RPL().call())
+        self.rocketNodeStaking = self.rocket_pool(self.contract.functions.rocketNodeStaking().call())
+        self.distributorFactory = self.rocket_pool(self.contract.functions.rocketNodeDistributorFactory().call())
+
+    def rocket_pool(self, address):
+        return self.w3.eth.contract(address=address, abi=rocketPoolABI)
+
+    async def call(self, fn, *args, **kwargs):
+        if self.callThreads is None:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+        # per event loop, like the send locks
+        limit = self.callLimits.setdefault(asyncio.get_running_loop(), asyncio.Semaphore(self.callThreads))
+        async with limit:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+
+    def nonce_manager(self, account):
+        if account.address not in self.nonces:
+            self.nonces[account.address] = NonceManager(self.w3, account.address)
+        return self.nonces[account.address]
+
+    def send_lock(self, account):
+        # per event loop, like NonceManager's: each asyncio.run has its own
+        locks = self.sendLocks.setdefault(account.address, {})
+        return locks.setdefault(asyncio.get_running_loop(), asyncio.Lock())
+
+    async def send(self, account, function=None, params=None):
+        """Sign and send function (a web3 contract function call), or a plain transaction with params.
+
+        Returns (transaction hash, time sent).
+        """
+        nonces = self.nonce_manager(account)
+        async with self.send_lock(account):
+            nonce = await nonces.next()
+            try:
+                tx = dict(params or {}, **{'from': account.address, 'nonce': nonce, 'gas': self.gas})
+                if function is None:
+                    tx.update(chainId=self.chainId, gasPrice=await self.call(lambda: self.w3.eth.gas_price))
+                else:
+                    tx = await self.call(function.build_transaction, tx)
+                signed = account.sign_transaction(tx)
+                sent = time.monotonic()
+                txHash = await self.call(self.w3.eth.send_raw_transaction, signed.raw_transaction)
+            except Exception:
+                await nonces.reset()
+                raise
+        return txHash, sent
+
+    async def transact(self, account, function=None, params=None):
+        """send, then wait for the receipt. Returns (receipt, seconds from sending to the receipt)."""
+        txHash, sent = await self.send(account, function, params)
+        receipt = await self.call(self.w3.eth.wait_for_transaction_receipt, txHash, timeout=600)
+        return receipt, time.monotonic() - sent
+
+    async def prepare(self, admin, lenderRPL=1_000_000 * oneRPL, nodeRPL=10_000 * oneRPL,
+                      nodeETH=10 * oneEther, ETHProvided=1000 * oneEther):
+        """Give the accounts, from admin, RPL (approved for Rocket Lend) and ETH.
+
+        Each node's ETH provided is set to ETHProvided, for room to borrow: only
+        possible with the Rocket Pool stand-ins.
+        """
+        rocketlend = self.contract.address
+
+        async def fund(account, amountRPL, amountETH):
+            if amountETH:
+                await self.transact(admin, params={'to': account.address, 'value': amountETH})
+            await self.transact(admin, self.RPL.functions.transfer(account.address, amountRPL))
+            await self.transact(account, self.RPL.functions.approve(rocketlend, 2 ** 256 - 1))
+
+        async def fund_node(node):
+            await fund(node, nodeRPL, nodeETH)
+            await self.transact(admin, self.rocketNodeStaking.functions.setNodeETHProvided(node.address, ETHProvided))
+
+        await asyncio.gather(*(fund(lender, lenderRPL, 0) for lender in self.lenders),
+                             *(fund_node(node) for node in self.nodes.values()))
+
+    async def now(self):
+        return (await self.call(self.w3.eth.get_block, 'latest'))['timestamp']
+
+    async def pool_params(self, poolId):
+        if poolId not in self.params:
+            self.params[poolId] = tuple(await self.call(self.contract.functions.params(poolId).call))
+        return self.params[poolId]
+
+    async def open_pools(self, amount, exclude=()):
+        """The pools, not in exclude, with at least amount available that end at least a day from now."""
+        now = await self.now()
+        poolIds = [poolId for poolId in self.poolIds if poolId not in exclude]
+        params = await asyncio.gather(*(self.pool_params(poolId) for poolId in poolIds))
+        poolIds = [poolId for poolId, (_, endTime) in zip(poolIds, params) if now + 24 * 60 * 60 < endTime]
+        states = await asyncio.gather(*(self.call(self.contract.functions.pools(poolId).call) for poolId in poolIds))
+        return [poolId for poolId, state in zip(poolIds, states) if amount <= state[0]]
+
+    async def plan_createPool(self, rng):
+        if not self.lenders:
+            return None
+        lender = rng.choice(self.lenders)
+        params = (rng.choice([5, 10, 15, 20]), await self.now() + rng.randint(2, 52) * week)
+        return Operation('createPool', lender, (params, self.supply, 0, [ZERO_ADDRESS]))
+
+    async def plan_borrow(self, rng, node, items):
+        poolIds = await self.open_pools(self.amount)
+        if not poolIds:
+            return None
+        poolId = rng.choice(poolIds)
+        listed = any(itemPoolId == poolId for _, itemPoolId in items)
+        prev = 0 if listed else await self.call(self.hints.insert_hint, node, poolId)
+        return Operation('borrow', self.nodes[node], (poolId, node, prev, self.amount, []))
+
+    async def plan_repay(self, rng, node, items):
+        if not items:
+            return None
+        poolId = rng.choice(items)[1]
+        borrowed, interestDue, _ = await self.call(self.contract.functions.loans(poolId, node).call)
+        if rng.random() < 0.5:
+            # in full (_repayAmount 0 is the whole debt once charged), removing the pool from the list
+            prev = await self.call(self.hints.remove_hint, node, poolId)
+            return Operation('repay', self.nodes[node], (poolId, node, prev, 0, 0))
+        if borrowed < 2:
+            return None
+        return Operation('repay', self.nodes[node], (poolId, node, 0, 0, interestDue + borrowed // 2))
+
+    async def plan_transferDebt(self, rng, node, items):
+        if not items:
+            return None
+        fromPool = rng.choice(items)[1]
+        borrowed, _, _ = await self.call(self.contract.functions.loans(fromPool, node).call)
+        amount = borrowed // 2
+        # only part of the loan is moved (with _fromAvailable), so fromPool stays in the list
+        poolIds = await self.open_pools(amount, exclude=[fromPool])
+        if amount == 0 or not poolIds:
+            return None
+        toPool = rng.choice(poolIds)
+        listed = any(itemPoolId == toPool for _, itemPoolId in items)
+        prev = 0 if listed else await self.call(self.hints.insert_hint, node, toPool)
+        return Operation('transferDebt', self.nodes[node], (node, fromPool, 0, toPool, prev, 0, 0, amount, []))
+
+    async def plan_distributeRefund(self, rng, node, items):
+        if node not in self.distributors:
+            self.distributors[node] = await self.call(self.distributorFactory.functions.getProxyAddress(node).call)
+        return Operation('distributeRefund', self.nodes[node], (node, True, []),
+                         fund=(self.distributors[node], self.refund))
+
+    async def plan_withdraw(self, rng, node, items):
+        borrowed, interestDue, RPL, ETH, *_ = await self.call(self.contract.functions.borrowers(node).call)
+        stake = await self.call(self.rocketNodeStaking.functions.getNodeRPLStake(node).call)
+        if ETH == 0 or stake + RPL < borrowed + interestDue:
+            return None
+        if items and (await self.pool_params(items[0][1]))[1] <= await self.now():
+            return None
+        return Operation('withdraw', self.nodes[node], (node, 0, ETH))
+
+    async def plan(self, rng, function, node):
+        if function == 'createPool':
+            return await self.plan_createPool(rng)
+        items = await self.call(self.hints.items, node)
+        operation = await getattr(self, f'plan_{function}')(rng, node, items)
+        return operation and operation._replace(node=node, listLength=len(items))
+
+    async def execute(self, operation):
+        if operation.fund:
+            to, value = operation.fund
+            await self.send(operation.sender, params={'to': to, 'value': value})
+        function = self.contract.functions[operation.function](*operation.args)
+        receipt, seconds = await self.transact(operation.sender, function)
+        if operation.node:
+            self.hints.invalidate(operation.node)
+        if operation.function == 'createPool' and receipt['status']:
+            self.poolIds.extend(log['args']['id'] for log in
+                                self.contract.events.CreatePool().process_receipt(receipt, errors=DISCARD))
+        return Result(operation.function, receipt['gasUsed'], receipt['status'], seconds, operation.listLength)
+
+    async def next_operation(self, rng, attempts=16):
+        """Plan an operation of a random function (by mix weight) on a random free node. Holds the node."""
+        functions = list(self.mix)
+        weights = [self.mix[function] for function in functions]
+        for _ in range(attempts):
+            function = rng.choices(functions, weights)[0]
+            node = None
+            if function != 'createPool':
+                free = [node for node in self.nodes if node not in self.busy]
+                if not free:
+                    continue
+                node = rng.choice(free)
+                self.busy.add(node)
+            try:
+                operation = await self.plan(rng, function, node)
+            except Exception:
+                self.busy.discard(node)
+                raise
+            if operation:
+                return operation
+            self.busy.discard(node)
+        return None
+
+    async def worker(self, rng):
+        results = []
+        while 0 < self.remaining:
+            self.remaining -= 1
+            # in flight from planning, which holds the node, until the receipt
+            self.inFlight += 1
+            try:
+                operation = await self.next_operation(rng)
+                if operation is not None:
+                    try:
+                        results.append(await self.execute(operation))
+                    finally:
+                        self.busy.discard(operation.node)
+            finally:
+                self.inFlight -= 1
+            if operation is None:
+                self.remaining += 1
+                if self.inFlight == 0:
+                    self.log(f'stopping with {self.remaining} transactions left: none could be planned')
+                    self.remaining = 0
+                # otherwise wait for another worker's operation to land (e.g. all nodes were busy)
+                await asyncio.sleep(0.1)
+        return results
+
+    async def run(self, transactions):
+        """Send transactions measured transactions, concurrency at a time. Returns the report."""
+        self.remaining = transactions
+        start = time.monotonic()
+        workers = [self.worker(random.Random(self.rng.random())) for _ in range(self.concurrency)]
+        results = [result for results in await asyncio.gather(*workers) for result in results]
+        summary = report(results, time.monotonic() - start)
+        self.log(format_report(summary))
+        return summary
@@ -0,0 +1,154 @@
+import asyncio
+from typing import NamedTuple
+from eth_utils import to_checksum_address
+from client.chain import view_abi, Distribute, NotRewardsOnly, Refund
+
+# Planner for the _minipools arguments of distributeRefund and forceDistributeRefund.
+#
+# Each MinipoolArgument costs a getNodeMinipoolAt call and a distribute or refund
+# call, so the planner reads every minipool of a node concurrently (balance,
+# refund balance, status) and only includes those that would move ETH:
+# - a staking minipool with a balance beyond its refund balance is distributed,
+#   with NotRewardsOnly once that balance reaches 8 ETH (the minipool then
+#   refunds the node as well, as Rocket Lend is its owner);
+# - any other minipool with a refund balance is refunded.
+# NotRewardsOnly and Refund need the borrower (or, for forceDistributeRefund, the
+# lender) to call; with ownerActions=False those minipools are left out.
+#
+# The web3 calls are blocking; they are run in threads, at most concurrency at once.
+
+oneEther = 10 ** 18
+
+# the most a minipool can hold to be distributed with rewardsOnly
+rewardsOnlyLimit = 8 * oneEther
+
+# Rocket Pool's MinipoolStatus
+STATUS_STAKING = 2
+
+MAX_NODE_MINIPOOLS = 2048
+
+minipoolABI = [
+    view_abi('getNodeMinipoolCount', ['address'], ['uint256']),
+    view_abi('getNodeMinipoolAt', ['address', 'uint256'], ['address']),
+    view_abi('getStatus', [], ['uint8']),
+    view_abi('getFinalised', [], ['bool']),
+    view_abi('getNodeRefundBalance', [], ['uint256']),
+    view_abi('getProxyAddress', ['address'], ['address']),
+    view_abi('getNodeShare', [], ['uint256']),
+]
+
+class Minipool(NamedTuple):
+    index: int
+    address: str
+    balance: int
+    refundBalance: int
+    status: int
+    finalised: bool
+
+    @property
+    def distributable(self):
+        return self.balance - self.refundBalance
+
+    def moved(self, action):
+        """The ETH that leaves the minipool (for the node or rETH) when action is taken."""
+        return self.balance if action & (1 << Distribute) else self.refundBalance if action else 0
+
+    def action(self, ownerActions=True):
+        """The MinipoolAction flags that move this minipool's ETH (0 for none)."""
+        if self.status == STATUS_STAKING and not self.finalised and 0 < self.distributable:
+            if self.distributable < rewardsOnlyLimit:
+                return 1 << Distribute
+            if ownerActions:
+                return (1 << Distribute) | (1 << NotRewardsOnly)
+            return 0
+        if ownerActions and 0 < self.refundBalance:
+            return 1 << Refund
+        return 0
+
+class Plan(NamedTuple):
+    node: str
+    distribute: bool # whether to distribute the node's fee distributor
+    minipools: list # MinipoolArguments, as [index, action] pairs
+    nodeShare: int # ETH the fee distributor would credit to the node
+    ETH: int # ETH held by the planned minipools (distributed between node and rETH, or refunded)
+
+    @property
+    def needsOwner(self):
+        return any(action & ~(1 << Distribute) for _, action in self.minipools)
+
+    def batches(self, size=MAX_NODE_MINIPOOLS):
+        """The minipool arguments split into lists of at most size, the fee distributor in the first."""
+        for i in range(0, max(1, len(self.minipools)), size):
+            yield self.distribute and i == 0, self.minipools[i:i + size]
+
+class MinipoolPlanner:
+    def __init__(self, w3, rocketlend, abi, concurrency=8):
+        self.w3 = w3
+        self.contract = w3.eth.contract(address=to_checksum_address(str(getattr(rocketlend, 'address', rocketlend))),
+                                        abi=abi)
+        self.concurrency = concurrency
+        self.semaphores = {}
+        self.manager = self.rocket_pool('rocketMinipoolManager')
+        self.factory = self.rocket_pool('rocketNodeDistributorFactory')
+
+    def rocket_pool(self, name):
+        return self.w3.eth.contract(address=self.contract.functions[name]().call(), abi=minipoolABI)
+
+    async def call(self, fn, *args, **kwargs):
+        # a Semaphore belongs to the event loop it is first used in, and each asyncio.run has its own
+        semaphore = self.semaphores.setdefault(asyncio.get_running_loop(), asyncio.Semaphore(self.concurrency))
+        async with semaphore:
+            return await asyncio.to_thread(fn, *args, **kwargs)
+
+    async def minipool(self, index, address):
+        contract = self.w3.eth.contract(address=address, abi=minipoolABI)
+        balance, refundBalance, status, finalised = await asyncio.gather(
+            self.call(self.w3.eth.get_balance, address),
+            self.call(contract.functions.getNodeRefundBalance().call),
+            self.call(contract.functions.getStatus().call),
+            self.call(contract.functions.getFinalised().call))
+        return Minipool(index, address, balance, refundBalance, status, finalised)
+
+    async def scan(self, node):
+        """Every minipool of node, in index order."""
+        node = to_checksum_address(str(node))
+        count = await self.call(self.manager.functions.getNodeMinipoolCount(node).call)
+        addresses = await asyncio.gather(*(self.call(self.manager.functions.getNodeMinipoolAt(node, index).call)
+                                           for index in range(count)))
+        return list(await asyncio.gather(*(self.minipool(index, address) for index, address in enumerate(addresses))))
+
+    async def node_share(self, node):
+        distributor = self.w3.eth.contract(address=await self.call(self.factory.functions.getProxyAddress(node).call),
+                                           abi=minipoolABI)
+        return await self.call(distributor.functions.getNodeShare().call)
+
+    async def plan(self, node, ownerActions=True):
+        node = to_checksum_address(str(node))
+        minipools, nodeShare = await asyncio.gather(self.scan(node), self.node_share(node))
+        arguments, ETH = [], 0
+        for minipool in minipools:
+            action = minipool.action(ownerActions)
+            if action:
+                arguments.append([minipool.index, action])
+                ETH += minipool.moved(action)
+        return Plan(node, 0 < nodeShare, arguments, nodeShare, ETH)
+
+    async def estimate_gas(self, plan, sender=None, poolId=None, prevIndex=0):
+        """Gas for each batch of plan, as distributeRefund (or forceDistributeRefund if poolId is given).
+
+        sender defaults to the node's borrower address for distributeRefund and
+        the pool's lender for forceDistributeRefund.
+        """
+        functions = self.contract.functions
+        if sender is None:
+            if poolId is None:
+                sender = (await self.call(functions.borrowers(plan.node).call))[5]
+            else:
+                sender = (await self.call(functions.pools(poolId).call))[4]
+        if poolId is None:
+            calls = [functions.distributeRefund(plan.node, distribute, minipools)
+                     for distribute, minipools in plan.batches()]
+        else:
+            calls = [functions.forceDistributeRefund(poolId, plan.node, prevIndex, distribute, minipools)
+                     for distribute, minipools in plan.batches()]
+        return list(await asyncio.gather(*(self.call(call.estimate_gas, {'from': sender}) for call in calls)))
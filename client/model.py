@@ -0,0 +1,1112 @@
+import functools
+from typing import NamedTuple
+from eth_utils import to_checksum_address
+from client.allowlist import verify
+from client.chain import view_abi, ContractLogicError, TransactionFailed
+from client.interest import outstanding_interest
+
+# Reference model of rocketlend.vy's accounting, in plain Python, for simulating
+# many pools and nodes over long periods without an EVM.
+#
+# Model holds the same state as the contract (pools, loans, borrowers, each
+# node's debtPools list and each pool's poolNodes) in unpacked __slots__ records,
+# and its transactions follow the contract's functions statement by statement:
+# the same order of checks (so the same revert reasons), the same 128-bit
+# overflow checks, and the same integer arithmetic. A transaction that reverts
+# raises Revert and leaves the model as it was.
+#
+# Rocket Pool is reduced to what Rocket Lend reads of it: each node's RPL stake
+# (with the stand-ins' withdrawal rules: a cooldown after the last stake, and no
+# more than is staked), its ETH provided (including its deposit balance), and the
+# RPL price. Token transfers from senders are assumed to succeed; the RPL the
+# contract itself holds is tracked, as staking needs it. Rewards claims and
+# minipool distributions are reduced to credit, which adds to a node's balances.
+#
+# Addresses are compared as given, so use one form throughout (e.g. checksummed).
+#
+# Differential replays operations (e.g. from random_operations) on a model and on
+# a deployed contract, and checks that they revert alike and leave the same state.
+
+oneEther = 10 ** 18
+
+MAX_ADDRESS_BATCH = 2048
+MAX_POSITION_LOANS = 64
+MAX_BORROW_BATCH = 32
+MAX_FORCE_BATCH = 128
+MAX_INTEREST_BATCH = 256
+BORROW_LIMIT_PERCENT = 50
+
+lowMask = (1 << 128) - 1
+maxUint256 = (1 << 256) - 1
+addressMask = (1 << 160) - 1
+allowedBit = 1 << 160
+
+ZERO_ADDRESS = '0x' + '00' * 20
+ZERO_ROOT = bytes(32)
+
+# the stand-in RocketNodeStaking's cooldown on withdrawing RPL after staking
+WITHDRAWAL_COOLDOWN = 28 * 24 * 60 * 60
+
+class Revert(Exception):
+    """A transaction the contract would revert, with its reason (None where the contract gives none of its own)."""
+
+    def __init__(self, reason=None):
+        super().__init__(reason)
+        self.reason = reason
+
+def uint128(value):
+    # the contract's _add and _sub revert if a half of a packed word over- or underflows
+    if not 0 <= value <= lowMask:
+        raise Revert('ov')
+    return value
+
+def address_of(arg):
+    return to_checksum_address('0x%040x' % (arg & addressMask))
+
+# Records
+
+class Record:
+    __slots__ = ()
+
+    def values(self):
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def restore(self, values):
+        for name, value in zip(self.__slots__, values):
+            setattr(self, name, value)
+
+    def __repr__(self):
+        return f'{type(self).__name__}({", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)})'
+
+class Pool(Record):
+    __slots__ = ('lender', 'interestRate', 'endTime', 'available', 'borrowed', 'allowance', 'reclaimed',
+                 'interest', 'interestTime', 'pendingLender', 'nodeCount', 'allowedToBorrowRoot')
+
+    def __init__(self):
+        self.lender = ZERO_ADDRESS
+        self.interestRate = self.endTime = 0
+        self.available = self.borrowed = self.allowance = self.reclaimed = 0
+        self.interest = self.interestTime = 0 # accrued as of interestTime (see _accountPoolInterest)
+        self.pendingLender = ZERO_ADDRESS
+        self.nodeCount = 0 # poolNodeCount
+        self.allowedToBorrowRoot = ZERO_ROOT
+
+class Loan(Record):
+    __slots__ = ('borrowed', 'interestDue', 'accountedUntil', 'nodeIndex')
+
+    def __init__(self):
+        self.borrowed = self.interestDue = self.accountedUntil = 0
+        self.nodeIndex = 0 # index in poolNodes
+
+class Borrower(Record):
+    __slots__ = ('borrowed', 'interestDue', 'RPL', 'ETH', 'index', 'address', 'pending')
+
+    def __init__(self):
+        self.borrowed = self.interestDue = self.RPL = self.ETH = self.index = 0
+        self.address = self.pending = ZERO_ADDRESS
+
+class PoolItem(Record):
+    __slots__ = ('next', 'poolId')
+
+    def __init__(self):
+        self.next = self.poolId = 0
+
+class Node(Record):
+    # Rocket Pool's state for a registered node
+    __slots__ = ('staked', 'stakedTime', 'ETHProvided')
+
+    def __init__(self):
+        self.staked = self.stakedTime = self.ETHProvided = 0
+
+# The contract's view structs (equal, as tuples, to what web3 returns for them)
+
+class PoolParams(NamedTuple):
+    interestRate: int
+    endTime: int
+
+class PoolState(NamedTuple):
+    available: int
+    borrowed: int
+    allowance: int
+    reclaimed: int
+    lenderAddress: str
+    pendingLenderAddress: str
+
+class LoanState(NamedTuple):
+    borrowed: int
+    interestDue: int
+    accountedUntil: int
+
+class BorrowerState(NamedTuple):
+    borrowed: int
+    interestDue: int
+    RPL: int
+    ETH: int
+    index: int
+    address: str
+    pending: str
+
+class Operation(NamedTuple):
+    name: str # a transaction of Model (and function of the contract)
+    sender: str
+    args: tuple
+    time: int # block timestamp
+
+MISSING = object()
+
+def transaction(method):
+    @functools.wraps(method)
+    def wrapper(self, *args):
+        self._begin()
+        try:
+            result = method(self, *args)
+        except BaseException:
+            self._rollback()
+            raise
+        self._saved = None
+        return result
+    return wrapper
+
+class Model:
+    def __init__(self, time=0, price=oneEther // 100, rewardIndex=0, withdrawalCooldown=WITHDRAWAL_COOLDOWN):
+        self.time = time # block.timestamp
+        self.price = price # getRPLPrice (ETH per RPL)
+        self.rewardIndex = rewardIndex # getRewardIndex
+        self.withdrawalCooldown = withdrawalCooldown
+        self.nextPoolId = 0
+        self.RPL = 0 # RPL held by the contract
+        self.poolRecords = {}
+        self.loanRecords = {} # by (poolId, node)
+        self.borrowerRecords = {}
+        self.itemRecords = {} # debtPools, by (node, index)
+        self.nodeRecords = {} # registered nodes
+        self.poolNodes = {} # by (poolId, index)
+        self.allowedToBorrow = {} # by (poolId, node)
+        self._saved = None
+
+    # Journal: records are saved before their first change in a transaction, and restored if it reverts
+
+    def _begin(self):
+        self._saved = {}
+        self._added = []
+        self._puts = []
+        self._scalars = (self.nextPoolId, self.RPL)
+
+    def _rollback(self):
+        for record, values in self._saved.values():
+            record.restore(values)
+        for table, key in self._added:
+            del table[key]
+        for table, key, value in reversed(self._puts):
+            if value is MISSING:
+                table.pop(key, None)
+            else:
+                table[key] = value
+        self.nextPoolId, self.RPL = self._scalars
+        self._saved = None
+
+    def _record(self, table, key, cls):
+        record = table.get(key)
+        if record is None:
+            record = table[key] = cls()
+            if self._saved is not None:
+                self._added.append((table, key))
+        elif self._saved is not None and id(record) not in self._saved:
+            self._saved[id(record)] = (record, record.values())
+        return record
+
+    def _put(self, table, key, value):
+        if self._saved is not None:
+            self._puts.append((table, key, table.get(key, MISSING)))
+        table[key] = value
+
+    # records for reading (possibly not stored) and for writing
+
+    def _getPool(self, poolId):
+        return self.poolRecords.get(poolId) or Pool()
+
+    def _pool(self, poolId):
+        return self._record(self.poolRecords, poolId, Pool)
+
+    def _getLoan(self, poolId, node):
+        return self.loanRecords.get((poolId, node)) or Loan()
+
+    def _loan(self, poolId, node):
+        return self._record(self.loanRecords, (poolId, node), Loan)
+
+    def _getBorrower(self, node):
+        return self.borrowerRecords.get(node) or Borrower()
+
+    def _borrower(self, node):
+        return self._record(self.borrowerRecords, node, Borrower)
+
+    def _getItem(self, node, index):
+        return self.itemRecords.get((node, index)) or PoolItem()
+
+    def _item(self, node, index):
+        return self._record(self.itemRecords, (node, index), PoolItem)
+
+    def _node(self, node):
+        if node not in self.nodeRecords:
+            raise Revert()
+        return self._record(self.nodeRecords, node, Node)
+
+    def add_node(self, node, staked=0, stakedTime=0, ETHProvided=0):
+        """Register node with Rocket Pool."""
+        record = self.nodeRecords[node] = Node()
+        record.staked, record.stakedTime, record.ETHProvided = staked, stakedTime, ETHProvided
+        return record
+
+    def apply(self, operation):
+        """Run operation at its time."""
+        self.time = operation.time
+        return getattr(self, operation.name)(operation.sender, *operation.args)
+
+    # Views
+
+    def params(self, poolId):
+        pool = self._getPool(poolId)
+        return PoolParams(pool.interestRate, pool.endTime)
+
+    def pools(self, poolId):
+        pool = self._getPool(poolId)
+        return PoolState(pool.available, pool.borrowed, pool.allowance, pool.reclaimed,
+                         pool.lender, pool.pendingLender)
+
+    def loans(self, poolId, node):
+        loan = self._getLoan(poolId, node)
+        return LoanState(loan.borrowed, loan.interestDue, loan.accountedUntil)
+
+    def poolNodeCount(self, poolId):
+        return self._getPool(poolId).nodeCount
+
+    def borrowers(self, node):
+        borrower = self._getBorrower(node)
+        return BorrowerState(borrower.borrowed, borrower.interestDue, borrower.RPL, borrower.ETH,
+                             borrower.index, borrower.address, borrower.pending)
+
+    def debtPools(self, node, index):
+        item = self._getItem(node, index)
+        return item.next, item.poolId
+
+    def debt_pool_items(self, node):
+        """(index, poolId) for each item in node's debtPools list, in order."""
+        result = []
+        index = self._getItem(node, 0).next
+        while index != 0:
+            item = self._getItem(node, index)
+            result.append((index, item.poolId))
+            index = item.next
+        return result
+
+    def hint(self, node, poolId):
+        """_prevIndex for poolId, as DebtPoolHints.hint: for removing it if in node's list, otherwise for inserting it."""
+        prev = 0
+        items = self.debt_pool_items(node)
+        for index, itemPoolId in items:
+            if itemPoolId == poolId:
+                return prev
+            prev = index
+        endTime = self._getPool(poolId).endTime
+        prev = 0
+        for index, itemPoolId in items:
+            if endTime < self._getPool(itemPoolId).endTime:
+                break
+            prev = index
+        return prev
+
+    def accruedInterest(self, poolId, node):
+        """The interest _chargeInterest would add to the loan now."""
+        return self._accruedInterest(poolId, node)
+
+    def poolInterest(self, poolId):
+        return self._poolInterest(poolId)
+
+    def borrowLimit(self, node):
+        return self._borrowLimit(node)
+
+    def debt(self, node):
+        borrower = self._getBorrower(node)
+        return borrower.borrowed + borrower.interestDue
+
+    # Internals
+
+    def _checkSender(self, sender, expected):
+        if sender != expected:
+            raise Revert('a')
+
+    def _checkFromLender(self, sender, poolId):
+        self._checkSender(sender, self._getPool(poolId).lender)
+
+    def _checkFromBorrower(self, sender, node):
+        self._checkSender(sender, self._getBorrower(node).address)
+
+    def _receiveRPL(self, amount):
+        self.RPL += amount
+
+    def _sendRPL(self, amount):
+        self.RPL -= amount
+
+    def _stakeRPLFor(self, node, amount):
+        record = self._node(node)
+        if self.RPL < amount:
+            raise Revert()
+        self.RPL -= amount
+        record.staked += amount
+        record.stakedTime = self.time
+
+    def _withdrawRPL(self, node, amount):
+        # the RPL withdrawal address (Rocket Lend, while the node has joined) must call
+        record = self._node(node)
+        if (self._getBorrower(node).address == ZERO_ADDRESS or
+                self.time - record.stakedTime < self.withdrawalCooldown or
+                record.staked < amount):
+            raise Revert()
+        record.staked -= amount
+        self.RPL += amount
+
+    def _loanEmpty(self, poolId, node):
+        loan = self._getLoan(poolId, node)
+        return loan.borrowed == 0 and loan.interestDue == 0
+
+    def _insertDebtPool(self, node, poolId, prev):
+        head = self._item(node, 0)
+        newIndex = head.poolId + 1
+        head.poolId = newIndex
+        self._item(node, newIndex).poolId = poolId
+        endTime = self._getPool(poolId).endTime
+        if prev != 0 and not self._getPool(self._getItem(node, prev).poolId).endTime <= endTime:
+            raise Revert('p')
+        nextIndex = self._getItem(node, prev).next
+        if nextIndex != 0 and not endTime <= self._getPool(self._getItem(node, nextIndex).poolId).endTime:
+            raise Revert('n')
+        self._item(node, newIndex).next = nextIndex
+        self._item(node, prev).next = newIndex
+        pool = self._pool(poolId)
+        count = pool.nodeCount
+        self._put(self.poolNodes, (poolId, count), node)
+        pool.nodeCount = count + 1
+        self._loan(poolId, node).nodeIndex = count
+
+    def _removeDebtPool(self, node, poolId, prev):
+        index = self._getItem(node, prev).next
+        if self._getItem(node, index).poolId != poolId:
+            raise Revert('i')
+        nextIndex = self._getItem(node, index).next
+        self._item(node, prev).next = nextIndex
+        self._item(node, index).next = index
+        pool = self._pool(poolId)
+        last = pool.nodeCount - 1
+        if last < 0:
+            raise Revert()
+        nodeIndex = self._getLoan(poolId, node).nodeIndex
+        lastNode = self.poolNodes.get((poolId, last), ZERO_ADDRESS)
+        self._put(self.poolNodes, (poolId, nodeIndex), lastNode)
+        self._loan(poolId, lastNode).nodeIndex = nodeIndex
+        self._put(self.poolNodes, (poolId, last), ZERO_ADDRESS)
+        pool.nodeCount = last
+
+    def _outstandingInterest(self, borrowed, rate, startTime, endTime):
+        if endTime < startTime:
+            raise Revert()
+        return outstanding_interest(borrowed, rate, startTime, endTime)
+
+    def _interestSince(self, borrowed, pool, startTime):
+        doubleFrom = min(max(startTime, pool.endTime), self.time)
+        amount = self._outstandingInterest(borrowed, pool.interestRate, startTime, doubleFrom)
+        if pool.endTime <= self.time:
+            if 255 < 2 * pool.interestRate:
+                raise Revert()
+            amount += self._outstandingInterest(borrowed, 2 * pool.interestRate, doubleFrom, self.time)
+        return amount
+
+    def _accruedInterest(self, poolId, node):
+        loan = self._getLoan(poolId, node)
+        return self._interestSince(loan.borrowed, self._getPool(poolId), loan.accountedUntil)
+
+    def _poolInterest(self, poolId):
+        pool = self._getPool(poolId)
+        return pool.interest + self._interestSince(pool.borrowed, pool, pool.interestTime)
+
+    def _accountPoolInterest(self, poolId, movedIn, removed):
+        accrued = self._poolInterest(poolId) + movedIn
+        pool = self._pool(poolId)
+        pool.interest, pool.interestTime = uint128(accrued - min(accrued, removed)), self.time
+
+    def _chargeInterest(self, poolId, node):
+        amount = self._accruedInterest(poolId, node)
+        if 0 < amount:
+            self._addDebt(poolId, node, 0, amount)
+        self._loan(poolId, node).accountedUntil = self.time
+
+    def _addDebt(self, poolId, node, borrowed, interest):
+        loan = self._loan(poolId, node)
+        loan.borrowed, loan.interestDue = uint128(loan.borrowed + borrowed), uint128(loan.interestDue + interest)
+        borrower = self._borrower(node)
+        borrower.borrowed = uint128(borrower.borrowed + borrowed)
+        borrower.interestDue = uint128(borrower.interestDue + interest)
+
+    def _subDebt(self, poolId, node, borrowed, interest):
+        self._addDebt(poolId, node, -borrowed, -interest)
+
+    def _allowed(self, poolId, node, proof):
+        if self.allowedToBorrow.get((poolId, ZERO_ADDRESS)) or self.allowedToBorrow.get((poolId, node)):
+            return True
+        root = self._getPool(poolId).allowedToBorrowRoot
+        return root != ZERO_ROOT and verify(root, node, [bytes(sibling) for sibling in proof])
+
+    def _lend(self, poolId, node, amount, proof):
+        if 0 < amount:
+            if not self._allowed(poolId, node, proof):
+                raise Revert('r')
+            self._accountPoolInterest(poolId, 0, 0)
+            self._addDebt(poolId, node, amount, 0)
+            pool = self._pool(poolId)
+            pool.available = uint128(pool.available - amount)
+            pool.borrowed = uint128(pool.borrowed + amount)
+
+    def _repayInterest(self, poolId, node, amount):
+        if 0 < amount:
+            self._accountPoolInterest(poolId, 0, amount)
+            self._subDebt(poolId, node, 0, amount)
+            pool = self._pool(poolId)
+            pool.available = uint128(pool.available + amount)
+        return amount
+
+    def _repay(self, poolId, node, amount):
+        if 0 < amount:
+            self._accountPoolInterest(poolId, 0, 0)
+            self._subDebt(poolId, node, amount, 0)
+            pool = self._pool(poolId)
+            pool.available = uint128(pool.available + amount)
+            pool.borrowed = uint128(pool.borrowed - amount)
+        return amount
+
+    def _payDebt(self, poolId, node, prev, amount):
+        interestDue = self._getLoan(poolId, node).interestDue
+        if amount <= interestDue:
+            amount -= self._repayInterest(poolId, node, amount)
+        else:
+            amount -= self._repayInterest(poolId, node, interestDue)
+            amount -= self._repay(poolId, node, min(amount, self._getLoan(poolId, node).borrowed))
+        if self._loanEmpty(poolId, node):
+            self._removeDebtPool(node, poolId, prev)
+        return amount
+
+    def _availableEther(self, node):
+        record = self.nodeRecords.get(node) or Node()
+        return record.ETHProvided + self._getBorrower(node).ETH
+
+    def _availableRPL(self, node):
+        record = self.nodeRecords.get(node) or Node()
+        return record.staked + self._getBorrower(node).RPL
+
+    def _borrowLimit(self, node):
+        if self.price == 0:
+            raise Revert()
+        return self._availableEther(node) * oneEther * BORROW_LIMIT_PERCENT // 100 // self.price
+
+    def _chargeAndCheckEndedOwing(self, poolId, node):
+        if not self._getPool(poolId).endTime < self.time:
+            raise Revert('tm')
+        self._chargeInterest(poolId, node)
+        if self._loanEmpty(poolId, node):
+            raise Revert('pa')
+
+    def _repayWithRPL(self, poolId, node, prev, unstakeAmount):
+        if 0 < unstakeAmount:
+            self._withdrawRPL(node, unstakeAmount)
+        startAmountRPL = self._getBorrower(node).RPL + unstakeAmount
+        if 0 < unstakeAmount:
+            loan = self._getLoan(poolId, node)
+            if not startAmountRPL <= loan.interestDue + loan.borrowed:
+                raise Revert('wd')
+        available = self._payDebt(poolId, node, prev, startAmountRPL)
+        self._borrower(node).RPL = uint128(available)
+        return startAmountRPL - available
+
+    def _repayWithETH(self, poolId, node, prev, ethPerRpl):
+        if ethPerRpl == 0:
+            raise Revert()
+        startAmountETH = self._getBorrower(node).ETH
+        amountETH = self._payDebt(poolId, node, prev, startAmountETH * oneEther // ethPerRpl) * ethPerRpl // oneEther
+        reclaimedETH = startAmountETH - amountETH
+        if reclaimedETH < 0:
+            raise Revert()
+        borrower = self._borrower(node)
+        borrower.ETH = uint128(borrower.ETH - reclaimedETH)
+        pool = self._pool(poolId)
+        pool.reclaimed = uint128(pool.reclaimed + reclaimedETH)
+        return reclaimedETH
+
+    def _borrow(self, poolId, node, prev, amount, proof):
+        if not self.time < self._getPool(poolId).endTime:
+            raise Revert('e')
+        if self._loanEmpty(poolId, node):
+            self._insertDebtPool(node, poolId, prev)
+        self._chargeInterest(poolId, node)
+        self._lend(poolId, node, amount, proof)
+        if self._loanEmpty(poolId, node):
+            raise Revert('no')
+
+    # Lender transactions
+
+    @transaction
+    def createPool(self, sender, params, supply, allowance, borrowers):
+        interestRate, endTime = params
+        if not (0 <= interestRate < 256 and 0 <= endTime < 1 << 64 and len(borrowers) <= MAX_ADDRESS_BATCH):
+            raise Revert()
+        poolId = self.nextPoolId
+        self.nextPoolId = poolId + 1
+        pool = self._pool(poolId)
+        pool.lender, pool.endTime, pool.interestRate = sender, endTime, interestRate
+        if 0 < supply:
+            self._receiveRPL(supply)
+            pool.available = uint128(supply)
+        if 0 < allowance:
+            pool.allowance = min(allowance, lowMask)
+        for node in borrowers:
+            self._put(self.allowedToBorrow, (poolId, node), True)
+        return poolId
+
+    @transaction
+    def transferPool(self, sender, poolId, newAddress, confirm):
+        self._checkFromLender(sender, poolId)
+        pool = self._pool(poolId)
+        if confirm:
+            pool.pendingLender, pool.lender = ZERO_ADDRESS, newAddress
+        else:
+            pool.pendingLender = newAddress
+
+    @transaction
+    def confirmTransferPool(self, sender, poolId):
+        self._checkSender(sender, self._getPool(poolId).pendingLender)
+        pool = self._pool(poolId)
+        pool.pendingLender, pool.lender = ZERO_ADDRESS, sender
+
+    @transaction
+    def changePoolRPL(self, sender, poolId, targetSupply):
+        currentSupply = self._getPool(poolId).available
+        if currentSupply != targetSupply:
+            if targetSupply < currentSupply:
+                self._checkFromLender(sender, poolId)
+                self._sendRPL(currentSupply - targetSupply)
+            else:
+                self._receiveRPL(targetSupply - currentSupply)
+            self._pool(poolId).available = uint128(targetSupply)
+
+    @transaction
+    def withdrawEtherFromPool(self, sender, poolId, amount):
+        self._checkFromLender(sender, poolId)
+        pool = self._pool(poolId)
+        pool.reclaimed = uint128(pool.reclaimed - amount)
+
+    @transaction
+    def changeAllowedToBorrow(self, sender, poolId, borrowers):
+        self._checkFromLender(sender, poolId)
+        for arg in borrowers:
+            self._put(self.allowedToBorrow, (poolId, address_of(arg)), bool(arg & allowedBit))
+
+    @transaction
+    def setAllowedToBorrowRoot(self, sender, poolId, root):
+        self._checkFromLender(sender, poolId)
+        self._pool(poolId).allowedToBorrowRoot = bytes(root)
+
+    @transaction
+    def setAllowance(self, sender, poolId, allowance):
+        self._checkFromLender(sender, poolId)
+        self._pool(poolId).allowance = min(allowance, lowMask)
+
+    @transaction
+    def updateInterestDue(self, sender, poolId, node):
+        self._chargeInterest(poolId, node)
+
+    @transaction
+    def updateInterestDueMany(self, sender, loans):
+        if MAX_INTEREST_BATCH < len(loans):
+            raise Revert()
+        for poolId, node in loans:
+            if self._loan(poolId, node).accountedUntil != self.time:
+                self._chargeInterest(poolId, node)
+
+    @transaction
+    def forceRepayRPL(self, sender, poolId, node, prevIndex, unstakeAmount):
+        self._chargeAndCheckEndedOwing(poolId, node)
+        if not 0 < self._repayWithRPL(poolId, node, prevIndex, unstakeAmount):
+            raise Revert('no')
+
+    @transaction
+    def forceRepayETH(self, sender, poolId, node, prevIndex):
+        self._checkFromLender(sender, poolId)
+        self._chargeAndCheckEndedOwing(poolId, node)
+        if not 0 < self._repayWithETH(poolId, node, prevIndex, self.price):
+            raise Revert('no')
+
+    def _skipForce(self, poolId, node, prev):
+        index = self._getItem(node, prev).next
+        return (self._loanEmpty(poolId, node) or index == 0 or index == prev or
+                self._getItem(node, index).poolId != poolId)
+
+    @transaction
+    def forceRepayRPLMany(self, sender, poolId, args):
+        if MAX_FORCE_BATCH < len(args):
+            raise Revert()
+        if not self._getPool(poolId).endTime < self.time:
+            raise Revert('tm')
+        for node, prevIndex, unstakeAmount in args:
+            if self._skipForce(poolId, node, prevIndex):
+                continue
+            self._chargeInterest(poolId, node)
+            loan = self._getLoan(poolId, node)
+            owed = loan.interestDue + loan.borrowed
+            unstake = min(unstakeAmount, owed - min(owed, self._getBorrower(node).RPL))
+            if 0 < unstake:
+                unstake = min(unstake, (self.nodeRecords.get(node) or Node()).staked)
+            self._repayWithRPL(poolId, node, prevIndex, unstake)
+
+    @transaction
+    def forceRepayETHMany(self, sender, poolId, args):
+        if MAX_FORCE_BATCH < len(args):
+            raise Revert()
+        self._checkFromLender(sender, poolId)
+        if not self._getPool(poolId).endTime < self.time:
+            raise Revert('tm')
+        for node, prevIndex, _ in args:
+            if self._skipForce(poolId, node, prevIndex):
+                continue
+            self._chargeInterest(poolId, node)
+            self._repayWithETH(poolId, node, prevIndex, self.price)
+
+    # Borrower transactions
+
+    @transaction
+    def joinAsBorrower(self, sender, node):
+        # as for a node whose withdrawal address was set to Rocket Lend, so it is the borrower address
+        borrower = self._borrower(node)
+        if borrower.address != ZERO_ADDRESS:
+            raise Revert('j')
+        self._checkSender(sender, node)
+        self._node(node)
+        borrower.address = node
+        borrower.index = max(borrower.index, self.rewardIndex)
+
+    @transaction
+    def leaveAsBorrower(self, sender, node):
+        self._checkFromBorrower(sender, node)
+        borrower = self._borrower(node)
+        if borrower.borrowed != 0:
+            raise Revert('bo')
+        if borrower.interestDue != 0:
+            raise Revert('i')
+        borrower.address = borrower.pending = ZERO_ADDRESS
+
+    @transaction
+    def changeBorrowerAddress(self, sender, node, newAddress, confirm):
+        self._checkFromBorrower(sender, node)
+        if newAddress == ZERO_ADDRESS:
+            raise Revert('nu')
+        borrower = self._borrower(node)
+        if confirm:
+            borrower.pending, borrower.address = ZERO_ADDRESS, newAddress
+        else:
+            borrower.pending = newAddress
+
+    @transaction
+    def confirmChangeBorrowerAddress(self, sender, node):
+        self._checkSender(sender, self._getBorrower(node).pending)
+        borrower = self._borrower(node)
+        borrower.pending, borrower.address = ZERO_ADDRESS, sender
+
+    @transaction
+    def unstakeRPL(self, sender, node, amount):
+        self._checkFromBorrower(sender, node)
+        self._withdrawRPL(node, amount)
+        borrower = self._borrower(node)
+        borrower.RPL = uint128(borrower.RPL + amount)
+
+    @transaction
+    def borrow(self, sender, poolId, node, prevIndex, amount, proof=()):
+        self._checkFromBorrower(sender, node)
+        self._stakeRPLFor(node, amount)
+        self._borrow(poolId, node, prevIndex, amount, proof)
+        if not self.debt(node) <= self._borrowLimit(node):
+            raise Revert('bl')
+
+    @transaction
+    def borrowMany(self, sender, node, loans):
+        if MAX_BORROW_BATCH < len(loans):
+            raise Revert()
+        self._checkFromBorrower(sender, node)
+        total = 0
+        for poolId, prevIndex, amount, proof in loans:
+            self._borrow(poolId, node, prevIndex, amount, proof)
+            total += amount
+        self._stakeRPLFor(node, total)
+        if not self.debt(node) <= self._borrowLimit(node):
+            raise Revert('bl')
+
+    def _obtain(self, node, isBorrower, unstakeAmount, target):
+        # take target from the borrower's balance (if isBorrower), then from the sender
+        obtained = 0
+        if isBorrower:
+            borrower = self._borrower(node)
+            balance = uint128(borrower.RPL + unstakeAmount)
+            obtained = min(target, balance)
+            borrower.RPL = balance - obtained
+        if obtained < target:
+            self._receiveRPL(target - obtained)
+
+    @transaction
+    def repay(self, sender, poolId, node, prevIndex, unstakeAmount, repayAmount):
+        isBorrower = sender == self._getBorrower(node).address
+        if not (unstakeAmount == 0 or isBorrower):
+            raise Revert('a')
+        self._chargeInterest(poolId, node)
+        if 0 < unstakeAmount:
+            self._withdrawRPL(node, unstakeAmount)
+        target = repayAmount
+        if target == 0:
+            loan = self._getLoan(poolId, node)
+            target = loan.interestDue + loan.borrowed
+        self._obtain(node, isBorrower, unstakeAmount, target)
+        if self._payDebt(poolId, node, prevIndex, target) != 0:
+            raise Revert('o')
+
+    @transaction
+    def repayInOrder(self, sender, node, unstakeAmount, repayAmount):
+        isBorrower = sender == self._getBorrower(node).address
+        if not (unstakeAmount == 0 or isBorrower):
+            raise Revert('a')
+        if 0 < unstakeAmount:
+            self._withdrawRPL(node, unstakeAmount)
+        target = repayAmount or maxUint256
+        amount = target
+        prevIndex = 0
+        index = self._getItem(node, 0).next
+        for _ in range(MAX_POSITION_LOANS):
+            if index == 0 or amount == 0:
+                break
+            item = self._getItem(node, index)
+            poolId, nextIndex = item.poolId, item.next
+            self._chargeInterest(poolId, node)
+            amount = self._payDebt(poolId, node, prevIndex, amount)
+            if not self._loanEmpty(poolId, node):
+                prevIndex = index
+            index = nextIndex
+        self._obtain(node, isBorrower, unstakeAmount, target - amount)
+
+    @transaction
+    def transferDebt(self, sender, node, fromPool, fromPrevIndex, toPool, toPrevIndex,
+                     fromInterest, fromBorrowed, fromAvailable, toProof=()):
+        source, target = self._getPool(fromPool), self._getPool(toPool)
+        if sender != self._getBorrower(node).address:
+            # not from borrower allowed only if:
+            # from lender, after end time, to a pool of no greater interest rate
+            if not (sender == source.lender and
+                    source.endTime < self.time and
+                    target.interestRate <= source.interestRate):
+                raise Revert('a')
+        self._chargeInterest(fromPool, node)
+        if not self.time < target.endTime:
+            raise Revert('e')
+        if self._loanEmpty(toPool, node) and (0 < fromInterest or 0 < fromBorrowed or 0 < fromAvailable):
+            self._insertDebtPool(node, toPool, toPrevIndex)
+        if 0 < fromInterest or 0 < fromBorrowed:
+            if source.lender != target.lender:
+                raise Revert('l')
+            self._accountPoolInterest(fromPool, 0, fromInterest)
+            self._accountPoolInterest(toPool, fromInterest, 0)
+            pool = self._pool(toPool)
+            pool.allowance = uint128(pool.allowance - (fromInterest + fromBorrowed))
+            loan = self._loan(fromPool, node)
+            loan.borrowed, loan.interestDue = uint128(loan.borrowed - fromBorrowed), uint128(loan.interestDue - fromInterest)
+            loan = self._loan(toPool, node)
+            loan.borrowed, loan.interestDue = uint128(loan.borrowed + fromBorrowed), uint128(loan.interestDue + fromInterest)
+        if 0 < fromBorrowed:
+            pool = self._pool(fromPool)
+            pool.borrowed = uint128(pool.borrowed - fromBorrowed)
+            pool = self._pool(toPool)
+            pool.borrowed = uint128(pool.borrowed + fromBorrowed)
+        if 0 < fromAvailable:
+            self._lend(toPool, node, fromAvailable, toProof)
+            self._payDebt(fromPool, node, fromPrevIndex, fromAvailable)
+        elif self._loanEmpty(fromPool, node):
+            self._removeDebtPool(node, fromPool, fromPrevIndex)
+
+    @transaction
+    def credit(self, sender, node, amountRPL, amountETH):
+        """Add to node's balances, standing for what claimMerkleRewards or distributeRefund brings in."""
+        borrower = self._borrower(node)
+        borrower.RPL, borrower.ETH = uint128(borrower.RPL + amountRPL), uint128(borrower.ETH + amountETH)
+        self.RPL += amountRPL
+
+    @transaction
+    def withdraw(self, sender, node, amountRPL, amountETH):
+        self._checkFromBorrower(sender, node)
+        first = self._getItem(node, 0).next
+        if not (first == 0 or self.time < self._getPool(self._getItem(node, first).poolId).endTime):
+            raise Revert('f')
+        borrower = self._borrower(node)
+        if 0 < amountRPL:
+            borrower.RPL = uint128(borrower.RPL - amountRPL)
+            self._sendRPL(amountRPL)
+        if not self.debt(node) <= self._availableRPL(node):
+            raise Revert('d')
+        if 0 < amountETH:
+            borrower.ETH = uint128(borrower.ETH - amountETH)
+            if not self.debt(node) <= 2 * self._borrowLimit(node):
+                raise Revert('bl')
+
+    @transaction
+    def stakeRPLFor(self, sender, node, amount):
+        self._checkFromBorrower(sender, node)
+        borrower = self._borrower(node)
+        borrower.RPL = uint128(borrower.RPL - amount)
+        self._stakeRPLFor(node, amount)
+
+    @transaction
+    def depositETHFor(self, sender, node, amount):
+        self._checkFromBorrower(sender, node)
+        borrower = self._borrower(node)
+        borrower.ETH = uint128(borrower.ETH - amount)
+        self._node(node).ETHProvided += amount
+
+# Random operations
+
+def random_amount(rng, limit):
+    """Mostly within limit (all of it, some of it, or none), sometimes just over."""
+    choice = rng.random()
+    if choice < 0.1:
+        return 0
+    if choice < 0.3:
+        return limit
+    if choice < 0.9:
+        return rng.randrange(limit + 1)
+    return limit + 1 + rng.randrange(oneEther)
+
+def random_operations(model, rng, lenders, nodes, others, count, maxStep=3 * 24 * 60 * 60, maxPools=4):
+    """Operations chosen at random, each from the model's state after the ones before it have been applied.
+
+    nodes must have joined (with themselves as borrower address). Most operations
+    are meant to succeed, with correct _prevIndex hints and amounts within the
+    amounts available, but some are not, to exercise the contract's checks.
+    """
+    names = ['createPool', 'changePoolRPL', 'setAllowance', 'changeAllowedToBorrow', 'updateInterestDue',
+             'borrow', 'borrowMany', 'repay', 'repayInOrder', 'transferDebt', 'forceRepayRPL', 'forceRepayRPLMany',
+             'unstakeRPL', 'withdraw']
+    weights = [2, 2, 1, 1, 2, 8, 2, 5, 2, 4, 2, 1, 2, 1]
+    for _ in range(count):
+        time = model.time + 1 + rng.randrange(maxStep)
+        name = rng.choices(names, weights)[0]
+        active = [poolId for poolId in range(model.nextPoolId) if time < model._getPool(poolId).endTime]
+        if not active or (name == 'createPool' and len(active) < maxPools):
+            name = 'createPool'
+        elif name == 'createPool':
+            name = 'borrow'
+        poolId = rng.choice(active) if active and rng.random() < 0.8 else rng.randrange(max(1, model.nextPoolId))
+        node = rng.choice(nodes)
+        lender = model._getPool(poolId).lender
+        debtPools = [itemPoolId for _, itemPoolId in model.debt_pool_items(node)]
+        if debtPools and name in ('repay', 'transferDebt', 'forceRepayRPL') and rng.random() < 0.8:
+            poolId = rng.choice(debtPools)
+            lender = model._getPool(poolId).lender
+        hint = model.hint(node, poolId) if rng.random() < 0.9 else rng.randrange(len(debtPools) + 2)
+        loan = model.loans(poolId, node)
+        pool = model.pools(poolId)
+        borrower = model.borrowers(node)
+        staked = model.nodeRecords[node].staked
+        if name == 'createPool':
+            sender = rng.choice(lenders)
+            params = (rng.choice([0, 3, 10, 10, 50, 127, 200]), time + rng.randrange(1, 30 * 24 * 60 * 60))
+            borrowers = [ZERO_ADDRESS] if rng.random() < 0.7 else rng.sample(nodes, rng.randrange(len(nodes) + 1))
+            args = (params, rng.randrange(2000) * oneEther, rng.randrange(500) * oneEther * rng.randrange(2), borrowers)
+        elif name == 'changePoolRPL':
+            sender = lender if rng.random() < 0.8 else rng.choice(others)
+            args = (poolId, max(0, pool.available + rng.randrange(-500, 500) * oneEther))
+        elif name == 'setAllowance':
+            sender = lender if rng.random() < 0.9 else rng.choice(others)
+            args = (poolId, rng.randrange(1000) * oneEther)
+        elif name == 'changeAllowedToBorrow':
+            sender = lender if rng.random() < 0.9 else rng.choice(others)
+            args = (poolId, [int(address, 16) | (allowedBit if rng.random() < 0.7 else 0)
+                             for address in rng.sample([ZERO_ADDRESS] + nodes, 2)])
+        elif name == 'updateInterestDue':
+            sender = rng.choice(others)
+            args = (poolId, node)
+        elif name == 'borrow':
+            sender = node if rng.random() < 0.95 else rng.choice(others)
+            args = (poolId, node, hint, random_amount(rng, pool.available // 2), [])
+        elif name == 'borrowMany':
+            sender = node
+            # loans already in the list need no hint; a new one goes last, so its hint is for the list as it is
+            loans = [(itemPoolId, 0, random_amount(rng, model.pools(itemPoolId).available // 4), [])
+                     for itemPoolId in rng.sample(debtPools, min(len(debtPools), 2))]
+            if poolId not in debtPools:
+                loans.append((poolId, hint, random_amount(rng, pool.available // 4), []))
+            args = (node, loans)
+        elif name == 'repay':
+            sender = node if rng.random() < 0.7 else rng.choice(others)
+            unstake = random_amount(rng, staked // 4) if sender == node and rng.random() < 0.3 else 0
+            args = (poolId, node, hint, unstake, random_amount(rng, loan.borrowed + loan.interestDue))
+        elif name == 'repayInOrder':
+            sender = node if rng.random() < 0.7 else rng.choice(others)
+            args = (node, 0, random_amount(rng, borrower.borrowed + borrower.interestDue))
+        elif name == 'transferDebt':
+            sender = node if rng.random() < 0.6 else lender
+            toPool = rng.randrange(model.nextPoolId)
+            toHint = model.hint(node, toPool)
+            toLender = model._getPool(toPool).lender
+            interest = random_amount(rng, loan.interestDue) if toLender == lender and rng.random() < 0.5 else 0
+            borrowed = random_amount(rng, loan.borrowed) if toLender == lender and rng.random() < 0.5 else 0
+            rest = max(0, loan.borrowed + loan.interestDue - interest - borrowed)
+            available = random_amount(rng, rest) if rng.random() < 0.5 else 0
+            args = (node, poolId, hint, toPool, toHint, interest, borrowed, available, [])
+        elif name == 'forceRepayRPL':
+            sender = rng.choice(others + [lender])
+            args = (poolId, node, hint, random_amount(rng, staked // 4) if rng.random() < 0.3 else 0)
+        elif name == 'forceRepayRPLMany':
+            sender = rng.choice(others)
+            args = (poolId, [(other, model.hint(other, poolId), 0) for other in nodes])
+        elif name == 'unstakeRPL':
+            sender = node if rng.random() < 0.9 else rng.choice(others)
+            args = (node, random_amount(rng, staked // 4))
+        else:
+            sender = node
+            args = (node, random_amount(rng, borrower.RPL), 0)
+        yield Operation(name, sender, args, time)
+
+# Differential testing against a deployed contract
+
+class Divergence(AssertionError):
+    pass
+
+rocketPoolABI = [
+    view_abi('getRPLPrice', [], ['uint256']),
+    view_abi('getRewardIndex', [], ['uint256']),
+    view_abi('getNodeRPLStake', ['address'], ['uint256']),
+    view_abi('getNodeRPLStakedTime', ['address'], ['uint256']),
+    view_abi('getNodeETHProvided', ['address'], ['uint256']),
+    view_abi('getNodeEthBalance', ['address'], ['uint256']),
+    view_abi('balanceOf', ['address'], ['uint256']),
+]
+
+class Differential:
+    def __init__(self, w3, rocketlend, abi, send, nodes):
+        """Replays operations on a new Model and, with send, on a deployed contract with no pools yet.
+
+        send(operation) makes the transaction with block timestamp operation.time,
+        returning None if it succeeds and the revert message if it reverts.
+        The model starts from the chain's state for nodes (registered with
+        Rocket Pool) and the contract's RPL balance.
+        """
+        self.w3 = w3
+        self.contract = w3.eth.contract(address=to_checksum_address(str(getattr(rocketlend, 'address', rocketlend))),
+                                        abi=abi)
+        self.send = send
+        self.nodes = [to_checksum_address(str(node)) for node in nodes]
+        functions = self.contract.functions
+        assert functions.nextPoolId().call() == 0, 'the contract must have no pools'
+        staking = self.rocket_pool('rocketNodeStaking')
+        deposit = self.rocket_pool('rocketNodeDeposit')
+        self.model = Model(time=w3.eth.get_block('latest')['timestamp'],
+                           price=self.rocket_pool('rocketNetworkPrices').functions.getRPLPrice().call(),
+                           rewardIndex=self.rocket_pool('rocketRewardsPool').functions.getRewardIndex().call())
+        self.model.RPL = self.RPL()
+        for node in self.nodes:
+            self.model.add_node(node, staking.functions.getNodeRPLStake(node).call(),
+                                staking.functions.getNodeRPLStakedTime(node).call(),
+                                staking.functions.getNodeETHProvided(node).call() +
+                                deposit.functions.getNodeEthBalance(node).call())
+            record = self.model.borrowerRecords[node] = Borrower()
+            record.restore(BorrowerState(*functions.borrowers(node).call()))
+
+    def rocket_pool(self, name):
+        return self.w3.eth.contract(address=self.contract.functions[name]().call(), abi=rocketPoolABI)
+
+    def RPL(self):
+        token = self.w3.eth.contract(address=self.contract.functions.RPL().call(), abi=rocketPoolABI)
+        return token.functions.balanceOf(self.contract.address).call()
+
+    def model_state(self):
+        model = self.model
+        state = {('RPL',): model.RPL}
+        for poolId in range(model.nextPoolId):
+            state['params', poolId] = model.params(poolId)
+            state['pools', poolId] = model.pools(poolId)
+            try:
+                state['poolInterest', poolId] = model.poolInterest(poolId)
+            except Revert:
+                # e.g. doubling a rate over 127 after the end time: the contract's view reverts too
+                state['poolInterest', poolId] = Revert
+            state['poolNodes', poolId] = [model.poolNodes.get((poolId, i), ZERO_ADDRESS)
+                                          for i in range(model.poolNodeCount(poolId))]
+            for node in self.nodes:
+                state['loans', poolId, node] = model.loans(poolId, node)
+        for node in self.nodes:
+            state['borrowers', node] = model.borrowers(node)
+            state['stake', node] = model.nodeRecords[node].staked
+            state['debtPools', node] = [model.debtPools(node, index)
+                                        for index in range(model.debtPools(node, 0)[1] + 1)]
+        return state
+
+    def chain_state(self):
+        functions = self.contract.functions
+        staking = self.rocket_pool('rocketNodeStaking')
+        state = {('RPL',): self.RPL()}
+        for poolId in range(functions.nextPoolId().call()):
+            state['params', poolId] = functions.params(poolId).call()
+            state['pools', poolId] = functions.pools(poolId).call()
+            try:
+                state['poolInterest', poolId] = functions.poolInterest(poolId).call()
+            except (ContractLogicError, TransactionFailed):
+                state['poolInterest', poolId] = Revert
+            state['poolNodes', poolId] = [functions.poolNodes(poolId, i).call()
+                                          for i in range(functions.poolNodeCount(poolId).call())]
+            for node in self.nodes:
+                state['loans', poolId, node] = functions.loans(poolId, node).call()
+        for node in self.nodes:
+            state['borrowers', node] = functions.borrowers(node).call()
+            state['stake', node] = staking.functions.getNodeRPLStake(node).call()
+            state['debtPools', node] = [functions.debtPools(node, index).call()
+                                        for index in range(functions.debtPools(node, 0).call()[1] + 1)]
+        return state
+
+    def check(self, operation=None):
+        """Raise Divergence if any of the contract's state differs from the model's."""
+        model, chain = self.model_state(), self.chain_state()
+        differences = sorted((key for key in model.keys() | chain.keys()
+                              if tuple_of(model.get(key)) != tuple_of(chain.get(key))), key=str)
+        if differences:
+            raise Divergence(f'after {operation}: ' + '; '.join(
+                f'{key}: model {model.get(key)} != contract {chain.get(key)}' for key in differences))
+
+    def apply(self, operation):
+        """Run operation on the model and the contract, checking they agree on whether (and why) it reverts, and after.
+
+        Returns the model's Revert, or None if it succeeded.
+        """
+        try:
+            self.model.apply(operation)
+            expected = None
+        except Revert as e:
+            expected = e
+        message = self.send(operation)
+        if expected is None and message is not None:
+            raise Divergence(f'{operation}: contract reverted ({message}), model did not')
+        if expected is not None:
+            if message is None:
+                raise Divergence(f'{operation}: model reverted ({expected.reason}), contract did not')
+            if expected.reason is not None and message.removeprefix('revert: ') != expected.reason:
+                raise Divergence(f'{operation}: contract reverted with {message}, model with {expected.reason}')
+        self.check(operation)
+        return expected
+
+    def replay(self, operations):
+        """Apply each of operations in turn. Returns how many reverted."""
+        return sum(self.apply(operation) is not None for operation in operations)
+
+def tuple_of(value):
+    # structs (NamedTuples, or lists/tuples from web3) compared as nested tuples
+    if isinstance(value, (list, tuple)):
+        return tuple(tuple_of(item) for item in value)
+    return value
@@ -0,0 +1,156 @@
+import json
+import pathlib
+import sqlite3
+import threading
+from typing import NamedTuple
+from eth_utils import keccak, to_checksum_address
+from client.allowlist import verify_leaf
+from client.chain import view_abi
+
+# Arguments for claimMerkleRewards and forceClaimMerkleRewards from Rocket Pool's
+# per-interval rewards tree files (rp-rewards-<network>-<index>.json).
+#
+# The files are large and hold every node, so RewardsIndex parses each one once
+# into a SQLite database keyed by node and interval; a file is only parsed again
+# if its size or modification time changes. Only rewards on network 0 (mainnet)
+# are kept: those are the ones RocketMerkleDistributorMainnet pays. The index can
+# be read from other threads (the keeper builds claims in its worker threads),
+# one query at a time.
+
+MAX_CLAIM_INTERVALS = 128
+
+schema = '''
+create table if not exists files (
+  path text primary key,
+  size integer not null,
+  mtime integer not null,
+  interval integer not null
+);
+create table if not exists roots (
+  interval integer primary key,
+  root blob not null
+);
+create table if not exists rewards (
+  node text not null,
+  interval integer not null,
+  amountRPL text not null,
+  amountETH text not null,
+  proof blob not null,
+  primary key (node, interval)
+);
+'''
+
+class Reward(NamedTuple):
+    interval: int
+    amountRPL: int
+    amountETH: int
+    proof: list
+
+def leaf(node, network, amountRPL, amountETH):
+    """A rewards tree leaf: keccak256(abi.encodePacked(node, network, amountRPL, amountETH))."""
+    return keccak(bytes.fromhex(to_checksum_address(str(node))[2:]) + network.to_bytes(32, 'big') +
+                  amountRPL.to_bytes(32, 'big') + amountETH.to_bytes(32, 'big'))
+
+def node_rewards(rewards):
+    """(amountRPL, amountETH) from a nodeRewards entry of a rewards file."""
+    return (int(rewards.get('collateralRpl', 0)) + int(rewards.get('oracleDaoRpl', 0)),
+            int(rewards.get('smoothingPoolEth', 0)))
+
+class RewardsIndex:
+    def __init__(self, path):
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.executescript(schema)
+        self.lock = threading.Lock()
+
+    def close(self):
+        self.db.close()
+
+    def update(self, directory, pattern='rp-rewards-*.json'):
+        """Index the rewards files in directory that are new or changed. Returns the intervals indexed."""
+        indexed = []
+        for path in sorted(pathlib.Path(directory).glob(pattern)):
+            stat = path.stat()
+            row = self.db.execute('select size, mtime from files where path = ?', (str(path),)).fetchone()
+            if row == (stat.st_size, stat.st_mtime_ns):
+                continue
+            indexed.append(self.add_file(path, stat))
+        return sorted(indexed)
+
+    def add_file(self, path, stat=None):
+        stat = stat or path.stat()
+        with open(path) as f:
+            tree = json.load(f)
+        interval = int(tree['index'])
+        rows = []
+        for node, rewards in tree['nodeRewards'].items():
+            if int(rewards.get('rewardNetwork', 0)) != 0:
+                continue
+            amountRPL, amountETH = node_rewards(rewards)
+            proof = b''.join(bytes.fromhex(item.removeprefix('0x')) for item in rewards.get('merkleProof') or [])
+            rows.append((to_checksum_address(node), interval, str(amountRPL), str(amountETH), proof))
+        with self.db:
+            self.db.execute('delete from rewards where interval = ?', (interval,))
+            self.db.executemany('insert into rewards values (?, ?, ?, ?, ?)', rows)
+            self.db.execute('insert or replace into roots values (?, ?)',
+                            (interval, bytes.fromhex(tree['merkleRoot'].removeprefix('0x'))))
+            self.db.execute('insert or replace into files values (?, ?, ?, ?)',
+                            (str(path), stat.st_size, stat.st_mtime_ns, interval))
+        return interval
+
+    def root(self, interval):
+        """The interval's Merkle root, or None if it is not indexed."""
+        with self.lock:
+            row = self.db.execute('select root from roots where interval = ?', (interval,)).fetchone()
+        return row[0] if row else None
+
+    def rewards(self, node):
+        """The node's rewards in each indexed interval, by interval."""
+        with self.lock:
+            rows = self.db.execute('select interval, amountRPL, amountETH, proof from rewards '
+                                   'where node = ? order by interval', (to_checksum_address(str(node)),)).fetchall()
+        return [Reward(interval, int(amountRPL), int(amountETH), [proof[i:i + 32] for i in range(0, len(proof), 32)])
+                for interval, amountRPL, amountETH, proof in rows]
+
+class MissingRoot(ValueError):
+    """The index has rewards for an interval but not its root."""
+
+class ClaimBuilder:
+    def __init__(self, w3, rocketlend, abi, index):
+        self.contract = w3.eth.contract(address=to_checksum_address(str(getattr(rocketlend, 'address', rocketlend))),
+                                        abi=abi)
+        self.distributor = w3.eth.contract(address=self.contract.functions.rocketMerkleDistributor().call(),
+                                           abi=[view_abi('isClaimed', ['uint256', 'address'], ['bool'])])
+        self.index = index
+
+    def unclaimed(self, node):
+        """The node's rewards in intervals that are not claimed, with verified proofs.
+
+        An interval counts as claimed if Rocket Lend knows it is, or if the
+        merkle distributor has it claimed (e.g. since Rocket Lend last looked).
+
+        Raises ValueError for a proof that does not match its interval's root,
+        and MissingRoot (a ValueError) for an interval without one.
+        """
+        node = to_checksum_address(str(node))
+        rewards = [reward for reward in self.index.rewards(node) if reward.amountRPL or reward.amountETH]
+        result = []
+        for reward in rewards:
+            if (self.contract.functions.intervals(node, reward.interval).call() or
+                self.distributor.functions.isClaimed(reward.interval, node).call()):
+                continue
+            root = self.index.root(reward.interval)
+            if root is None:
+                raise MissingRoot(f'no root for interval {reward.interval}')
+            if not verify_leaf(root, leaf(node, 0, reward.amountRPL, reward.amountETH), reward.proof):
+                raise ValueError(f'invalid proof for {node} in interval {reward.interval}')
+            result.append(reward)
+        return result
+
+    def arguments(self, node, size=MAX_CLAIM_INTERVALS):
+        """(_rewardIndex, _amountRPL, _amountETH, _merkleProof) for each claim needed, at most size intervals each."""
+        rewards = self.unclaimed(node)
+        return [([reward.interval for reward in batch],
+                 [reward.amountRPL for reward in batch],
+                 [reward.amountETH for reward in batch],
+                 [reward.proof for reward in batch])
+                for batch in (rewards[i:i + size] for i in range(0, len(rewards), size))]
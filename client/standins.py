@@ -0,0 +1,47 @@
+from eth_utils import keccak
+
+# Deployment of the stand-ins for Rocket Pool in contracts/standins/, for the
+# tests and scripts/deploy.py. Works with ape's project and account objects.
+
+def contract_key(name):
+    return keccak(f'contract.address{name}'.encode())
+
+def deploy_rocket_pool(project, admin, nodes, nodeWithMPs,
+                       supplyRPL=18_000_000 * 10 ** 18,
+                       priceRPL=10 ** 16,
+                       rewardIndex=8,
+                       minipoolCount=3):
+    """Deploy the stand-ins in contracts/standins/ and register them in a stand-in RocketStorage.
+
+    admin holds the RPL supply and receives user shares of ETH in place of the Rocket Vault and rETH.
+    nodes are registered in order, so their indices in RocketNodeManager match their position.
+    nodeWithMPs gets minipoolCount staking minipools (and their bonds as ETH provided).
+    """
+    rocketStorage = admin.deploy(project.RocketStorage)
+    def register(name, address):
+        rocketStorage.setAddress(contract_key(name), address, sender=admin)
+    RPLToken = admin.deploy(project.RocketTokenRPL, supplyRPL)
+    register('rocketTokenRPL', RPLToken)
+    register('rocketVault', admin)
+    register('rocketTokenRETH', admin)
+    register('rocketNodeManager', admin.deploy(project.RocketNodeManager, rocketStorage))
+    register('rocketNodeStaking', admin.deploy(project.RocketNodeStaking, rocketStorage))
+    register('rocketNodeDeposit', admin.deploy(project.RocketNodeDeposit))
+    register('rocketNetworkPrices', admin.deploy(project.RocketNetworkPrices, priceRPL))
+    register('rocketRewardsPool', admin.deploy(project.RocketRewardsPool, rewardIndex))
+    register('rocketMerkleDistributorMainnet', admin.deploy(project.RocketMerkleDistributorMainnet, rocketStorage))
+    distributorDelegate = admin.deploy(project.RocketNodeDistributor)
+    register('rocketNodeDistributorDelegate', distributorDelegate)
+    register('rocketNodeDistributorFactory', admin.deploy(project.RocketNodeDistributorFactory, rocketStorage, distributorDelegate))
+    rocketMinipoolManager = admin.deploy(project.RocketMinipoolManager)
+    register('rocketMinipoolManager', rocketMinipoolManager)
+    register('rocketMinipoolDelegate', admin.deploy(project.RocketMinipool, rocketStorage, admin))
+    rocketNodeManager = project.RocketNodeManager.at(rocketStorage.getAddress(contract_key('rocketNodeManager')))
+    for node in nodes:
+        rocketNodeManager.registerNode('Etc/UTC', sender=node)
+    for _ in range(minipoolCount):
+        minipool = admin.deploy(project.RocketMinipool, rocketStorage, nodeWithMPs)
+        rocketMinipoolManager.addMinipool(nodeWithMPs, minipool, sender=admin)
+    rocketNodeStaking = project.RocketNodeStaking.at(rocketStorage.getAddress(contract_key('rocketNodeStaking')))
+    rocketNodeStaking.setNodeETHProvided(nodeWithMPs, minipoolCount * 8 * 10 ** 18, sender=admin)
+    return rocketStorage
@@ -1,12 +1,20 @@
-#pragma version ~=0.4.0
+#pragma version ~=0.4.3
 #pragma evm-version cancun
-#pragma optimize gas
+#pragma optimize codesize
+# optimized for code size to stay under the 24576-byte limit (EIP-170); the views that only
+# combine public state (getPools, getPoolLoans, position) are in rocketlendLens.vy
 
 MAX_TOTAL_INTERVALS: constant(uint256) = 2048 # 170+ years
 MAX_CLAIM_INTERVALS: constant(uint256) = 128 # ~10 years
 MAX_PROOF_LENGTH: constant(uint256) = 32 # ~ 4 billion claimers
 MAX_NODE_MINIPOOLS: constant(uint256) = 2048
 MAX_ADDRESS_BATCH: constant(uint256) = 2048
+MAX_MULTICALL: constant(uint256) = 32
+MAX_CALL_SIZE: constant(uint256) = 16384
+MAX_POSITION_LOANS: constant(uint256) = 64
+MAX_BORROW_BATCH: constant(uint256) = 32
+MAX_FORCE_BATCH: constant(uint256) = 128
+MAX_INTEREST_BATCH: constant(uint256) = 256
 BORROW_LIMIT_PERCENT: constant(uint256) = 50
 SECONDS_PER_YEAR: constant(uint256) = 365 * 24 * 60 * 60
 
@@ -95,72 +103,74 @@ interface MinipoolInterface:
 RPL: public(immutable(RPLInterface))
 rocketStorage: public(immutable(RocketStorageInterface))
 
-@internal
-@view
-def _getRocketNodeStaking() -> RocketNodeStakingInterface:
-  return RocketNodeStakingInterface(
-    staticcall rocketStorage.getAddress(rocketNodeStakingKey)
-  )
+# Rocket Pool contract addresses cached from rocketStorage
+# (anyone can refresh them with updateRocketPoolAddresses after a Rocket Pool upgrade)
+rocketNodeStaking: public(RocketNodeStakingInterface)
+rocketNodeDeposit: public(RocketNodeDepositInterface)
+rocketNodeManager: public(RocketNodeManagerInterface)
+rocketMerkleDistributor: public(RocketMerkleDistributorInterface)
+rocketRewardsPool: public(RocketRewardsPoolInterface)
+rocketNetworkPrices: public(RocketNetworkPricesInterface)
+rocketNodeDistributorFactory: public(RocketNodeDistributorFactoryInterface)
+rocketMinipoolManager: public(RocketMinipoolManagerInterface)
 
 @internal
 @view
-def _getRocketNodeDeposit() -> RocketNodeDepositInterface:
-  return RocketNodeDepositInterface(
-    staticcall rocketStorage.getAddress(rocketNodeDepositKey)
-  )
+def _getAddress(_key: bytes32) -> address:
+  return staticcall rocketStorage.getAddress(_key)
 
 @internal
-@view
-def _getRocketNodeManager() -> RocketNodeManagerInterface:
-  return RocketNodeManagerInterface(
-    staticcall rocketStorage.getAddress(rocketNodeManagerKey)
-  )
+def _updateRocketPoolAddresses():
+  self.rocketNodeStaking = RocketNodeStakingInterface(self._getAddress(rocketNodeStakingKey))
+  self.rocketNodeDeposit = RocketNodeDepositInterface(self._getAddress(rocketNodeDepositKey))
+  self.rocketNodeManager = RocketNodeManagerInterface(self._getAddress(rocketNodeManagerKey))
+  self.rocketMerkleDistributor = RocketMerkleDistributorInterface(self._getAddress(rocketMerkleDistributorKey))
+  self.rocketRewardsPool = RocketRewardsPoolInterface(self._getAddress(rocketRewardsPoolKey))
+  self.rocketNetworkPrices = RocketNetworkPricesInterface(self._getAddress(rocketNetworkPricesKey))
+  self.rocketNodeDistributorFactory = RocketNodeDistributorFactoryInterface(self._getAddress(rocketNodeDistributorFactoryKey))
+  self.rocketMinipoolManager = RocketMinipoolManagerInterface(self._getAddress(rocketMinipoolManagerKey))
 
-@internal
-@view
-def _getMerkleDistributor() -> RocketMerkleDistributorInterface:
-  return RocketMerkleDistributorInterface(
-    staticcall rocketStorage.getAddress(rocketMerkleDistributorKey)
-  )
+@external
+def updateRocketPoolAddresses():
+  self._updateRocketPoolAddresses()
 
-@internal
-@view
-def _getRewardsPool() -> RocketRewardsPoolInterface:
-  return RocketRewardsPoolInterface(
-    staticcall rocketStorage.getAddress(rocketRewardsPoolKey)
-  )
+nextPoolId: public(uint256)
 
+# Vyper gives every struct member its own storage slot, so the state below is packed by hand:
+# amounts of RPL or ETH take 128 bits, timestamps 64 bits, and addresses 160 bits.
+# The structs returned by the views (params, pools, loans, borrowers) are unpacked.
+# A field is read by shifting it to the top of the word and back down (e.g. word << 128 >> 128
+# for the low half), which is shorter bytecode than masking with a wide constant.
+lowMask: constant(uint256) = ~0 >> 128
+
+# add (or subtract) _low and _high to (or from) the low and high 128-bit halves of _word
+# reverting if either half overflows (or underflows), so the arithmetic itself is unchecked
 @internal
-@view
-def _getRocketNetworkPrices() -> RocketNetworkPricesInterface:
-  return RocketNetworkPricesInterface(
-    staticcall rocketStorage.getAddress(rocketNetworkPricesKey)
-  )
+@pure
+def _add(_word: uint256, _low: uint256, _high: uint256) -> uint256:
+  self._check(_low <= unsafe_sub(lowMask, _word << 128 >> 128) and _high <= unsafe_sub(lowMask, _word >> 128), "ov")
+  return unsafe_add(unsafe_add(_word, _low), _high << 128)
 
 @internal
-@view
-def _getNodeDistributor(_node: address) -> RocketNodeDistributorInterface:
-  return RocketNodeDistributorInterface(
-    staticcall RocketNodeDistributorFactoryInterface(
-      staticcall rocketStorage.getAddress(rocketNodeDistributorFactoryKey)
-    ).getProxyAddress(_node)
-  )
+@pure
+def _sub(_word: uint256, _low: uint256, _high: uint256) -> uint256:
+  self._check(_low <= (_word << 128 >> 128) and _high <= _word >> 128, "ov")
+  return unsafe_sub(unsafe_sub(_word, _low), _high << 128)
 
 @internal
-@view
-def _getMinipoolManager() -> RocketMinipoolManagerInterface:
-  return RocketMinipoolManagerInterface(
-    staticcall rocketStorage.getAddress(rocketMinipoolManagerKey)
-  )
+@pure
+def _addressOf(_word: uint256) -> address:
+  return convert(_word << 96 >> 96, address)
 
-nextPoolId: public(uint256)
+@internal
+@pure
+def _withAddress(_word: uint256, _address: address) -> uint256:
+  return (_word >> 160 << 160) | convert(_address, uint256)
 
 struct PoolParams:
   interestRate: uint8 # whole number percentage APR
   endTime: uint256 # seconds after Unix epoch
 
-params: public(HashMap[uint256, PoolParams])
-
 struct PoolState:
   available: uint256 # RPL available to be returned to the lender
   borrowed: uint256 # total RPL currently borrowed by borrowers
@@ -169,16 +179,75 @@ struct PoolState:
   lenderAddress: address # current address for the lender
   pendingLenderAddress: address # potential future address for the lender
 
-pools: public(HashMap[uint256, PoolState])
+struct PackedPool:
+  lender: uint256 # lenderAddress | endTime << 160 | interestRate << 224
+  funds: uint256 # available | borrowed << 128
+  extra: uint256 # allowance | reclaimed << 128
+  interest: uint256 # accrued | accountedUntil << 128 (see _accountPoolInterest)
+  pendingLenderAddress: address
+
+packedPools: HashMap[uint256, PackedPool]
+
+@internal
+@view
+def _lenderAddress(_poolId: uint256) -> address:
+  return self._addressOf(self.packedPools[_poolId].lender)
+
+@internal
+@view
+def _endTime(_poolId: uint256) -> uint256:
+  return self.packedPools[_poolId].lender << 32 >> 192
+
+@internal
+@view
+def _params(_poolId: uint256) -> PoolParams:
+  lender: uint256 = self.packedPools[_poolId].lender
+  return PoolParams(interestRate=convert(lender >> 224, uint8), endTime=lender << 32 >> 192)
+
+@external
+@view
+def params(_poolId: uint256) -> PoolParams:
+  return self._params(_poolId)
+
+@external
+@view
+def pools(_poolId: uint256) -> PoolState:
+  pool: PackedPool = self.packedPools[_poolId]
+  return PoolState(available=pool.funds << 128 >> 128,
+                   borrowed=pool.funds >> 128,
+                   allowance=pool.extra << 128 >> 128,
+                   reclaimed=pool.extra >> 128,
+                   lenderAddress=self._addressOf(pool.lender),
+                   pendingLenderAddress=pool.pendingLenderAddress)
 
 allowedToBorrow: public(HashMap[uint256, HashMap[address, bool]])
 
+# a pool's borrowers can also be given as a Merkle tree, with leaves keccak256(abi_encode(node)) and
+# pairs hashed in sorted order; a node in it passes its proof with each borrow
+allowedToBorrowRoot: public(HashMap[uint256, bytes32])
+
 struct LoanState:
   borrowed: uint256 # RPL currently borrowed
   interestDue: uint256 # interest already accumulated (and not yet paid)
   accountedUntil: uint256 # start time for ongoing interest accumulation on borrowed
 
-loans: public(HashMap[uint256, HashMap[address, LoanState]])
+struct PackedLoan:
+  debt: uint256 # borrowed | interestDue << 128
+  accountedUntil: uint256 # accountedUntil | index in poolNodes << 64
+
+packedLoans: HashMap[uint256, HashMap[address, PackedLoan]]
+
+@external
+@view
+def loans(_poolId: uint256, _node: address) -> LoanState:
+  loan: PackedLoan = self.packedLoans[_poolId][_node]
+  return LoanState(borrowed=loan.debt << 128 >> 128,
+                   interestDue=loan.debt >> 128,
+                   accountedUntil=loan.accountedUntil << 192 >> 192)
+
+# the nodes with a loan (non-zero debt) from each pool, in no particular order
+poolNodes: public(HashMap[uint256, HashMap[uint256, address]])
+poolNodeCount: public(HashMap[uint256, uint256])
 
 struct BorrowerState:
   borrowed: uint256 # total RPL borrowed
@@ -189,8 +258,37 @@ struct BorrowerState:
   address: address # current address for the borrower
   pending: address # potential future address for the borrower
 
-borrowers: public(HashMap[address, BorrowerState])
-intervals: public(HashMap[address, HashMap[uint256, bool]]) # intervals known to be claimed (up to borrowers[_].index)
+struct PackedBorrower:
+  debt: uint256 # borrowed | interestDue << 128
+  balance: uint256 # RPL | ETH << 128
+  account: uint256 # address | index << 160
+  pending: address
+
+packedBorrowers: HashMap[address, PackedBorrower]
+
+@internal
+@view
+def _borrowerAddress(_node: address) -> address:
+  return self._addressOf(self.packedBorrowers[_node].account)
+
+@external
+@view
+def borrowers(_node: address) -> BorrowerState:
+  borrower: PackedBorrower = self.packedBorrowers[_node]
+  return BorrowerState(borrowed=borrower.debt << 128 >> 128,
+                       interestDue=borrower.debt >> 128,
+                       RPL=borrower.balance << 128 >> 128,
+                       ETH=borrower.balance >> 128,
+                       index=borrower.account >> 160,
+                       address=self._addressOf(borrower.account),
+                       pending=borrower.pending)
+
+claimedIntervals: HashMap[address, HashMap[uint256, uint256]] # bitmaps of intervals known to be claimed (up to borrowers[_].index), 256 per word
+
+@external
+@view
+def intervals(_node: address, _index: uint256) -> bool:
+  return self.claimedIntervals[_node][_index >> 8] & (1 << (_index & 255)) != 0
 
 struct PoolItem:
   next: uint256
@@ -205,19 +303,36 @@ def _insertDebtPool(_node: address, _poolId: uint256, _prev: uint256):
   newIndex: uint256 = self.debtPools[_node][0].poolId + 1
   self.debtPools[_node][0].poolId = newIndex
   self.debtPools[_node][newIndex].poolId = _poolId
-  assert _prev == 0 or self.params[self.debtPools[_node][_prev].poolId].endTime <= self.params[_poolId].endTime, "p"
+  endTime: uint256 = self._endTime(_poolId)
+  self._check(_prev == 0 or self._endTime(self.debtPools[_node][_prev].poolId) <= endTime, "p")
   nextIndex: uint256 = self.debtPools[_node][_prev].next
-  assert nextIndex == 0 or self.params[_poolId].endTime <= self.params[self.debtPools[_node][nextIndex].poolId].endTime, "n"
+  self._check(nextIndex == 0 or endTime <= self._endTime(self.debtPools[_node][nextIndex].poolId), "n")
   self.debtPools[_node][newIndex].next = nextIndex
   self.debtPools[_node][_prev].next = newIndex
+  count: uint256 = self.poolNodeCount[_poolId]
+  self.poolNodes[_poolId][count] = _node
+  self.poolNodeCount[_poolId] = count + 1
+  self._setPoolNodeIndex(_poolId, _node, count)
 
 @internal
 def _removeDebtPool(_node: address, _poolId: uint256, _prev: uint256):
   index: uint256 = self.debtPools[_node][_prev].next
-  assert self.debtPools[_node][index].poolId == _poolId, "i"
+  self._check(self.debtPools[_node][index].poolId == _poolId, "i")
   nextIndex: uint256 = self.debtPools[_node][index].next
   self.debtPools[_node][_prev].next = nextIndex
   self.debtPools[_node][index].next = index
+  # move the last node into the removed node's place
+  last: uint256 = self.poolNodeCount[_poolId] - 1
+  nodeIndex: uint256 = self.packedLoans[_poolId][_node].accountedUntil >> 64
+  lastNode: address = self.poolNodes[_poolId][last]
+  self.poolNodes[_poolId][nodeIndex] = lastNode
+  self._setPoolNodeIndex(_poolId, lastNode, nodeIndex)
+  self.poolNodes[_poolId][last] = empty(address)
+  self.poolNodeCount[_poolId] = last
+
+@internal
+def _setPoolNodeIndex(_poolId: uint256, _node: address, _index: uint256):
+  self.packedLoans[_poolId][_node].accountedUntil = (self.packedLoans[_poolId][_node].accountedUntil << 192 >> 192) | (_index << 64)
 
 oneEther: constant(uint256) = 10 ** 18
 
@@ -225,12 +340,30 @@ oneEther: constant(uint256) = 10 ** 18
 def __init__(_rocketStorage: address):
   rocketStorage = RocketStorageInterface(_rocketStorage)
   RPL = RPLInterface(staticcall rocketStorage.getAddress(keccak256("contract.addressrocketTokenRPL")))
+  self._updateRocketPoolAddresses()
+
+@internal
+@pure
+def _check(_ok: bool, _reason: String[2]):
+  assert _ok, _reason
+
+@internal
+@pure
+def _checkNonzero(_amount: uint256):
+  self._check(0 < _amount, "no")
+
+@internal
+@view
+def _checkSender(_expected: address):
+  self._check(msg.sender == _expected, "a")
 
-allowPaymentsFrom: address
+# the only sender __default__ accepts ETH from, set around each claim's external call
+# (transient: it never needs to outlive the transaction, and the minipool loop in _claim sets it once per minipool)
+allowPaymentsFrom: transient(address)
 @external
 @payable
 def __default__():
-  assert msg.sender == self.allowPaymentsFrom, "a"
+  self._checkSender(self.allowPaymentsFrom)
 
 # Lender actions
 
@@ -257,6 +390,10 @@ event ChangeAllowedToBorrow:
   node: indexed(address)
   allowed: indexed(bool)
 
+event SetAllowedToBorrowRoot:
+  id: indexed(uint256)
+  root: indexed(bytes32)
+
 event WithdrawETHFromPool: pass
 
 event WithdrawRPLFromPool: pass
@@ -272,6 +409,14 @@ event ForceRepayETH:
   interestDue: indexed(uint256)
   amount: uint256
 
+event ForceRepayRPLMany:
+  id: indexed(uint256)
+  total: indexed(uint256)
+
+event ForceRepayETHMany:
+  id: indexed(uint256)
+  total: indexed(uint256)
+
 event ForceClaimRewards:
   RPL: indexed(uint256)
   ETH: indexed(uint256)
@@ -289,123 +434,249 @@ event ChargeInterest:
   charged: indexed(uint256)
   total: indexed(uint256)
 
+event UpdateInterestDueMany:
+  charged: indexed(uint256)
+  count: indexed(uint256)
+
 @internal
 def _transferPool(_poolId: uint256, _newAddress: address):
-  log ConfirmTransferPool(self.pools[_poolId].lenderAddress, self.pools[_poolId].pendingLenderAddress)
-  self.pools[_poolId].pendingLenderAddress = empty(address)
-  self.pools[_poolId].lenderAddress = _newAddress
+  log ConfirmTransferPool(self._lenderAddress(_poolId), self.packedPools[_poolId].pendingLenderAddress)
+  self.packedPools[_poolId].pendingLenderAddress = empty(address)
+  self.packedPools[_poolId].lender = self._withAddress(self.packedPools[_poolId].lender, _newAddress)
 
 @external
 def transferPool(_poolId: uint256, _newAddress: address, _confirm: bool):
-  assert msg.sender == self.pools[_poolId].lenderAddress, "a"
+  self._checkFromLender(_poolId)
   if _confirm:
     self._transferPool(_poolId, _newAddress)
   else:
-    log PendingTransferPool(self.pools[_poolId].pendingLenderAddress)
-    self.pools[_poolId].pendingLenderAddress = _newAddress
+    log PendingTransferPool(self.packedPools[_poolId].pendingLenderAddress)
+    self.packedPools[_poolId].pendingLenderAddress = _newAddress
 
 @external
 def confirmTransferPool(_poolId: uint256):
-  assert msg.sender == self.pools[_poolId].pendingLenderAddress, "a"
+  self._checkSender(self.packedPools[_poolId].pendingLenderAddress)
   self._transferPool(_poolId, msg.sender)
 
 @external
 def createPool(_params: PoolParams, _supply: uint256, _allowance: uint256, _borrowers: DynArray[address, MAX_ADDRESS_BATCH]) -> uint256:
   poolId: uint256 = self.nextPoolId
   self.nextPoolId = poolId + 1
-  self.params[poolId] = _params
-  self.pools[poolId].lenderAddress = msg.sender
+  self.packedPools[poolId].lender = (convert(msg.sender, uint256) |
+                                     (convert(convert(_params.endTime, uint64), uint256) << 160) |
+                                     (convert(_params.interestRate, uint256) << 224))
   log CreatePool(poolId)
   if 0 < _supply:
-    assert extcall RPL.transferFrom(msg.sender, self, _supply), "tf"
-    self.pools[poolId].available += _supply
-    log SupplyPool(poolId, self.pools[poolId].available)
+    self._receiveRPL(_supply)
+    self.packedPools[poolId].funds = self._add(0, _supply, 0)
+    log SupplyPool(poolId, _supply)
   if 0 < _allowance:
-    self.pools[poolId].allowance = _allowance
+    self.packedPools[poolId].extra = min(_allowance, lowMask)
     log SetAllowance(poolId, 0)
   for node: address in _borrowers:
     self.allowedToBorrow[poolId][node] = True
     log ChangeAllowedToBorrow(poolId, node, True)
   return poolId
 
+@internal
+def _receiveRPL(_amount: uint256):
+  self._check(extcall RPL.transferFrom(msg.sender, self, _amount), "tf")
+
+@internal
+def _sendRPL(_amount: uint256):
+  self._check(extcall RPL.transfer(msg.sender, _amount), "t")
+
 @internal
 def _checkFromLender(_poolId: uint256):
-  assert msg.sender == self.pools[_poolId].lenderAddress, "a"
+  self._checkSender(self._lenderAddress(_poolId))
 
 @external
 def changePoolRPL(_poolId: uint256, _targetSupply: uint256):
-  currentSupply: uint256 = self.pools[_poolId].available
+  funds: uint256 = self.packedPools[_poolId].funds
+  currentSupply: uint256 = funds << 128 >> 128
   if currentSupply != _targetSupply:
     if _targetSupply < currentSupply:
       self._checkFromLender(_poolId)
-      assert extcall RPL.transfer(msg.sender, currentSupply - _targetSupply), "t"
+      self._sendRPL(currentSupply - _targetSupply)
       log WithdrawRPLFromPool()
+      funds = self._sub(funds, currentSupply - _targetSupply, 0)
     else:
-      assert extcall RPL.transferFrom(msg.sender, self, _targetSupply - currentSupply), "tf"
+      self._receiveRPL(_targetSupply - currentSupply)
       log SupplyPool(_poolId, _targetSupply)
-    self.pools[_poolId].available = _targetSupply
+      funds = self._add(funds, _targetSupply - currentSupply, 0)
+    self.packedPools[_poolId].funds = funds
 
 @external
 def withdrawEtherFromPool(_poolId: uint256, _amount: uint256):
   self._checkFromLender(_poolId)
-  self.pools[_poolId].reclaimed -= _amount
+  self.packedPools[_poolId].extra = self._sub(self.packedPools[_poolId].extra, 0, _amount)
   log WithdrawETHFromPool()
   send(msg.sender, _amount, gas=msg.gas)
 
-addressMask: constant(uint256) = ~0 >> 96
 allowedBit: constant(uint256) = 1 << 160
 
 @external
 def changeAllowedToBorrow(_poolId: uint256, _borrowers: DynArray[uint256, MAX_ADDRESS_BATCH]):
   self._checkFromLender(_poolId)
   for arg: uint256 in _borrowers:
-    node: address = convert(arg & addressMask, address)
+    node: address = convert(arg << 96 >> 96, address)
     allowed: bool = convert(arg & allowedBit, bool)
     self.allowedToBorrow[_poolId][node] = allowed
     log ChangeAllowedToBorrow(_poolId, node, allowed)
 
+@external
+def setAllowedToBorrowRoot(_poolId: uint256, _root: bytes32):
+  self._checkFromLender(_poolId)
+  self.allowedToBorrowRoot[_poolId] = _root
+  log SetAllowedToBorrowRoot(_poolId, _root)
+
+# checks _node is in allowedToBorrow or (by _proof) in the tree of allowedToBorrowRoot
+# (no proof hashes to the empty root)
+@internal
+@view
+def _checkAllowedToBorrow(_poolId: uint256, _node: address, _proof: DynArray[bytes32, MAX_PROOF_LENGTH]):
+  if self.allowedToBorrow[_poolId][empty(address)] or self.allowedToBorrow[_poolId][_node]:
+    return
+  hash: bytes32 = keccak256(abi_encode(_node))
+  for sibling: bytes32 in _proof:
+    if convert(hash, uint256) < convert(sibling, uint256):
+      hash = keccak256(concat(hash, sibling))
+    else:
+      hash = keccak256(concat(sibling, hash))
+  self._check(hash == self.allowedToBorrowRoot[_poolId], "r")
+
+# an allowance over 128 bits (e.g. max_value(uint256) for no limit) is stored as max_value(uint128),
+# which is more RPL than exists
 @external
 def setAllowance(_poolId: uint256, _allowance: uint256):
   self._checkFromLender(_poolId)
-  log SetAllowance(_poolId, self.pools[_poolId].allowance)
-  self.pools[_poolId].allowance = _allowance
+  extra: uint256 = self.packedPools[_poolId].extra
+  log SetAllowance(_poolId, extra << 128 >> 128)
+  self.packedPools[_poolId].extra = (extra >> 128 << 128) | min(_allowance, lowMask)
 
 @external
 def updateInterestDue(_poolId: uint256, _node: address):
   self._chargeInterest(_poolId, _node)
 
+struct LoanArgument:
+  poolId: uint256
+  node: address
+
+# like updateInterestDue for each loan in turn, skipping loans already charged in this block
+# (logging only the total charged and the number of loans charged)
+@external
+def updateInterestDueMany(_loans: DynArray[LoanArgument, MAX_INTEREST_BATCH]):
+  total: uint256 = 0
+  count: uint256 = 0
+  for arg: LoanArgument in _loans:
+    if (self.packedLoans[arg.poolId][arg.node].accountedUntil << 192 >> 192) == block.timestamp:
+      continue
+    total += self._accountInterest(arg.poolId, arg.node)
+    count += 1
+  log UpdateInterestDueMany(total, count)
+
+@internal
+@view
+def _checkEnded(_poolId: uint256):
+  self._check(self._endTime(_poolId) < block.timestamp, "tm")
+
+@internal
+@view
+def _checkActive(_poolId: uint256):
+  self._check(block.timestamp < self._endTime(_poolId), "e")
+
 @internal
 def _chargeAndCheckEndedOwing(_poolId: uint256, _node: address):
-  endTime: uint256 = self.params[_poolId].endTime
-  assert endTime < block.timestamp, "tm"
+  self._checkEnded(_poolId)
   self._chargeInterest(_poolId, _node)
-  assert 0 < self.loans[_poolId][_node].borrowed or 0 < self.loans[_poolId][_node].interestDue, "pa"
+  self._check(not self._loanEmpty(_poolId, _node), "pa")
+
+# assumes interest has been charged, returns the RPL repaid
+@internal
+def _repayWithRPL(_poolId: uint256, _node: address, _prevIndex: uint256, _unstakeAmount: uint256) -> uint256:
+  if 0 < _unstakeAmount:
+    self._withdrawRPL(_node, _unstakeAmount)
+  balance: uint256 = self.packedBorrowers[_node].balance
+  startAmountRPL: uint256 = (balance << 128 >> 128) + _unstakeAmount
+  if 0 < _unstakeAmount:
+    loanDebt: uint256 = self.packedLoans[_poolId][_node].debt
+    self._check(startAmountRPL <= (loanDebt >> 128) + (loanDebt << 128 >> 128), "wd")
+  available: uint256 = self._payDebt(_poolId, _node, _prevIndex, startAmountRPL)
+  self.packedBorrowers[_node].balance = self._add(balance >> 128 << 128, available, 0)
+  return startAmountRPL - available
 
 @external
 def forceRepayRPL(_poolId: uint256, _node: address, _prevIndex: uint256, _unstakeAmount: uint256):
   self._chargeAndCheckEndedOwing(_poolId, _node)
-  if 0 < _unstakeAmount:
-    extcall self._getRocketNodeStaking().withdrawRPL(_node, _unstakeAmount)
-    self.borrowers[_node].RPL += _unstakeAmount
-  available: uint256 = self.borrowers[_node].RPL
-  if 0 < _unstakeAmount:
-    assert available <= self.loans[_poolId][_node].interestDue + self.loans[_poolId][_node].borrowed, "wd"
-  available = self._payDebt(_poolId, _node, _prevIndex, available)
-  assert available < self.borrowers[_node].RPL, "no"
-  self.borrowers[_node].RPL = available
-  log ForceRepayRPL(available, self.borrowers[_node].borrowed, self.borrowers[_node].interestDue)
+  self._checkNonzero(self._repayWithRPL(_poolId, _node, _prevIndex, _unstakeAmount))
+  debt: uint256 = self.packedBorrowers[_node].debt
+  log ForceRepayRPL(self.packedBorrowers[_node].balance << 128 >> 128, debt << 128 >> 128, debt >> 128)
+
+# assumes interest has been charged, returns the ETH reclaimed
+@internal
+def _repayWithETH(_poolId: uint256, _node: address, _prevIndex: uint256, _ethPerRpl: uint256) -> uint256:
+  balance: uint256 = self.packedBorrowers[_node].balance
+  startAmountETH: uint256 = balance >> 128
+  amountETH: uint256 = (self._payDebt(_poolId, _node, _prevIndex, (startAmountETH * oneEther) // _ethPerRpl) * _ethPerRpl) // oneEther
+  reclaimedETH: uint256 = startAmountETH - amountETH
+  self.packedBorrowers[_node].balance = self._sub(balance, 0, reclaimedETH)
+  self.packedPools[_poolId].extra = self._add(self.packedPools[_poolId].extra, 0, reclaimedETH)
+  return reclaimedETH
 
 @external
 def forceRepayETH(_poolId: uint256, _node: address, _prevIndex: uint256):
   self._checkFromLender(_poolId)
   self._chargeAndCheckEndedOwing(_poolId, _node)
-  ethPerRpl: uint256 = staticcall self._getRocketNetworkPrices().getRPLPrice()
-  startAmountETH: uint256 = self.borrowers[_node].ETH
-  self.borrowers[_node].ETH = (self._payDebt(_poolId, _node, _prevIndex, (startAmountETH * oneEther) // ethPerRpl) * ethPerRpl) // oneEther
-  reclaimedETH: uint256 = startAmountETH - self.borrowers[_node].ETH
-  assert 0 < reclaimedETH, "no"
-  self.pools[_poolId].reclaimed += reclaimedETH
-  log ForceRepayETH(self.borrowers[_node].ETH, self.borrowers[_node].borrowed, self.borrowers[_node].interestDue, reclaimedETH)
+  reclaimedETH: uint256 = self._repayWithETH(_poolId, _node, _prevIndex, staticcall self.rocketNetworkPrices.getRPLPrice())
+  self._checkNonzero(reclaimedETH)
+  debt: uint256 = self.packedBorrowers[_node].debt
+  log ForceRepayETH(self.packedBorrowers[_node].balance >> 128, debt << 128 >> 128, debt >> 128, reclaimedETH)
+
+struct ForceRepayArgument:
+  node: address
+  prevIndex: uint256
+  unstakeAmount: uint256 # ignored by forceRepayETHMany
+
+# whether a node can be skipped by the *Many functions: it owes nothing in _poolId, or _prevIndex
+# is not the item before _poolId's in its debtPools (so removing the loan would revert with "i")
+@internal
+@view
+def _skipForce(_poolId: uint256, _node: address, _prevIndex: uint256) -> bool:
+  index: uint256 = self.debtPools[_node][_prevIndex].next
+  return (self._loanEmpty(_poolId, _node) or index == 0 or index == _prevIndex or
+          self.debtPools[_node][index].poolId != _poolId)
+
+# like forceRepayRPL for each node in turn, skipping nodes as above or with nothing to repay with,
+# and unstaking no more than the node's stake or its remaining debt in the pool
+# the total repaid in RPL (if _ethPerRpl is 0), or reclaimed in ETH (at _ethPerRpl)
+@internal
+def _forceRepayMany(_poolId: uint256, _args: DynArray[ForceRepayArgument, MAX_FORCE_BATCH], _ethPerRpl: uint256) -> uint256:
+  self._checkEnded(_poolId)
+  total: uint256 = 0
+  for arg: ForceRepayArgument in _args:
+    if self._skipForce(_poolId, arg.node, arg.prevIndex):
+      continue
+    self._chargeInterest(_poolId, arg.node)
+    if 0 < _ethPerRpl:
+      total += self._repayWithETH(_poolId, arg.node, arg.prevIndex, _ethPerRpl)
+      continue
+    loanDebt: uint256 = self.packedLoans[_poolId][arg.node].debt
+    owed: uint256 = (loanDebt >> 128) + (loanDebt << 128 >> 128)
+    unstake: uint256 = min(arg.unstakeAmount, owed - min(owed, self.packedBorrowers[arg.node].balance << 128 >> 128))
+    if 0 < unstake:
+      unstake = min(unstake, staticcall self.rocketNodeStaking.getNodeRPLStake(arg.node))
+    total += self._repayWithRPL(_poolId, arg.node, arg.prevIndex, unstake)
+  return total
+
+@external
+def forceRepayRPLMany(_poolId: uint256, _args: DynArray[ForceRepayArgument, MAX_FORCE_BATCH]):
+  log ForceRepayRPLMany(_poolId, self._forceRepayMany(_poolId, _args, 0))
+
+# like forceRepayETH for each node in turn, at a single RPL price, skipping nodes as above
+@external
+def forceRepayETHMany(_poolId: uint256, _args: DynArray[ForceRepayArgument, MAX_FORCE_BATCH]):
+  self._checkFromLender(_poolId)
+  log ForceRepayETHMany(_poolId, self._forceRepayMany(_poolId, _args, staticcall self.rocketNetworkPrices.getRPLPrice()))
 
 @external
 def forceClaimMerkleRewards(
@@ -421,19 +692,19 @@ def forceClaimMerkleRewards(
     ):
   if 0 < _repayETH:
     self._checkFromLender(_poolId)
-  assert self.borrowers[_node].RPL < _repayRPL or self.borrowers[_node].ETH < _repayETH, "b"
+  balance: uint256 = self.packedBorrowers[_node].balance
+  self._check((balance << 128 >> 128) < _repayRPL or balance >> 128 < _repayETH, "b")
   self._chargeAndCheckEndedOwing(_poolId, _node)
   self._claimMerkleRewards(_node, _rewardIndex, _amountRPL, _amountETH, _merkleProof, 0)
-  if 0 < _repayRPL:
-    assert self._payDebt(_poolId, _node, _prevIndex, _repayRPL) == 0, "RPL"
-    self.borrowers[_node].RPL -= _repayRPL
+  repay: uint256 = _repayRPL
   if 0 < _repayETH:
-    ethPerRpl: uint256 = staticcall self._getRocketNetworkPrices().getRPLPrice()
-    assert self._payDebt(_poolId, _node, _prevIndex, _repayETH // ethPerRpl) == 0, "ETH"
-    self.borrowers[_node].ETH -= _repayETH
-    self.pools[_poolId].reclaimed += _repayETH
-  log ForceClaimRewards(self.borrowers[_node].RPL, self.borrowers[_node].ETH,
-                        self.borrowers[_node].borrowed, self.borrowers[_node].interestDue)
+    repay += _repayETH // staticcall self.rocketNetworkPrices.getRPLPrice()
+    self.packedPools[_poolId].extra = self._add(self.packedPools[_poolId].extra, 0, _repayETH)
+  self._payDebtExactly(_poolId, _node, _prevIndex, repay)
+  balance = self._sub(self.packedBorrowers[_node].balance, _repayRPL, _repayETH)
+  self.packedBorrowers[_node].balance = balance
+  debt: uint256 = self.packedBorrowers[_node].debt
+  log ForceClaimRewards(balance << 128 >> 128, balance >> 128, debt << 128 >> 128, debt >> 128)
 
 @external
 def forceDistributeRefund(_poolId: uint256, _node: address, _prevIndex: uint256,
@@ -442,28 +713,28 @@ def forceDistributeRefund(_poolId: uint256, _node: address, _prevIndex: uint256,
   self._checkFromLender(_poolId)
   self._chargeAndCheckEndedOwing(_poolId, _node)
   total: uint256 = self._claim(_node, _distribute, _minipools)
-  assert 0 < total, "no"
-  ethPerRpl: uint256 = staticcall self._getRocketNetworkPrices().getRPLPrice()
-  startAmountETH: uint256 = self.borrowers[_node].ETH
-  self.borrowers[_node].ETH = (self._payDebt(_poolId, _node, _prevIndex, (startAmountETH * oneEther) // ethPerRpl) * ethPerRpl) // oneEther
-  reclaimedETH: uint256 = startAmountETH - self.borrowers[_node].ETH
-  assert 0 < reclaimedETH, "no"
-  self.pools[_poolId].reclaimed += reclaimedETH
-  log ForceDistributeRefund(total, reclaimedETH, self.borrowers[_node].ETH,
-                            self.borrowers[_node].borrowed, self.borrowers[_node].interestDue)
+  self._checkNonzero(total)
+  reclaimedETH: uint256 = self._repayWithETH(_poolId, _node, _prevIndex, staticcall self.rocketNetworkPrices.getRPLPrice())
+  self._checkNonzero(reclaimedETH)
+  debt: uint256 = self.packedBorrowers[_node].debt
+  log ForceDistributeRefund(total, reclaimedETH, self.packedBorrowers[_node].balance >> 128,
+                            debt << 128 >> 128, debt >> 128)
 
 @internal
 def _payDebt(_poolId: uint256, _node: address, _prevIndex: uint256, _amount: uint256) -> uint256:
   amount: uint256 = _amount
-  if amount <= self.loans[_poolId][_node].interestDue:
-    amount -= self._repayInterest(_poolId, _node, amount)
-  else:
-    amount -= self._repayInterest(_poolId, _node, self.loans[_poolId][_node].interestDue)
-    amount -= self._repay(_poolId, _node, min(amount, self.loans[_poolId][_node].borrowed))
+  interestDue: uint256 = self.packedLoans[_poolId][_node].debt >> 128
+  amount -= self._repayInterest(_poolId, _node, min(amount, interestDue))
+  amount -= self._repay(_poolId, _node, min(amount, self.packedLoans[_poolId][_node].debt << 128 >> 128))
   if self._loanEmpty(_poolId, _node):
     self._removeDebtPool(_node, _poolId, _prevIndex)
   return amount
 
+# reverts if _amount is more than the loan owes
+@internal
+def _payDebtExactly(_poolId: uint256, _node: address, _prevIndex: uint256, _amount: uint256):
+  self._check(self._payDebt(_poolId, _node, _prevIndex, _amount) == 0, "o")
+
 # Borrower actions
 
 event PendingChangeBorrowerAddress:
@@ -486,11 +757,22 @@ event Borrow:
   borrowed: indexed(uint256)
   interestDue: indexed(uint256)
 
+event BorrowMany:
+  amount: indexed(uint256)
+  borrowed: indexed(uint256)
+  interestDue: indexed(uint256)
+
 event Repay:
   amount: indexed(uint256)
   borrowed: indexed(uint256)
   interestDue: indexed(uint256)
 
+event RepayInOrder:
+  amount: indexed(uint256)
+  borrowed: indexed(uint256)
+  interestDue: indexed(uint256)
+  pools: uint256 # loans paid, one for each pool walked (so MAX_POSITION_LOANS if the walk stopped there)
+
 event TransferDebt: pass
 
 event DistributeRefund:
@@ -514,85 +796,99 @@ event DepositETHFor:
 
 @internal
 def _checkFromBorrower(_node: address):
-  assert msg.sender == self.borrowers[_node].address, "a"
+  self._checkSender(self._borrowerAddress(_node))
 
 @internal
 def _updateBorrowerAddress(_node: address, _newAddress: address):
-  log ConfirmChangeBorrowerAddress(self.borrowers[_node].address, self.borrowers[_node].pending)
-  self.borrowers[_node].pending = empty(address)
-  self.borrowers[_node].address = _newAddress
+  log ConfirmChangeBorrowerAddress(self._borrowerAddress(_node), self.packedBorrowers[_node].pending)
+  self.packedBorrowers[_node].pending = empty(address)
+  self.packedBorrowers[_node].account = self._withAddress(self.packedBorrowers[_node].account, _newAddress)
 
 @external
 def changeBorrowerAddress(_node: address, _newAddress: address, _confirm: bool):
   self._checkFromBorrower(_node)
-  assert _newAddress != empty(address), "nu" # we use empty(address) to signify a node has not joined
+  self._check(_newAddress != empty(address), "nu") # we use empty(address) to signify a node has not joined
   if _confirm:
     self._updateBorrowerAddress(_node, _newAddress)
   else:
-    log PendingChangeBorrowerAddress(self.borrowers[_node].pending)
-    self.borrowers[_node].pending = _newAddress
+    log PendingChangeBorrowerAddress(self.packedBorrowers[_node].pending)
+    self.packedBorrowers[_node].pending = _newAddress
 
 @external
 def confirmChangeBorrowerAddress(_node: address):
-  assert msg.sender == self.borrowers[_node].pending, "a"
+  self._checkSender(self.packedBorrowers[_node].pending)
   self._updateBorrowerAddress(_node, msg.sender)
 
 @internal
 def _updateIndex(_node: address, _toIndex: uint256):
-  index: uint256 = self.borrowers[_node].index
+  account: uint256 = self.packedBorrowers[_node].account
+  index: uint256 = account >> 160
   if _toIndex <= index: return
-  rocketMerkleDistributor: RocketMerkleDistributorInterface = self._getMerkleDistributor()
+  toIndex: uint256 = min(_toIndex, index + MAX_TOTAL_INTERVALS)
+  rocketMerkleDistributor: RocketMerkleDistributorInterface = self.rocketMerkleDistributor
+  word: uint256 = self.claimedIntervals[_node][index >> 8]
   for _: uint256 in range(MAX_TOTAL_INTERVALS):
-    if _toIndex <= index: break
-    self.intervals[_node][index] = staticcall rocketMerkleDistributor.isClaimed(index, _node)
+    if staticcall rocketMerkleDistributor.isClaimed(index, _node):
+      word |= 1 << (index & 255)
     index += 1
-  self.borrowers[_node].index = index
+    if index == toIndex or index & 255 == 0:
+      self.claimedIntervals[_node][(index - 1) >> 8] = word
+      if index == toIndex: break
+      word = self.claimedIntervals[_node][index >> 8]
+  self.packedBorrowers[_node].account = (account << 96 >> 96) | (index << 160)
 
 @external
 def joinAsBorrower(_node: address):
-  assert self.borrowers[_node].address == empty(address), "j"
-  currentWithdrawalAddress: address = staticcall rocketStorage.getNodeWithdrawalAddress(_node)
-  if currentWithdrawalAddress == self:
-    assert msg.sender == _node, "a"
-    self.borrowers[_node].address = _node
+  account: uint256 = self.packedBorrowers[_node].account
+  self._check(self._addressOf(account) == empty(address), "j")
+  borrowerAddress: address = staticcall rocketStorage.getNodeWithdrawalAddress(_node)
+  if borrowerAddress == self:
+    self._checkSender(_node)
+    borrowerAddress = _node
   else:
-    self.borrowers[_node].address = currentWithdrawalAddress
     extcall rocketStorage.confirmWithdrawalAddress(_node)
-  extcall self._getRocketNodeManager().setRPLWithdrawalAddress(_node, self, True)
-  rocketNodeStaking: RocketNodeStakingInterface = self._getRocketNodeStaking()
+  self.packedBorrowers[_node].account = self._withAddress(account, borrowerAddress)
+  extcall self.rocketNodeManager.setRPLWithdrawalAddress(_node, self, True)
+  rocketNodeStaking: RocketNodeStakingInterface = self.rocketNodeStaking
   if staticcall rocketNodeStaking.getRPLLockingAllowed(_node):
     extcall rocketNodeStaking.setRPLLockingAllowed(_node, False)
-  self._updateIndex(_node, staticcall self._getRewardsPool().getRewardIndex())
-  log JoinProtocol(self.borrowers[_node].address)
+  self._updateIndex(_node, staticcall self.rocketRewardsPool.getRewardIndex())
+  log JoinProtocol(borrowerAddress)
 
 @external
 def leaveAsBorrower(_node: address):
-  assert msg.sender == self.borrowers[_node].address, "a"
-  assert self.borrowers[_node].borrowed == 0, "bo"
-  assert self.borrowers[_node].interestDue == 0, "i"
+  self._checkFromBorrower(_node)
+  debt: uint256 = self.packedBorrowers[_node].debt
+  self._check((debt << 128 >> 128) == 0, "bo")
+  self._check(debt >> 128 == 0, "i")
   extcall rocketStorage.setWithdrawalAddress(_node, msg.sender, True)
-  extcall self._getRocketNodeManager().unsetRPLWithdrawalAddress(_node)
-  self.borrowers[_node].address = empty(address)
-  log LeaveProtocol(self.borrowers[_node].pending)
-  self.borrowers[_node].pending = empty(address)
+  extcall self.rocketNodeManager.unsetRPLWithdrawalAddress(_node)
+  self.packedBorrowers[_node].account = self._withAddress(self.packedBorrowers[_node].account, empty(address))
+  log LeaveProtocol(self.packedBorrowers[_node].pending)
+  self.packedBorrowers[_node].pending = empty(address)
 
 @internal
 def _stakeRPLFor(_node: address, _amount: uint256):
-  rocketNodeStaking: RocketNodeStakingInterface = self._getRocketNodeStaking()
-  assert extcall RPL.approve(rocketNodeStaking.address, _amount), "ap"
+  rocketNodeStaking: RocketNodeStakingInterface = self.rocketNodeStaking
+  self._check(extcall RPL.approve(rocketNodeStaking.address, _amount), "ap")
   extcall rocketNodeStaking.stakeRPLFor(_node, _amount)
 
+@internal
+def _withdrawRPL(_node: address, _amount: uint256):
+  extcall self.rocketNodeStaking.withdrawRPL(_node, _amount)
+
 @external
 def setStakeRPLForAllowed(_node: address, _caller: address, _allowed: bool):
   self._checkFromBorrower(_node)
-  extcall self._getRocketNodeStaking().setStakeRPLForAllowed(_node, _caller, _allowed)
+  extcall self.rocketNodeStaking.setStakeRPLForAllowed(_node, _caller, _allowed)
 
 @external
 def unstakeRPL(_node: address, _amount: uint256):
   self._checkFromBorrower(_node)
-  extcall self._getRocketNodeStaking().withdrawRPL(_node, _amount)
-  self.borrowers[_node].RPL += _amount
-  log UnstakeRPL(self.borrowers[_node].RPL)
+  self._withdrawRPL(_node, _amount)
+  balance: uint256 = self._add(self.packedBorrowers[_node].balance, _amount, 0)
+  self.packedBorrowers[_node].balance = balance
+  log UnstakeRPL(balance << 128 >> 128)
 
 @internal
 @view
@@ -600,71 +896,101 @@ def _outstandingInterest(_borrowed: uint256, _rate: uint8, _startTime: uint256,
   # _rate is percentage RPL per RPL per Year
   return _borrowed * convert(_rate, uint256) * (_endTime - _startTime) // 100 // SECONDS_PER_YEAR
 
+@internal
+@view
+def _interestSince(_poolId: uint256, _borrowed: uint256, _startTime: uint256) -> uint256:
+  # interest is at the pool's rate until its end time, and double that after
+  params: PoolParams = self._params(_poolId)
+  doubleFrom: uint256 = min(max(_startTime, params.endTime), block.timestamp)
+  amount: uint256 = self._outstandingInterest(_borrowed, params.interestRate, _startTime, doubleFrom)
+  if params.endTime <= block.timestamp:
+    amount += self._outstandingInterest(_borrowed, 2 * params.interestRate, doubleFrom, block.timestamp)
+  return amount
+
+# interest accrued on the pool's loans (charged to them or not) and not yet repaid, up to now
+# computed from the pool's total borrowed, so it can differ from the sum over its loans by rounding (a few wei)
+@internal
+@view
+def _poolInterest(_poolId: uint256) -> uint256:
+  interest: uint256 = self.packedPools[_poolId].interest
+  return (interest << 128 >> 128) + self._interestSince(_poolId, self.packedPools[_poolId].funds >> 128, interest >> 128)
+
+# brings the pool's accrued interest up to now (before its total borrowed changes),
+# adding _movedIn and subtracting _removed (at most all of it) for interest transferred or repaid
+@internal
+def _accountPoolInterest(_poolId: uint256, _movedIn: uint256, _removed: uint256):
+  accrued: uint256 = self._poolInterest(_poolId) + _movedIn
+  self.packedPools[_poolId].interest = self._add(0, accrued - min(accrued, _removed), block.timestamp)
+
+@external
+@view
+def poolInterest(_poolId: uint256) -> uint256:
+  return self._poolInterest(_poolId)
+
+# charges the loan's accrued interest without logging it, returning the amount charged
+@internal
+def _accountInterest(_poolId: uint256, _node: address) -> uint256:
+  amount: uint256 = 0
+  accountedUntil: uint256 = self.packedLoans[_poolId][_node].accountedUntil
+  # nothing more has accrued if already charged in this block (e.g. earlier in this transaction)
+  if (accountedUntil << 192 >> 192) != block.timestamp:
+    amount = self._interestSince(_poolId, self.packedLoans[_poolId][_node].debt << 128 >> 128, accountedUntil << 192 >> 192)
+    if 0 < amount:
+      self._addDebt(_poolId, _node, 0, amount)
+    self.packedLoans[_poolId][_node].accountedUntil = (accountedUntil >> 64 << 64) | block.timestamp
+  return amount
+
 @internal
 def _chargeInterest(_poolId: uint256, _node: address):
-  borrowed: uint256 = self.loans[_poolId][_node].borrowed
-  startTime: uint256 = self.loans[_poolId][_node].accountedUntil
-  endTime: uint256 = self.params[_poolId].endTime
-  rate: uint8 = self.params[_poolId].interestRate
-  amount: uint256 = empty(uint256)
-  if block.timestamp < endTime:
-    amount += self._outstandingInterest(borrowed, rate, startTime, block.timestamp)
-  elif startTime < endTime:
-    amount += self._outstandingInterest(borrowed, rate, startTime, endTime)
-    amount += self._outstandingInterest(borrowed, 2 * rate, endTime, block.timestamp)
-  else:
-    amount += self._outstandingInterest(borrowed, 2 * rate, startTime, block.timestamp)
-  if 0 < amount:
-    self.loans[_poolId][_node].interestDue += amount
-    self.borrowers[_node].interestDue += amount
-  self.loans[_poolId][_node].accountedUntil = block.timestamp
-  log ChargeInterest(amount, self.borrowers[_node].interestDue)
+  amount: uint256 = self._accountInterest(_poolId, _node)
+  log ChargeInterest(amount, self.packedBorrowers[_node].debt >> 128)
 
 @internal
 @view
 def _loanEmpty(_poolId: uint256, _node: address) -> bool:
-  return (self.loans[_poolId][_node].borrowed == 0 and
-          self.loans[_poolId][_node].interestDue == 0)
+  return self.packedLoans[_poolId][_node].debt == 0
 
+# the loan's and the borrower's debt change together
 @internal
-def _lend(_poolId: uint256, _node: address, _amount: uint256):
+def _addDebt(_poolId: uint256, _node: address, _borrowed: uint256, _interest: uint256):
+  self.packedLoans[_poolId][_node].debt = self._add(self.packedLoans[_poolId][_node].debt, _borrowed, _interest)
+  self.packedBorrowers[_node].debt = self._add(self.packedBorrowers[_node].debt, _borrowed, _interest)
+
+@internal
+def _subDebt(_poolId: uint256, _node: address, _borrowed: uint256, _interest: uint256):
+  self.packedLoans[_poolId][_node].debt = self._sub(self.packedLoans[_poolId][_node].debt, _borrowed, _interest)
+  self.packedBorrowers[_node].debt = self._sub(self.packedBorrowers[_node].debt, _borrowed, _interest)
+
+@internal
+def _lend(_poolId: uint256, _node: address, _amount: uint256, _proof: DynArray[bytes32, MAX_PROOF_LENGTH]):
   if 0 < _amount:
-    assert (self.allowedToBorrow[_poolId][empty(address)] or
-            self.allowedToBorrow[_poolId][_node]), "r"
-    self.loans[_poolId][_node].borrowed += _amount
-    self.borrowers[_node].borrowed += _amount
-    self.pools[_poolId].available -= _amount
-    self.pools[_poolId].borrowed += _amount
+    self._checkAllowedToBorrow(_poolId, _node, _proof)
+    self._accountPoolInterest(_poolId, 0, 0)
+    self._addDebt(_poolId, _node, _amount, 0)
+    self.packedPools[_poolId].funds = self._add(self._sub(self.packedPools[_poolId].funds, _amount, 0), 0, _amount)
 
 @internal
 def _repayInterest(_poolId: uint256, _node: address, _amount: uint256) -> uint256:
   if 0 < _amount:
-    self.loans[_poolId][_node].interestDue -= _amount
-    self.borrowers[_node].interestDue -= _amount
-    self.pools[_poolId].available += _amount
+    self._accountPoolInterest(_poolId, 0, _amount)
+    self._subDebt(_poolId, _node, 0, _amount)
+    self.packedPools[_poolId].funds = self._add(self.packedPools[_poolId].funds, _amount, 0)
   return _amount
 
 @internal
 def _repay(_poolId: uint256, _node: address, _amount: uint256) -> uint256:
   if 0 < _amount:
-    self.loans[_poolId][_node].borrowed -= _amount
-    self.borrowers[_node].borrowed -= _amount
-    self.pools[_poolId].borrowed -= _amount
-    self.pools[_poolId].available += _amount
+    self._accountPoolInterest(_poolId, 0, 0)
+    self._subDebt(_poolId, _node, _amount, 0)
+    self.packedPools[_poolId].funds = self._sub(self._add(self.packedPools[_poolId].funds, _amount, 0), 0, _amount)
   return _amount
 
 @internal
 @view
 def _availableEther(_node: address) -> uint256:
-  return (staticcall self._getRocketNodeStaking().getNodeETHProvided(_node)
-          + staticcall self._getRocketNodeDeposit().getNodeEthBalance(_node)
-          + self.borrowers[_node].ETH)
-
-@internal
-@view
-def _availableRPL(_node: address) -> uint256:
-  return (staticcall self._getRocketNodeStaking().getNodeRPLStake(_node)
-          + self.borrowers[_node].RPL)
+  return (staticcall self.rocketNodeStaking.getNodeETHProvided(_node)
+          + staticcall self.rocketNodeDeposit.getNodeEthBalance(_node)
+          + (self.packedBorrowers[_node].balance >> 128))
 
 @internal
 @view
@@ -673,85 +999,149 @@ def _borrowLimit(_node: address) -> uint256:
           * oneEther
           * BORROW_LIMIT_PERCENT
           // 100
-          // staticcall self._getRocketNetworkPrices().getRPLPrice())
+          // staticcall self.rocketNetworkPrices.getRPLPrice())
 
 @internal
 @view
 def _debt(_node: address) -> uint256:
-  return self.borrowers[_node].borrowed + self.borrowers[_node].interestDue
+  debt: uint256 = self.packedBorrowers[_node].debt
+  return (debt << 128 >> 128) + (debt >> 128)
 
-@external
-def borrow(_poolId: uint256, _node: address, _prevIndex: uint256, _amount: uint256):
-  self._checkFromBorrower(_node)
-  assert block.timestamp < self.params[_poolId].endTime, "e"
-  self._stakeRPLFor(_node, _amount)
+# lends _amount from _poolId to _node without staking it or checking the borrow limit
+@internal
+def _borrow(_poolId: uint256, _node: address, _prevIndex: uint256, _amount: uint256,
+            _proof: DynArray[bytes32, MAX_PROOF_LENGTH]) -> uint256:
+  self._checkActive(_poolId)
   if self._loanEmpty(_poolId, _node):
     self._insertDebtPool(_node, _poolId, _prevIndex)
   self._chargeInterest(_poolId, _node)
-  self._lend(_poolId, _node, _amount)
-  assert 0 < self.loans[_poolId][_node].borrowed or 0 < self.loans[_poolId][_node].interestDue, "no"
-  assert self._debt(_node) <= self._borrowLimit(_node), "bl"
-  log Borrow(self.loans[_poolId][_node].borrowed,
-             self.loans[_poolId][_node].interestDue)
+  self._lend(_poolId, _node, _amount, _proof)
+  loanDebt: uint256 = self.packedLoans[_poolId][_node].debt
+  self._checkNonzero(loanDebt)
+  return loanDebt
+
+@internal
+@view
+def _checkBorrowLimit(_node: address, _multiple: uint256):
+  self._check(self._debt(_node) <= _multiple * self._borrowLimit(_node), "bl")
+
+# _proof is only needed if _node is allowed to borrow by the pool's allowedToBorrowRoot
+@external
+def borrow(_poolId: uint256, _node: address, _prevIndex: uint256, _amount: uint256,
+           _proof: DynArray[bytes32, MAX_PROOF_LENGTH] = []):
+  self._checkFromBorrower(_node)
+  self._stakeRPLFor(_node, _amount)
+  loanDebt: uint256 = self._borrow(_poolId, _node, _prevIndex, _amount, _proof)
+  self._checkBorrowLimit(_node, 1)
+  log Borrow(loanDebt << 128 >> 128, loanDebt >> 128)
+
+struct BorrowArgument:
+  poolId: uint256
+  prevIndex: uint256
+  amount: uint256
+  proof: DynArray[bytes32, MAX_PROOF_LENGTH] # as for borrow
+
+# the loans are made in order, so a prevIndex can refer to an item inserted by an earlier one
+@external
+def borrowMany(_node: address, _loans: DynArray[BorrowArgument, MAX_BORROW_BATCH]):
+  self._checkFromBorrower(_node)
+  total: uint256 = 0
+  for arg: BorrowArgument in _loans:
+    self._borrow(arg.poolId, _node, arg.prevIndex, arg.amount, arg.proof)
+    total += arg.amount
+  self._stakeRPLFor(_node, total)
+  self._checkBorrowLimit(_node, 1)
+  debt: uint256 = self.packedBorrowers[_node].debt
+  log BorrowMany(total, debt << 128 >> 128, debt >> 128)
+
+# takes _amount of RPL for a repayment: from the node's balance (plus _unstakeAmount) first if
+# the borrower is repaying, and the rest from the sender
+@internal
+def _obtainRPL(_node: address, _unstakeAmount: uint256, _amount: uint256):
+  if 0 < _unstakeAmount:
+    self._checkFromBorrower(_node)
+    self._withdrawRPL(_node, _unstakeAmount)
+  obtained: uint256 = 0
+  if msg.sender == self._borrowerAddress(_node):
+    balance: uint256 = self._add(self.packedBorrowers[_node].balance, _unstakeAmount, 0)
+    obtained = min(_amount, balance << 128 >> 128)
+    self.packedBorrowers[_node].balance = self._sub(balance, obtained, 0)
+  if obtained < _amount:
+    self._receiveRPL(_amount - obtained)
 
 @external
 def repay(_poolId: uint256, _node: address, _prevIndex: uint256, _unstakeAmount: uint256, _repayAmount: uint256):
-  isBorrower: bool = msg.sender == self.borrowers[_node].address
-  assert _unstakeAmount == 0 or isBorrower, "a"
   self._chargeInterest(_poolId, _node)
-  if 0 < _unstakeAmount:
-    extcall self._getRocketNodeStaking().withdrawRPL(_node, _unstakeAmount)
-    self.borrowers[_node].RPL += _unstakeAmount
   target: uint256 = _repayAmount
+  loanDebt: uint256 = self.packedLoans[_poolId][_node].debt
   if target == 0:
-    target = self.loans[_poolId][_node].interestDue + self.loans[_poolId][_node].borrowed
-  obtained: uint256 = 0
-  if isBorrower:
-    obtained = min(target, self.borrowers[_node].RPL)
-    self.borrowers[_node].RPL -= obtained
-  if obtained < target:
-    assert extcall RPL.transferFrom(msg.sender, self, target - obtained), "tf"
-    obtained = target
-  assert self._payDebt(_poolId, _node, _prevIndex, obtained) == 0, "o"
-  log Repay(obtained,
-            self.loans[_poolId][_node].borrowed,
-            self.loans[_poolId][_node].interestDue)
-
+    target = (loanDebt >> 128) + (loanDebt << 128 >> 128)
+  self._obtainRPL(_node, _unstakeAmount, target)
+  self._payDebtExactly(_poolId, _node, _prevIndex, target)
+  loanDebt = self.packedLoans[_poolId][_node].debt
+  log Repay(target, loanDebt << 128 >> 128, loanDebt >> 128)
+
+# pays up to _repayAmount (0 for all) of the node's debt, pool by pool in debtPools order (earliest end time first)
+# (interest before borrowed in each pool), obtaining only what is actually repaid
+@external
+def repayInOrder(_node: address, _unstakeAmount: uint256, _repayAmount: uint256):
+  target: uint256 = _repayAmount
+  if target == 0:
+    target = max_value(uint256)
+  amount: uint256 = target
+  prevIndex: uint256 = 0
+  index: uint256 = self.debtPools[_node][0].next
+  pools: uint256 = 0
+  for _: uint256 in range(MAX_POSITION_LOANS):
+    if index == 0 or amount == 0:
+      break
+    poolId: uint256 = self.debtPools[_node][index].poolId
+    nextIndex: uint256 = self.debtPools[_node][index].next
+    self._chargeInterest(poolId, _node)
+    amount = self._payDebt(poolId, _node, prevIndex, amount)
+    if not self._loanEmpty(poolId, _node):
+      prevIndex = index
+    index = nextIndex
+    pools += 1
+  repaid: uint256 = target - amount
+  self._obtainRPL(_node, _unstakeAmount, repaid)
+  debt: uint256 = self.packedBorrowers[_node].debt
+  log RepayInOrder(repaid, debt << 128 >> 128, debt >> 128, pools)
+
+# _toProof is as _proof for borrow from _toPool, and only needed if _fromAvailable is not 0
 @external
 def transferDebt(_node: address,
                  _fromPool: uint256, _fromPrevIndex: uint256,
                  _toPool: uint256, _toPrevIndex: uint256,
                  _fromInterest: uint256,
                  _fromBorrowed: uint256,
-                 _fromAvailable: uint256):
-  if msg.sender != self.borrowers[_node].address:
-    # not from borrower allowed only if:
-    # from lender, after end time, to a pool of no greater interest rate
-    assert (
-      msg.sender == self.pools[_fromPool].lenderAddress and
-      self.params[_fromPool].endTime < block.timestamp and
-      self.params[_toPool].interestRate <= self.params[_fromPool].interestRate
-    ), "a"
+                 _fromAvailable: uint256,
+                 _toProof: DynArray[bytes32, MAX_PROOF_LENGTH] = []):
+  # not from borrower allowed only if:
+  # from lender, after end time, to a pool of no greater interest rate
+  fromLender: uint256 = self.packedPools[_fromPool].lender
+  if not (msg.sender == self._addressOf(fromLender) and
+          fromLender << 32 >> 192 < block.timestamp and
+          self.packedPools[_toPool].lender >> 224 <= fromLender >> 224):
+    self._checkFromBorrower(_node)
   self._chargeInterest(_fromPool, _node)
-  assert block.timestamp < self.params[_toPool].endTime, "e"
+  self._checkActive(_toPool)
   if self._loanEmpty(_toPool, _node) and (0 < _fromInterest or
                                           0 < _fromBorrowed or
                                           0 < _fromAvailable):
     self._insertDebtPool(_node, _toPool, _toPrevIndex)
-  if 0 < _fromInterest:
-    assert self.pools[_fromPool].lenderAddress == self.pools[_toPool].lenderAddress, "l"
-    self.pools[_toPool].allowance -= _fromInterest
-    self.loans[_fromPool][_node].interestDue -= _fromInterest
-    self.loans[_toPool][_node].interestDue += _fromInterest
+  if 0 < _fromInterest or 0 < _fromBorrowed:
+    self._check(self._lenderAddress(_fromPool) == self._lenderAddress(_toPool), "l")
+    self._accountPoolInterest(_fromPool, 0, _fromInterest)
+    self._accountPoolInterest(_toPool, _fromInterest, 0)
+    self.packedPools[_toPool].extra = self._sub(self.packedPools[_toPool].extra, _fromInterest + _fromBorrowed, 0)
+    self.packedLoans[_fromPool][_node].debt = self._sub(self.packedLoans[_fromPool][_node].debt, _fromBorrowed, _fromInterest)
+    self.packedLoans[_toPool][_node].debt = self._add(self.packedLoans[_toPool][_node].debt, _fromBorrowed, _fromInterest)
   if 0 < _fromBorrowed:
-    assert self.pools[_fromPool].lenderAddress == self.pools[_toPool].lenderAddress, "l"
-    self.pools[_toPool].allowance -= _fromBorrowed
-    self.loans[_fromPool][_node].borrowed -= _fromBorrowed
-    self.loans[_toPool][_node].borrowed += _fromBorrowed
-    self.pools[_fromPool].borrowed -= _fromBorrowed
-    self.pools[_toPool].borrowed += _fromBorrowed
+    self.packedPools[_fromPool].funds = self._sub(self.packedPools[_fromPool].funds, 0, _fromBorrowed)
+    self.packedPools[_toPool].funds = self._add(self.packedPools[_toPool].funds, 0, _fromBorrowed)
   if 0 < _fromAvailable:
-    self._lend(_toPool, _node, _fromAvailable)
+    self._lend(_toPool, _node, _fromAvailable, _toProof)
     self._payDebt(_fromPool, _node, _fromPrevIndex, _fromAvailable)
   elif self._loanEmpty(_fromPool, _node):
     self._removeDebtPool(_node, _fromPool, _fromPrevIndex)
@@ -765,18 +1155,26 @@ def _claimMerkleRewards(
       _amountETH: DynArray[uint256, MAX_CLAIM_INTERVALS],
       _merkleProof: DynArray[DynArray[bytes32, MAX_PROOF_LENGTH], MAX_CLAIM_INTERVALS],
       _stakeAmount: uint256):
+  account: uint256 = self.packedBorrowers[_node].account
+  borrowerIndex: uint256 = account >> 160
+  balance: uint256 = self.packedBorrowers[_node].balance
+  amountRPL: uint256 = balance << 128 >> 128
+  amountETH: uint256 = balance >> 128
   i: uint256 = 0
   maxUnclaimedIndex: uint256 = 0
   for index: uint256 in _rewardIndex:
-    self.intervals[_node][index] = True
-    if index == self.borrowers[_node].index:
-      self.borrowers[_node].index = index + 1
-    self.borrowers[_node].RPL += _amountRPL[i]
-    self.borrowers[_node].ETH += _amountETH[i]
+    self.claimedIntervals[_node][index >> 8] |= 1 << (index & 255)
+    if index == borrowerIndex:
+      borrowerIndex = index + 1
+    amountRPL += _amountRPL[i]
+    amountETH += _amountETH[i]
     maxUnclaimedIndex = max(index + 1, maxUnclaimedIndex)
     i += 1
-  self.borrowers[_node].RPL -= _stakeAmount
-  distributor: RocketMerkleDistributorInterface = self._getMerkleDistributor()
+  amountRPL -= _stakeAmount
+  self._check(amountRPL <= lowMask and amountETH <= lowMask, "ov")
+  self.packedBorrowers[_node].balance = amountRPL | (amountETH << 128)
+  self.packedBorrowers[_node].account = (account << 96 >> 96) | (borrowerIndex << 160)
+  distributor: RocketMerkleDistributorInterface = self.rocketMerkleDistributor
   self.allowPaymentsFrom = distributor.address
   extcall distributor.claimAndStake(_node, _rewardIndex, _amountRPL, _amountETH, _merkleProof, _stakeAmount)
   self.allowPaymentsFrom = empty(address)
@@ -793,7 +1191,9 @@ def claimMerkleRewards(
     ):
   self._checkFromBorrower(_node)
   self._claimMerkleRewards(_node, _rewardIndex, _amountRPL, _amountETH, _merkleProof, _stakeAmount)
-  log ClaimRewards(self.borrowers[_node].RPL, self.borrowers[_node].ETH, self.borrowers[_node].index)
+  log ClaimRewards(self.packedBorrowers[_node].balance << 128 >> 128,
+                   self.packedBorrowers[_node].balance >> 128,
+                   self.packedBorrowers[_node].account >> 160)
 
 flag MinipoolAction:
   Distribute
@@ -804,6 +1204,7 @@ struct MinipoolArgument:
   index: uint256
   action: MinipoolAction
 
+# collect the node's ETH from its fee distributor and minipools into its balance, returning the amount
 @internal
 def _claim(
   _node: address,
@@ -813,18 +1214,18 @@ def _claim(
   total: uint256 = 0
   balance: uint256 = self.balance
   if _dist:
-    distributor: RocketNodeDistributorInterface = self._getNodeDistributor(_node)
+    distributor: RocketNodeDistributorInterface = RocketNodeDistributorInterface(staticcall self.rocketNodeDistributorFactory.getProxyAddress(_node))
     nodeShare: uint256 = staticcall distributor.getNodeShare()
-    self.borrowers[_node].ETH += nodeShare
+    self.packedBorrowers[_node].balance = self._add(self.packedBorrowers[_node].balance, 0, nodeShare)
     self.allowPaymentsFrom = distributor.address
     extcall distributor.distribute()
-    assert balance + nodeShare == self.balance, "b"
+    self._check(balance + nodeShare == self.balance, "b")
     total += nodeShare
   if len(_args) == 0:
     self.allowPaymentsFrom = empty(address)
     return total
   minipool: address = empty(address)
-  manager: RocketMinipoolManagerInterface = self._getMinipoolManager()
+  manager: RocketMinipoolManagerInterface = self.rocketMinipoolManager
   balance = self.balance
   for arg: MinipoolArgument in _args:
     minipool = staticcall manager.getNodeMinipoolAt(_node, arg.index)
@@ -834,49 +1235,60 @@ def _claim(
     if MinipoolAction.Distribute in arg.action:
       extcall MinipoolInterface(minipool).distributeBalance(MinipoolAction.NotRewardsOnly not in arg.action)
   self.allowPaymentsFrom = empty(address)
-  total += self.balance - balance
+  balance = self.balance - balance
+  self.packedBorrowers[_node].balance = self._add(self.packedBorrowers[_node].balance, 0, balance)
+  total += balance
   return total
 
 @external
 def distributeRefund(_node: address,
                      _distribute: bool,
                      _minipools: DynArray[MinipoolArgument, MAX_NODE_MINIPOOLS]):
-  needCheckFromBorrower: bool = False
   for arg: MinipoolArgument in _minipools:
     if MinipoolAction.NotRewardsOnly in arg.action or MinipoolAction.Refund in arg.action:
-      needCheckFromBorrower = True
+      self._checkFromBorrower(_node)
       break
-  if needCheckFromBorrower:
-    self._checkFromBorrower(_node)
   total: uint256 = self._claim(_node, _distribute, _minipools)
-  self.borrowers[_node].ETH += total
-  log DistributeRefund(total, self.borrowers[_node].ETH)
+  log DistributeRefund(total, self.packedBorrowers[_node].balance >> 128)
 
 @external
 def withdraw(_node: address, _amountRPL: uint256, _amountETH: uint256):
   self._checkFromBorrower(_node)
-  assert (self.debtPools[_node][0].next == 0 or
-          block.timestamp < self.params[self.debtPools[_node][self.debtPools[_node][0].next].poolId].endTime), "f"
+  first: uint256 = self.debtPools[_node][0].next
+  self._check(first == 0 or block.timestamp < self._endTime(self.debtPools[_node][first].poolId), "f")
+  balance: uint256 = self.packedBorrowers[_node].balance
   if 0 < _amountRPL:
-    self.borrowers[_node].RPL -= _amountRPL
-    assert extcall RPL.transfer(msg.sender, _amountRPL), "t"
-  assert self._debt(_node) <= self._availableRPL(_node), "d"
+    balance = self._sub(balance, _amountRPL, 0)
+    self.packedBorrowers[_node].balance = balance
+    self._sendRPL(_amountRPL)
+  debt: uint256 = self._debt(_node)
+  self._check(debt <= staticcall self.rocketNodeStaking.getNodeRPLStake(_node) + (balance << 128 >> 128), "d")
   if 0 < _amountETH:
-    self.borrowers[_node].ETH -= _amountETH
-    assert self._debt(_node) <= 2 * self._borrowLimit(_node), "bl"
+    balance = self._sub(balance, 0, _amountETH)
+    self.packedBorrowers[_node].balance = balance
+    self._checkBorrowLimit(_node, 2)
     send(msg.sender, _amountETH, gas=msg.gas)
-  log Withdraw(self.borrowers[_node].RPL, self.borrowers[_node].ETH)
+  log Withdraw(balance << 128 >> 128, balance >> 128)
 
 @external
 def stakeRPLFor(_node: address, _amount: uint256):
   self._checkFromBorrower(_node)
-  self.borrowers[_node].RPL -= _amount
+  balance: uint256 = self._sub(self.packedBorrowers[_node].balance, _amount, 0)
+  self.packedBorrowers[_node].balance = balance
   self._stakeRPLFor(_node, _amount)
-  log StakeRPLFor(self.borrowers[_node].RPL)
+  log StakeRPLFor(balance << 128 >> 128)
 
 @external
 def depositETHFor(_node: address, _amount: uint256):
   self._checkFromBorrower(_node)
-  self.borrowers[_node].ETH -= _amount
-  extcall self._getRocketNodeDeposit().depositEthFor(_node, value=_amount)
-  log DepositETHFor(self.borrowers[_node].ETH)
+  balance: uint256 = self._sub(self.packedBorrowers[_node].balance, 0, _amount)
+  self.packedBorrowers[_node].balance = balance
+  extcall self.rocketNodeDeposit.depositEthFor(_node, value=_amount)
+  log DepositETHFor(balance >> 128)
+
+# Batching
+
+@external
+def multicall(_calls: DynArray[Bytes[MAX_CALL_SIZE], MAX_MULTICALL]):
+  for i: uint256 in range(len(_calls), bound=MAX_MULTICALL):
+    raw_call(self, _calls[i], is_delegate_call=True)
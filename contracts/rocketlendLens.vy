@@ -0,0 +1,151 @@
+#pragma version ~=0.4.3
+#pragma evm-version cancun
+
+# Read-only views over a rocketlend contract, built only from its public state
+# (kept out of rocketlend.vy so that stays under the 24576-byte limit, EIP-170)
+
+MAX_POSITION_LOANS: constant(uint256) = 64
+MAX_PAGE_SIZE: constant(uint256) = 256
+BORROW_LIMIT_PERCENT: constant(uint256) = 50
+SECONDS_PER_YEAR: constant(uint256) = 365 * 24 * 60 * 60
+oneEther: constant(uint256) = 10 ** 18
+
+struct PoolParams:
+  interestRate: uint8
+  endTime: uint256
+
+struct PoolState:
+  available: uint256
+  borrowed: uint256
+  allowance: uint256
+  reclaimed: uint256
+  lenderAddress: address
+  pendingLenderAddress: address
+
+struct LoanState:
+  borrowed: uint256
+  interestDue: uint256
+  accountedUntil: uint256
+
+struct BorrowerState:
+  borrowed: uint256
+  interestDue: uint256
+  RPL: uint256
+  ETH: uint256
+  index: uint256
+  address: address
+  pending: address
+
+struct PoolItem:
+  next: uint256
+  poolId: uint256
+
+interface RocketlendInterface:
+  def nextPoolId() -> uint256: view
+  def params(_poolId: uint256) -> PoolParams: view
+  def pools(_poolId: uint256) -> PoolState: view
+  def loans(_poolId: uint256, _node: address) -> LoanState: view
+  def borrowers(_node: address) -> BorrowerState: view
+  def poolNodes(_poolId: uint256, _index: uint256) -> address: view
+  def poolNodeCount(_poolId: uint256) -> uint256: view
+  def debtPools(_node: address, _index: uint256) -> PoolItem: view
+  def rocketNodeStaking() -> address: view
+  def rocketNodeDeposit() -> address: view
+  def rocketNetworkPrices() -> address: view
+
+interface RocketNodeStakingInterface:
+  def getNodeETHProvided(_nodeAddress: address) -> uint256: view
+
+interface RocketNodeDepositInterface:
+  def getNodeEthBalance(_nodeAddress: address) -> uint256: view
+
+interface RocketNetworkPricesInterface:
+  def getRPLPrice() -> uint256: view
+
+rocketlend: public(immutable(RocketlendInterface))
+
+@deploy
+def __init__(_rocketlend: address):
+  rocketlend = RocketlendInterface(_rocketlend)
+
+struct PoolInfo:
+  params: PoolParams
+  state: PoolState
+
+@external
+@view
+def getPools(_start: uint256, _count: uint256) -> DynArray[PoolInfo, MAX_PAGE_SIZE]:
+  result: DynArray[PoolInfo, MAX_PAGE_SIZE] = []
+  end: uint256 = min(_start + min(_count, MAX_PAGE_SIZE), staticcall rocketlend.nextPoolId())
+  for poolId: uint256 in range(_start, end, bound=MAX_PAGE_SIZE):
+    result.append(PoolInfo(params=staticcall rocketlend.params(poolId), state=staticcall rocketlend.pools(poolId)))
+  return result
+
+struct PoolLoan:
+  node: address
+  loan: LoanState
+
+@external
+@view
+def getPoolLoans(_poolId: uint256, _start: uint256, _count: uint256) -> DynArray[PoolLoan, MAX_PAGE_SIZE]:
+  result: DynArray[PoolLoan, MAX_PAGE_SIZE] = []
+  end: uint256 = min(_start + min(_count, MAX_PAGE_SIZE), staticcall rocketlend.poolNodeCount(_poolId))
+  for i: uint256 in range(_start, end, bound=MAX_PAGE_SIZE):
+    node: address = staticcall rocketlend.poolNodes(_poolId, i)
+    result.append(PoolLoan(node=node, loan=staticcall rocketlend.loans(_poolId, node)))
+  return result
+
+# as rocketlend charges it: at the pool's rate until its end time, and double that after
+@internal
+@pure
+def _interestSince(_borrowed: uint256, _params: PoolParams, _startTime: uint256, _now: uint256) -> uint256:
+  doubleFrom: uint256 = min(max(_startTime, _params.endTime), _now)
+  rate: uint256 = convert(_params.interestRate, uint256)
+  return (_borrowed * rate * (doubleFrom - _startTime) // 100 // SECONDS_PER_YEAR +
+          _borrowed * 2 * rate * (_now - doubleFrom) // 100 // SECONDS_PER_YEAR)
+
+struct LoanPosition:
+  poolId: uint256
+  borrowed: uint256 # RPL currently borrowed
+  interestDue: uint256 # interest accumulated (and not yet paid), including ongoing until now
+  endTime: uint256 # the pool's end time
+
+struct Position:
+  loans: DynArray[LoanPosition, MAX_POSITION_LOANS] # in debtPools order, i.e. by end time
+  more: uint256 # if not 0, there are more loans after these: pass this as _prevIndex for them
+  borrowLimit: uint256 # limit on total RPL borrowed
+  RPL: uint256 # RPL available for repayments and/or withdrawal
+  ETH: uint256 # ETH available for liquidation and/or withdrawal
+
+# the loans are those after item _prevIndex in the node's debtPools (0 for all of them)
+@external
+@view
+def position(_node: address, _prevIndex: uint256) -> Position:
+  index: uint256 = (staticcall rocketlend.debtPools(_node, _prevIndex)).next
+  # a removed item points to itself
+  assert _prevIndex == 0 or index != _prevIndex, "i"
+  loans: DynArray[LoanPosition, MAX_POSITION_LOANS] = []
+  more: uint256 = 0
+  for _: uint256 in range(MAX_POSITION_LOANS):
+    if index == 0:
+      break
+    item: PoolItem = staticcall rocketlend.debtPools(_node, index)
+    params: PoolParams = staticcall rocketlend.params(item.poolId)
+    loan: LoanState = staticcall rocketlend.loans(item.poolId, _node)
+    loans.append(LoanPosition(poolId=item.poolId,
+                              borrowed=loan.borrowed,
+                              interestDue=loan.interestDue + self._interestSince(
+                                loan.borrowed, params, loan.accountedUntil, block.timestamp),
+                              endTime=params.endTime))
+    more = index
+    index = item.next
+  if index == 0:
+    more = 0
+  borrower: BorrowerState = staticcall rocketlend.borrowers(_node)
+  availableEther: uint256 = (
+    staticcall RocketNodeStakingInterface(staticcall rocketlend.rocketNodeStaking()).getNodeETHProvided(_node) +
+    staticcall RocketNodeDepositInterface(staticcall rocketlend.rocketNodeDeposit()).getNodeEthBalance(_node) +
+    borrower.ETH)
+  borrowLimit: uint256 = (availableEther * oneEther * BORROW_LIMIT_PERCENT // 100 //
+                          staticcall RocketNetworkPricesInterface(staticcall rocketlend.rocketNetworkPrices()).getRPLPrice())
+  return Position(loans=loans, more=more, borrowLimit=borrowLimit, RPL=borrower.RPL, ETH=borrower.ETH)
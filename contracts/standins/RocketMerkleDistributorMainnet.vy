@@ -0,0 +1,110 @@
+#pragma version ~=0.4.0
+#pragma evm-version cancun
+
+# Local stand-in for Rocket Pool's RocketMerkleDistributorMainnet (for tests without a fork)
+# Holds the RPL and ETH it pays out itself; merkle roots are set directly per interval.
+# Leaves and proofs follow Rocket Pool: keccak256(node, network, amountRPL, amountETH) with sorted pairs.
+
+MAX_CLAIM_INTERVALS: constant(uint256) = 128
+MAX_PROOF_LENGTH: constant(uint256) = 32
+
+interface RocketStorageInterface:
+  def getAddress(_key: bytes32) -> address: view
+  def getNodeWithdrawalAddress(_nodeAddress: address) -> address: view
+
+interface RPLInterface:
+  def transfer(_to: address, _value: uint256) -> bool: nonpayable
+  def approve(_spender: address, _value: uint256) -> bool: nonpayable
+rocketTokenRPLKey: constant(bytes32) = keccak256("contract.addressrocketTokenRPL")
+
+interface RocketNodeManagerInterface:
+  def getNodeRPLWithdrawalAddress(_nodeAddress: address) -> address: view
+rocketNodeManagerKey: constant(bytes32) = keccak256("contract.addressrocketNodeManager")
+
+interface RocketNodeStakingInterface:
+  def stakeRPLFor(_nodeAddress: address, _amount: uint256): nonpayable
+rocketNodeStakingKey: constant(bytes32) = keccak256("contract.addressrocketNodeStaking")
+
+rocketStorage: public(immutable(RocketStorageInterface))
+
+merkleRoots: public(HashMap[uint256, bytes32])
+claimed: HashMap[uint256, HashMap[address, bool]]
+
+event RewardsClaimed:
+  claimer: indexed(address)
+  rewardIndex: DynArray[uint256, MAX_CLAIM_INTERVALS]
+  amountRPL: DynArray[uint256, MAX_CLAIM_INTERVALS]
+  amountETH: DynArray[uint256, MAX_CLAIM_INTERVALS]
+
+@deploy
+def __init__(_rocketStorage: address):
+  rocketStorage = RocketStorageInterface(_rocketStorage)
+
+@external
+@payable
+def __default__():
+  pass
+
+@external
+def setMerkleRoot(_rewardIndex: uint256, _root: bytes32):
+  self.merkleRoots[_rewardIndex] = _root
+
+@external
+@view
+def isClaimed(_rewardIndex: uint256, _nodeAddress: address) -> bool:
+  return self.claimed[_rewardIndex][_nodeAddress]
+
+@external
+def setClaimed(_rewardIndex: uint256, _nodeAddress: address, _claimed: bool):
+  self.claimed[_rewardIndex][_nodeAddress] = _claimed
+
+@internal
+@pure
+def _verify(_leaf: bytes32, _proof: DynArray[bytes32, MAX_PROOF_LENGTH], _root: bytes32) -> bool:
+  computed: bytes32 = _leaf
+  for sibling: bytes32 in _proof:
+    if convert(computed, uint256) < convert(sibling, uint256):
+      computed = keccak256(concat(computed, sibling))
+    else:
+      computed = keccak256(concat(sibling, computed))
+  return computed == _root
+
+@external
+def claimAndStake(_nodeAddress: address,
+                  _rewardIndex: DynArray[uint256, MAX_CLAIM_INTERVALS],
+                  _amountRPL: DynArray[uint256, MAX_CLAIM_INTERVALS],
+                  _amountETH: DynArray[uint256, MAX_CLAIM_INTERVALS],
+                  _merkleProof: DynArray[DynArray[bytes32, MAX_PROOF_LENGTH], MAX_CLAIM_INTERVALS],
+                  _stakeAmount: uint256):
+  withdrawalAddress: address = staticcall rocketStorage.getNodeWithdrawalAddress(_nodeAddress)
+  rplWithdrawalAddress: address = staticcall RocketNodeManagerInterface(
+    staticcall rocketStorage.getAddress(rocketNodeManagerKey)
+  ).getNodeRPLWithdrawalAddress(_nodeAddress)
+  assert (msg.sender == _nodeAddress or
+          msg.sender == withdrawalAddress or
+          msg.sender == rplWithdrawalAddress), "Can only claim from node or withdrawal address"
+  totalRPL: uint256 = 0
+  totalETH: uint256 = 0
+  i: uint256 = 0
+  for index: uint256 in _rewardIndex:
+    assert not self.claimed[index][_nodeAddress], "Already claimed"
+    leaf: bytes32 = keccak256(concat(convert(_nodeAddress, bytes20),
+                                     convert(0, bytes32),
+                                     convert(_amountRPL[i], bytes32),
+                                     convert(_amountETH[i], bytes32)))
+    assert self._verify(leaf, _merkleProof[i], self.merkleRoots[index]), "Invalid proof"
+    self.claimed[index][_nodeAddress] = True
+    totalRPL += _amountRPL[i]
+    totalETH += _amountETH[i]
+    i += 1
+  assert _stakeAmount <= totalRPL, "Invalid stake amount"
+  rpl: RPLInterface = RPLInterface(staticcall rocketStorage.getAddress(rocketTokenRPLKey))
+  if 0 < _stakeAmount:
+    rocketNodeStaking: address = staticcall rocketStorage.getAddress(rocketNodeStakingKey)
+    assert extcall rpl.approve(rocketNodeStaking, _stakeAmount), "ap"
+    extcall RocketNodeStakingInterface(rocketNodeStaking).stakeRPLFor(_nodeAddress, _stakeAmount)
+  if _stakeAmount < totalRPL:
+    assert extcall rpl.transfer(rplWithdrawalAddress, totalRPL - _stakeAmount), "t"
+  if 0 < totalETH:
+    raw_call(withdrawalAddress, b"", value=totalETH)
+  log RewardsClaimed(_nodeAddress, _rewardIndex, _amountRPL, _amountETH)
@@ -0,0 +1,121 @@
+#pragma version ~=0.4.0
+#pragma evm-version cancun
+
+# Local stand-in for a Rocket Pool minipool (RocketMinipoolDelegate, for tests without a fork)
+# Bond and commission are fixed at 8 ETH and 14%; the user share is sent to the rETH address.
+
+LAUNCH_BALANCE: constant(uint256) = 32 * 10 ** 18
+NODE_BOND: constant(uint256) = 8 * 10 ** 18
+NODE_FEE_PERCENT: constant(uint256) = 14
+
+STATUS_STAKING: constant(uint8) = 2
+STATUS_WITHDRAWABLE: constant(uint8) = 3
+STATUS_DISSOLVED: constant(uint8) = 4
+
+interface RocketStorageInterface:
+  def getAddress(_key: bytes32) -> address: view
+  def getNodeWithdrawalAddress(_nodeAddress: address) -> address: view
+rocketTokenRETHKey: constant(bytes32) = keccak256("contract.addressrocketTokenRETH")
+
+rocketStorage: immutable(RocketStorageInterface)
+nodeAddress: immutable(address)
+
+status: uint8
+finalised: bool
+nodeRefundBalance: uint256
+
+event EtherWithdrawalProcessed:
+  executed: indexed(address)
+  nodeAmount: uint256
+  userAmount: uint256
+  totalBalance: uint256
+
+@deploy
+def __init__(_rocketStorage: address, _nodeAddress: address):
+  rocketStorage = RocketStorageInterface(_rocketStorage)
+  nodeAddress = _nodeAddress
+  self.status = STATUS_STAKING
+
+@external
+@payable
+def __default__():
+  pass
+
+@external
+@view
+def getNodeAddress() -> address:
+  return nodeAddress
+
+@external
+@view
+def getStatus() -> uint8:
+  return self.status
+
+@external
+def setStatus(_status: uint8):
+  self.status = _status
+
+@external
+@view
+def getFinalised() -> bool:
+  return self.finalised
+
+@external
+@view
+def getNodeDepositBalance() -> uint256:
+  return NODE_BOND
+
+@external
+@view
+def getUserDepositBalance() -> uint256:
+  return LAUNCH_BALANCE - NODE_BOND
+
+@external
+@view
+def getNodeRefundBalance() -> uint256:
+  return self.nodeRefundBalance
+
+@internal
+def _refund(_withdrawalAddress: address):
+  amount: uint256 = self.nodeRefundBalance
+  self.nodeRefundBalance = 0
+  raw_call(_withdrawalAddress, b"", value=amount)
+
+@external
+def refund():
+  withdrawalAddress: address = staticcall rocketStorage.getNodeWithdrawalAddress(nodeAddress)
+  assert msg.sender == nodeAddress or msg.sender == withdrawalAddress, "Invalid minipool owner"
+  assert 0 < self.nodeRefundBalance, "No amount of the node deposit is available for refund"
+  self._refund(withdrawalAddress)
+
+@internal
+@pure
+def _nodeRewards(_rewards: uint256) -> uint256:
+  return _rewards * (NODE_BOND + (LAUNCH_BALANCE - NODE_BOND) * NODE_FEE_PERCENT // 100) // LAUNCH_BALANCE
+
+@external
+def distributeBalance(_rewardsOnly: bool):
+  withdrawalAddress: address = staticcall rocketStorage.getNodeWithdrawalAddress(nodeAddress)
+  ownerCalling: bool = msg.sender == nodeAddress or msg.sender == withdrawalAddress
+  assert self.status == STATUS_STAKING, "Minipool must be staking"
+  totalBalance: uint256 = self.balance - self.nodeRefundBalance
+  if _rewardsOnly:
+    assert totalBalance < NODE_BOND, "Balance exceeds 8 ether"
+  nodeAmount: uint256 = 0
+  if NODE_BOND <= totalBalance:
+    assert ownerCalling, "Only owner can distribute right now"
+    userCapital: uint256 = LAUNCH_BALANCE - NODE_BOND
+    if userCapital < totalBalance:
+      principal: uint256 = min(totalBalance, LAUNCH_BALANCE)
+      nodeAmount = principal - userCapital + self._nodeRewards(totalBalance - principal)
+    self.status = STATUS_WITHDRAWABLE
+    self.finalised = True
+  else:
+    nodeAmount = self._nodeRewards(totalBalance)
+  userAmount: uint256 = totalBalance - nodeAmount
+  self.nodeRefundBalance += nodeAmount
+  if 0 < userAmount:
+    raw_call(staticcall rocketStorage.getAddress(rocketTokenRETHKey), b"", value=userAmount)
+  log EtherWithdrawalProcessed(msg.sender, nodeAmount, userAmount, totalBalance)
+  if ownerCalling and 0 < self.nodeRefundBalance:
+    self._refund(withdrawalAddress)
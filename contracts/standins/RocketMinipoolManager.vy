@@ -0,0 +1,44 @@
+#pragma version ~=0.4.0
+#pragma evm-version cancun
+
+# Local stand-in for Rocket Pool's RocketMinipoolManager (for tests without a fork)
+# Minipools are deployed separately and recorded here with addMinipool.
+
+MAX_NODE_MINIPOOLS: constant(uint256) = 2048
+STATUS_STAKING: constant(uint8) = 2
+
+interface MinipoolInterface:
+  def getStatus() -> uint8: view
+
+nodeMinipools: HashMap[address, HashMap[uint256, address]]
+nodeMinipoolCount: HashMap[address, uint256]
+
+event MinipoolCreated:
+  minipool: indexed(address)
+  node: indexed(address)
+
+@external
+def addMinipool(_nodeAddress: address, _minipool: address):
+  index: uint256 = self.nodeMinipoolCount[_nodeAddress]
+  self.nodeMinipools[_nodeAddress][index] = _minipool
+  self.nodeMinipoolCount[_nodeAddress] = index + 1
+  log MinipoolCreated(_minipool, _nodeAddress)
+
+@external
+@view
+def getNodeMinipoolCount(_nodeAddress: address) -> uint256:
+  return self.nodeMinipoolCount[_nodeAddress]
+
+@external
+@view
+def getNodeMinipoolAt(_nodeAddress: address, _index: uint256) -> address:
+  return self.nodeMinipools[_nodeAddress][_index]
+
+@external
+@view
+def getNodeActiveMinipoolCount(_nodeAddress: address) -> uint256:
+  count: uint256 = 0
+  for index: uint256 in range(self.nodeMinipoolCount[_nodeAddress], bound=MAX_NODE_MINIPOOLS):
+    if staticcall MinipoolInterface(self.nodeMinipools[_nodeAddress][index]).getStatus() <= STATUS_STAKING:
+      count += 1
+  return count
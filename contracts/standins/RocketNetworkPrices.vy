@@ -0,0 +1,19 @@
+#pragma version ~=0.4.0
+#pragma evm-version cancun
+
+# Local stand-in for Rocket Pool's RocketNetworkPrices (for tests without a fork)
+
+rplPrice: uint256 # ETH per RPL, 18 decimals
+
+@deploy
+def __init__(_rplPrice: uint256):
+  self.rplPrice = _rplPrice
+
+@external
+@view
+def getRPLPrice() -> uint256:
+  return self.rplPrice
+
+@external
+def setRPLPrice(_rplPrice: uint256):
+  self.rplPrice = _rplPrice
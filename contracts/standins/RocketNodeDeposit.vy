@@ -0,0 +1,22 @@
+#pragma version ~=0.4.0
+#pragma evm-version cancun
+
+# Local stand-in for Rocket Pool's RocketNodeDeposit (for tests without a fork)
+
+nodeEthBalances: HashMap[address, uint256]
+
+event DepositFor:
+  node: indexed(address)
+  sender: indexed(address)
+  amount: uint256
+
+@external
+@payable
+def depositEthFor(_nodeAddress: address):
+  self.nodeEthBalances[_nodeAddress] += msg.value
+  log DepositFor(_nodeAddress, msg.sender, msg.value)
+
+@external
+@view
+def getNodeEthBalance(_nodeAddress: address) -> uint256:
+  return self.nodeEthBalances[_nodeAddress]
@@ -0,0 +1,59 @@
+#pragma version ~=0.4.0
+#pragma evm-version cancun
+
+# Local stand-in for Rocket Pool's RocketNodeDistributorDelegate (for tests without a fork)
+# Used behind minimal proxies created by the RocketNodeDistributorFactory stand-in.
+# The node share is fixed as if every minipool had an 8 ETH bond and 14% commission.
+
+LAUNCH_BALANCE: constant(uint256) = 32 * 10 ** 18
+NODE_BOND: constant(uint256) = 8 * 10 ** 18
+NODE_FEE_PERCENT: constant(uint256) = 14
+
+interface RocketStorageInterface:
+  def getAddress(_key: bytes32) -> address: view
+  def getNodeWithdrawalAddress(_nodeAddress: address) -> address: view
+rocketTokenRETHKey: constant(bytes32) = keccak256("contract.addressrocketTokenRETH")
+
+rocketStorage: public(RocketStorageInterface)
+nodeAddress: public(address)
+
+event FeesDistributed:
+  node: indexed(address)
+  userAmount: uint256
+  nodeAmount: uint256
+
+@external
+@payable
+def __default__():
+  pass
+
+@external
+def initialise(_rocketStorage: address, _nodeAddress: address):
+  assert self.nodeAddress == empty(address), "Already initialised"
+  self.rocketStorage = RocketStorageInterface(_rocketStorage)
+  self.nodeAddress = _nodeAddress
+
+@internal
+@view
+def _getNodeShare() -> uint256:
+  return self.balance * (NODE_BOND + (LAUNCH_BALANCE - NODE_BOND) * NODE_FEE_PERCENT // 100) // LAUNCH_BALANCE
+
+@external
+@view
+def getNodeShare() -> uint256:
+  return self._getNodeShare()
+
+@external
+@view
+def getUserShare() -> uint256:
+  return self.balance - self._getNodeShare()
+
+@external
+def distribute():
+  nodeShare: uint256 = self._getNodeShare()
+  userShare: uint256 = self.balance - nodeShare
+  if 0 < userShare:
+    raw_call(staticcall self.rocketStorage.getAddress(rocketTokenRETHKey), b"", value=userShare)
+  if 0 < nodeShare:
+    raw_call(staticcall self.rocketStorage.getNodeWithdrawalAddress(self.nodeAddress), b"", value=nodeShare)
+  log FeesDistributed(self.nodeAddress, userShare, nodeShare)
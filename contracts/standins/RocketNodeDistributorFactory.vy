@@ -0,0 +1,35 @@
+#pragma version ~=0.4.0
+#pragma evm-version cancun
+
+# Local stand-in for Rocket Pool's RocketNodeDistributorFactory (for tests without a fork)
+# Proxies are recorded per node instead of living at a CREATE2-derived address.
+
+interface RocketNodeDistributorInterface:
+  def initialise(_rocketStorage: address, _nodeAddress: address): nonpayable
+
+rocketStorage: public(immutable(address))
+distributorDelegate: public(immutable(address))
+
+proxies: HashMap[address, address]
+
+event ProxyCreated:
+  node: indexed(address)
+  proxy: address
+
+@deploy
+def __init__(_rocketStorage: address, _distributorDelegate: address):
+  rocketStorage = _rocketStorage
+  distributorDelegate = _distributorDelegate
+
+@external
+@view
+def getProxyAddress(_nodeAddress: address) -> address:
+  return self.proxies[_nodeAddress]
+
+@external
+def createProxy(_nodeAddress: address):
+  assert self.proxies[_nodeAddress] == empty(address), "Proxy already exists"
+  proxy: address = create_minimal_proxy_to(distributorDelegate)
+  extcall RocketNodeDistributorInterface(proxy).initialise(rocketStorage, _nodeAddress)
+  self.proxies[_nodeAddress] = proxy
+  log ProxyCreated(_nodeAddress, proxy)
@@ -0,0 +1,121 @@
+#pragma version ~=0.4.0
+#pragma evm-version cancun
+
+# Local stand-in for Rocket Pool's RocketNodeManager (for tests without a fork)
+
+interface RocketStorageInterface:
+  def getAddress(_key: bytes32) -> address: view
+  def getNodeWithdrawalAddress(_nodeAddress: address) -> address: view
+
+interface RocketNodeDistributorFactoryInterface:
+  def createProxy(_nodeAddress: address): nonpayable
+rocketNodeDistributorFactoryKey: constant(bytes32) = keccak256("contract.addressrocketNodeDistributorFactory")
+
+rocketStorage: public(immutable(RocketStorageInterface))
+
+nodeCount: uint256
+nodes: HashMap[uint256, address]
+nodeExists: HashMap[address, bool]
+timezoneLocations: HashMap[address, String[64]]
+rplWithdrawalAddresses: HashMap[address, address]
+pendingRPLWithdrawalAddresses: HashMap[address, address]
+
+event NodeRegistered:
+  node: indexed(address)
+
+event NodeRPLWithdrawalAddressSet:
+  node: indexed(address)
+  withdrawalAddress: indexed(address)
+
+event NodeRPLWithdrawalAddressUnset:
+  node: indexed(address)
+
+@deploy
+def __init__(_rocketStorage: address):
+  rocketStorage = RocketStorageInterface(_rocketStorage)
+
+@external
+def registerNode(_timezoneLocation: String[64]):
+  assert not self.nodeExists[msg.sender], "The node is already registered in the Rocket Pool network"
+  self.nodeExists[msg.sender] = True
+  self.timezoneLocations[msg.sender] = _timezoneLocation
+  self.nodes[self.nodeCount] = msg.sender
+  self.nodeCount += 1
+  extcall RocketNodeDistributorFactoryInterface(
+    staticcall rocketStorage.getAddress(rocketNodeDistributorFactoryKey)
+  ).createProxy(msg.sender)
+  log NodeRegistered(msg.sender)
+
+@external
+@view
+def getNodeCount() -> uint256:
+  return self.nodeCount
+
+@external
+@view
+def getNodeAt(_index: uint256) -> address:
+  return self.nodes[_index]
+
+@external
+@view
+def getNodeExists(_nodeAddress: address) -> bool:
+  return self.nodeExists[_nodeAddress]
+
+@external
+@view
+def getNodeTimezoneLocation(_nodeAddress: address) -> String[64]:
+  return self.timezoneLocations[_nodeAddress]
+
+@internal
+@view
+def _getNodeRPLWithdrawalAddress(_nodeAddress: address) -> address:
+  rplWithdrawalAddress: address = self.rplWithdrawalAddresses[_nodeAddress]
+  if rplWithdrawalAddress == empty(address):
+    return staticcall rocketStorage.getNodeWithdrawalAddress(_nodeAddress)
+  return rplWithdrawalAddress
+
+@external
+@view
+def getNodeRPLWithdrawalAddress(_nodeAddress: address) -> address:
+  return self._getNodeRPLWithdrawalAddress(_nodeAddress)
+
+@external
+@view
+def getNodeRPLWithdrawalAddressIsSet(_nodeAddress: address) -> bool:
+  return self.rplWithdrawalAddresses[_nodeAddress] != empty(address)
+
+@external
+@view
+def getNodePendingRPLWithdrawalAddress(_nodeAddress: address) -> address:
+  return self.pendingRPLWithdrawalAddresses[_nodeAddress]
+
+@internal
+def _updateRPLWithdrawalAddress(_nodeAddress: address, _newRPLWithdrawalAddress: address):
+  self.rplWithdrawalAddresses[_nodeAddress] = _newRPLWithdrawalAddress
+  self.pendingRPLWithdrawalAddresses[_nodeAddress] = empty(address)
+  log NodeRPLWithdrawalAddressSet(_nodeAddress, _newRPLWithdrawalAddress)
+
+@external
+def setRPLWithdrawalAddress(_nodeAddress: address, _newRPLWithdrawalAddress: address, _confirm: bool):
+  assert self.nodeExists[_nodeAddress], "Invalid node"
+  assert _newRPLWithdrawalAddress != empty(address), "Invalid RPL withdrawal address"
+  if self.rplWithdrawalAddresses[_nodeAddress] != empty(address):
+    assert msg.sender == self.rplWithdrawalAddresses[_nodeAddress], "Only a tx from a node's RPL withdrawal address can update it"
+  else:
+    assert msg.sender == staticcall rocketStorage.getNodeWithdrawalAddress(_nodeAddress), "Only a tx from a node's withdrawal address can update it"
+  if _confirm:
+    self._updateRPLWithdrawalAddress(_nodeAddress, _newRPLWithdrawalAddress)
+  else:
+    self.pendingRPLWithdrawalAddresses[_nodeAddress] = _newRPLWithdrawalAddress
+
+@external
+def confirmRPLWithdrawalAddress(_nodeAddress: address):
+  assert msg.sender == self.pendingRPLWithdrawalAddresses[_nodeAddress], "Confirmation must come from the pending RPL withdrawal address"
+  self._updateRPLWithdrawalAddress(_nodeAddress, msg.sender)
+
+@external
+def unsetRPLWithdrawalAddress(_nodeAddress: address):
+  assert msg.sender == self._getNodeRPLWithdrawalAddress(_nodeAddress), "Only a tx from a node's RPL withdrawal address can unset it"
+  self.rplWithdrawalAddresses[_nodeAddress] = empty(address)
+  self.pendingRPLWithdrawalAddresses[_nodeAddress] = empty(address)
+  log NodeRPLWithdrawalAddressUnset(_nodeAddress)
@@ -0,0 +1,134 @@
+#pragma version ~=0.4.0
+#pragma evm-version cancun
+
+# Local stand-in for Rocket Pool's RocketNodeStaking (for tests without a fork)
+# ETH provided is set directly rather than derived from minipool bonds.
+
+WITHDRAWAL_COOLDOWN: constant(uint256) = 28 * 24 * 60 * 60
+
+interface RocketStorageInterface:
+  def getAddress(_key: bytes32) -> address: view
+  def getNodeWithdrawalAddress(_nodeAddress: address) -> address: view
+
+interface RPLInterface:
+  def transfer(_to: address, _value: uint256) -> bool: nonpayable
+  def transferFrom(_from: address, _to: address, _value: uint256) -> bool: nonpayable
+rocketTokenRPLKey: constant(bytes32) = keccak256("contract.addressrocketTokenRPL")
+
+interface RocketNodeManagerInterface:
+  def getNodeExists(_nodeAddress: address) -> bool: view
+  def getNodeRPLWithdrawalAddress(_nodeAddress: address) -> address: view
+  def getNodeRPLWithdrawalAddressIsSet(_nodeAddress: address) -> bool: view
+rocketNodeManagerKey: constant(bytes32) = keccak256("contract.addressrocketNodeManager")
+
+rocketMerkleDistributorKey: constant(bytes32) = keccak256("contract.addressrocketMerkleDistributorMainnet")
+
+rocketStorage: public(immutable(RocketStorageInterface))
+
+rplStake: HashMap[address, uint256]
+rplStakedTime: HashMap[address, uint256]
+ethProvided: HashMap[address, uint256]
+stakeRPLForAllowed: HashMap[address, HashMap[address, bool]]
+rplLockingAllowed: HashMap[address, bool]
+
+event RPLStaked:
+  node: indexed(address)
+  amount: uint256
+
+event RPLWithdrawn:
+  node: indexed(address)
+  amount: uint256
+
+@deploy
+def __init__(_rocketStorage: address):
+  rocketStorage = RocketStorageInterface(_rocketStorage)
+
+@internal
+@view
+def _getRPL() -> RPLInterface:
+  return RPLInterface(staticcall rocketStorage.getAddress(rocketTokenRPLKey))
+
+@internal
+@view
+def _getRocketNodeManager() -> RocketNodeManagerInterface:
+  return RocketNodeManagerInterface(staticcall rocketStorage.getAddress(rocketNodeManagerKey))
+
+@internal
+@view
+def _checkFromRPLWithdrawalAddressOrNode(_nodeAddress: address):
+  rocketNodeManager: RocketNodeManagerInterface = self._getRocketNodeManager()
+  if staticcall rocketNodeManager.getNodeRPLWithdrawalAddressIsSet(_nodeAddress):
+    assert msg.sender == staticcall rocketNodeManager.getNodeRPLWithdrawalAddress(_nodeAddress), "Must be called from RPL withdrawal address"
+  else:
+    assert msg.sender == _nodeAddress, "Must be called from node address"
+
+@external
+@view
+def getNodeRPLStake(_nodeAddress: address) -> uint256:
+  return self.rplStake[_nodeAddress]
+
+@external
+@view
+def getNodeRPLStakedTime(_nodeAddress: address) -> uint256:
+  return self.rplStakedTime[_nodeAddress]
+
+@external
+@view
+def getNodeETHProvided(_nodeAddress: address) -> uint256:
+  return self.ethProvided[_nodeAddress]
+
+@external
+def setNodeETHProvided(_nodeAddress: address, _amount: uint256):
+  self.ethProvided[_nodeAddress] = _amount
+
+@external
+@view
+def getStakeRPLForAllowed(_nodeAddress: address, _caller: address) -> bool:
+  return self.stakeRPLForAllowed[_nodeAddress][_caller]
+
+@external
+def setStakeRPLForAllowed(_nodeAddress: address, _caller: address, _allowed: bool):
+  self._checkFromRPLWithdrawalAddressOrNode(_nodeAddress)
+  self.stakeRPLForAllowed[_nodeAddress][_caller] = _allowed
+
+@external
+@view
+def getRPLLockingAllowed(_nodeAddress: address) -> bool:
+  return self.rplLockingAllowed[_nodeAddress]
+
+@external
+def setRPLLockingAllowed(_nodeAddress: address, _allowed: bool):
+  self._checkFromRPLWithdrawalAddressOrNode(_nodeAddress)
+  self.rplLockingAllowed[_nodeAddress] = _allowed
+
+@external
+def stakeRPLFor(_nodeAddress: address, _amount: uint256):
+  rocketNodeManager: RocketNodeManagerInterface = self._getRocketNodeManager()
+  assert staticcall rocketNodeManager.getNodeExists(_nodeAddress), "Invalid node"
+  if msg.sender != staticcall rocketStorage.getAddress(rocketMerkleDistributorKey):
+    fromNode: bool = False
+    if staticcall rocketNodeManager.getNodeRPLWithdrawalAddressIsSet(_nodeAddress):
+      fromNode = msg.sender == staticcall rocketNodeManager.getNodeRPLWithdrawalAddress(_nodeAddress)
+    else:
+      fromNode = (msg.sender == _nodeAddress or
+                  msg.sender == staticcall rocketStorage.getNodeWithdrawalAddress(_nodeAddress))
+    if not fromNode:
+      assert self.stakeRPLForAllowed[_nodeAddress][msg.sender], "Not allowed to stake for"
+  assert extcall self._getRPL().transferFrom(msg.sender, self, _amount), "Could not transfer RPL to staking contract"
+  self.rplStake[_nodeAddress] += _amount
+  self.rplStakedTime[_nodeAddress] = block.timestamp
+  log RPLStaked(_nodeAddress, _amount)
+
+@external
+def withdrawRPL(_nodeAddress: address, _amount: uint256):
+  rocketNodeManager: RocketNodeManagerInterface = self._getRocketNodeManager()
+  rplWithdrawalAddress: address = staticcall rocketNodeManager.getNodeRPLWithdrawalAddress(_nodeAddress)
+  if staticcall rocketNodeManager.getNodeRPLWithdrawalAddressIsSet(_nodeAddress):
+    assert msg.sender == rplWithdrawalAddress, "Invalid caller"
+  else:
+    assert msg.sender == _nodeAddress, "Invalid caller"
+  assert WITHDRAWAL_COOLDOWN <= block.timestamp - self.rplStakedTime[_nodeAddress], "The withdrawal cooldown period has not passed"
+  assert _amount <= self.rplStake[_nodeAddress], "Withdrawal amount exceeds node's staked RPL balance"
+  self.rplStake[_nodeAddress] -= _amount
+  assert extcall self._getRPL().transfer(rplWithdrawalAddress, _amount), "Could not transfer RPL to withdrawal address"
+  log RPLWithdrawn(_nodeAddress, _amount)
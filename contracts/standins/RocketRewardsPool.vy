@@ -0,0 +1,19 @@
+#pragma version ~=0.4.0
+#pragma evm-version cancun
+
+# Local stand-in for Rocket Pool's RocketRewardsPool (for tests without a fork)
+
+rewardIndex: uint256
+
+@deploy
+def __init__(_rewardIndex: uint256):
+  self.rewardIndex = _rewardIndex
+
+@external
+@view
+def getRewardIndex() -> uint256:
+  return self.rewardIndex
+
+@external
+def setRewardIndex(_rewardIndex: uint256):
+  self.rewardIndex = _rewardIndex
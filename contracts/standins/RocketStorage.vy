@@ -0,0 +1,69 @@
+#pragma version ~=0.4.0
+#pragma evm-version cancun
+
+# Local stand-in for Rocket Pool's RocketStorage (for tests without a fork)
+
+addresses: HashMap[bytes32, address]
+bools: HashMap[bytes32, bool]
+withdrawalAddresses: HashMap[address, address]
+pendingWithdrawalAddresses: HashMap[address, address]
+
+event NodeWithdrawalAddressSet:
+  node: indexed(address)
+  withdrawalAddress: indexed(address)
+
+@external
+@view
+def getAddress(_key: bytes32) -> address:
+  return self.addresses[_key]
+
+@external
+def setAddress(_key: bytes32, _value: address):
+  self.addresses[_key] = _value
+
+@external
+@view
+def getBool(_key: bytes32) -> bool:
+  return self.bools[_key]
+
+@external
+def setBool(_key: bytes32, _value: bool):
+  self.bools[_key] = _value
+
+@internal
+@view
+def _getNodeWithdrawalAddress(_nodeAddress: address) -> address:
+  withdrawalAddress: address = self.withdrawalAddresses[_nodeAddress]
+  if withdrawalAddress == empty(address):
+    return _nodeAddress
+  return withdrawalAddress
+
+@external
+@view
+def getNodeWithdrawalAddress(_nodeAddress: address) -> address:
+  return self._getNodeWithdrawalAddress(_nodeAddress)
+
+@external
+@view
+def getNodePendingWithdrawalAddress(_nodeAddress: address) -> address:
+  return self.pendingWithdrawalAddresses[_nodeAddress]
+
+@internal
+def _updateWithdrawalAddress(_nodeAddress: address, _newWithdrawalAddress: address):
+  self.withdrawalAddresses[_nodeAddress] = _newWithdrawalAddress
+  self.pendingWithdrawalAddresses[_nodeAddress] = empty(address)
+  log NodeWithdrawalAddressSet(_nodeAddress, _newWithdrawalAddress)
+
+@external
+def setWithdrawalAddress(_nodeAddress: address, _newWithdrawalAddress: address, _confirm: bool):
+  assert _newWithdrawalAddress != empty(address), "Invalid withdrawal address"
+  assert msg.sender == self._getNodeWithdrawalAddress(_nodeAddress), "Only a tx from a node's withdrawal address can update it"
+  if _confirm:
+    self._updateWithdrawalAddress(_nodeAddress, _newWithdrawalAddress)
+  else:
+    self.pendingWithdrawalAddresses[_nodeAddress] = _newWithdrawalAddress
+
+@external
+def confirmWithdrawalAddress(_nodeAddress: address):
+  assert msg.sender == self.pendingWithdrawalAddresses[_nodeAddress], "Confirmation must come from the pending withdrawal address"
+  self._updateWithdrawalAddress(_nodeAddress, msg.sender)
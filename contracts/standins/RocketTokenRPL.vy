@@ -0,0 +1,54 @@
+#pragma version ~=0.4.0
+#pragma evm-version cancun
+
+# Local stand-in for Rocket Pool's RPL token (for tests without a fork)
+# The whole supply is minted to the deployer, who plays the part of the Rocket Vault.
+
+name: public(constant(String[32])) = "Rocket Pool Protocol"
+symbol: public(constant(String[8])) = "RPL"
+decimals: public(constant(uint8)) = 18
+
+totalSupply: public(uint256)
+balanceOf: public(HashMap[address, uint256])
+allowance: public(HashMap[address, HashMap[address, uint256]])
+
+event Transfer:
+  sender: indexed(address)
+  receiver: indexed(address)
+  value: uint256
+
+event Approval:
+  owner: indexed(address)
+  spender: indexed(address)
+  value: uint256
+
+@deploy
+def __init__(_supply: uint256):
+  self.totalSupply = _supply
+  self.balanceOf[msg.sender] = _supply
+  log Transfer(empty(address), msg.sender, _supply)
+
+@internal
+def _transfer(_from: address, _to: address, _value: uint256):
+  assert _value <= self.balanceOf[_from], "ERC20: transfer amount exceeds balance"
+  self.balanceOf[_from] -= _value
+  self.balanceOf[_to] += _value
+  log Transfer(_from, _to, _value)
+
+@external
+def transfer(_to: address, _value: uint256) -> bool:
+  self._transfer(msg.sender, _to, _value)
+  return True
+
+@external
+def transferFrom(_from: address, _to: address, _value: uint256) -> bool:
+  self._transfer(_from, _to, _value)
+  assert _value <= self.allowance[_from][msg.sender], "ERC20: transfer amount exceeds allowance"
+  self.allowance[_from][msg.sender] -= _value
+  return True
+
+@external
+def approve(_spender: address, _value: uint256) -> bool:
+  self.allowance[msg.sender][_spender] = _value
+  log Approval(msg.sender, _spender, _value)
+  return True
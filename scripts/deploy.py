@@ -1,21 +1,49 @@
-import IPython
+import sys
+import json
+import time
 import warnings
+import click
 from eth_utils import keccak
 from ape import project, networks, accounts, Contract
+from ape.cli import ConnectedProviderCommand
+
+sys.path.insert(0, str(project.path))
+from client.standins import deploy_rocket_pool, contract_key
+
+# Interactive: ape run deploy --network ethereum:holesky-fork:foundry
+#   deploys Rocket Lend (and its lens) against the live (forked) Rocket Pool, grabs
+#   1000 RPL for the deployer, and drops into IPython.
+# Seeded: ape run deploy --manifest deployment.json [--lenders N --pools N ...]
+#   deploys Rocket Lend (with the Rocket Pool stand-ins) to a local chain, creates
+#   lenders, pools, joined nodes and loans, and writes their addresses and ids as
+#   JSON, without interaction.
 
 rocketStorageAddresses = dict(
         mainnet='0x1d8f8f00cfa6758d7bE78336684788Fb0ee0Fa46',
         holesky='0x594Fb75D3dc2DFa0150Ad03F99F97817747dd4E1')
 
-def main():
-    network_name = networks.network.name
-    provider_uri = networks.active_provider.uri
+oneRPL = 10 ** 18
+oneETH = 10 ** 18
+day = 24 * 60 * 60
+
+# the contract's bounds on multicall and borrowMany
+MAX_MULTICALL = 32
+MAX_BORROW_BATCH = 32
+
+rocketPoolNames = ['rocketTokenRPL', 'rocketNodeManager', 'rocketNodeStaking', 'rocketNodeDeposit',
+                   'rocketNetworkPrices', 'rocketRewardsPool', 'rocketMerkleDistributorMainnet',
+                   'rocketNodeDistributorFactory', 'rocketMinipoolManager']
+
+def interactive():
+    network_name = networks.provider.network.name
+    provider_uri = networks.provider.uri
     if network_name != 'holesky-fork':
-        raise f'Only holesky-fork is currently supported, not {network_name}'
+        raise click.UsageError(f'Only holesky-fork is currently supported, not {network_name} (or use --manifest)')
     deployer = accounts.test_accounts[0]
     rocketlend = deployer.deploy(project.rocketlend, rocketStorageAddresses['holesky'])
+    rocketlendLens = deployer.deploy(project.rocketlendLens, rocketlend)
     print(f'RPC available at {provider_uri}')
-    print(f'Deployed at {rocketlend.creation_metadata.block}')
+    print(f'Deployed at {rocketlend.creation_metadata.block}, lens at {rocketlendLens.address}')
     rocketStorage = Contract(rocketStorageAddresses['holesky'])
     rocketVault = accounts[rocketStorage.getAddress(keccak('contract.addressrocketVault'.encode()))]
     RPLToken = Contract(rocketStorage.getAddress(keccak('contract.addressrocketTokenRPL'.encode())))
@@ -23,5 +51,101 @@ def main():
     amount = amountRPL * 10 ** RPLToken.decimals()
     RPLToken.transfer(deployer, amount, sender=rocketVault)
     print(f'Grabbed {amountRPL} RPL for {deployer.address} with private key {deployer.private_key}')
+    import IPython
     warnings.filterwarnings('ignore')
     IPython.embed()
+
+def new_accounts(count, funder, amount):
+    result = [accounts.test_accounts.generate_test_account() for _ in range(count)]
+    for account in result:
+        funder.transfer(account, amount)
+    return result
+
+def account_entry(account):
+    return dict(address=account.address, privateKey=account.private_key)
+
+def chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+def seed(lenderCount, poolsPerLender, nodeCount, loansPerNode, supply, borrowAmount, ethPerNode, weeks):
+    """Deploy the stand-ins and Rocket Lend, and create the pools, nodes and loans. Returns the manifest."""
+    poolCount = lenderCount * poolsPerLender
+    if poolCount < loansPerNode:
+        raise click.UsageError(f'{loansPerNode} loans per node needs at least as many pools, not {poolCount}')
+    admin = accounts.test_accounts[0]
+    nodes = new_accounts(nodeCount, admin, oneETH)
+    lenders = new_accounts(lenderCount, admin, oneETH)
+    rocketStorage = deploy_rocket_pool(project, admin, nodes, nodes[0], minipoolCount=0)
+    rocketlend = admin.deploy(project.rocketlend, rocketStorage)
+    rocketlendLens = admin.deploy(project.rocketlendLens, rocketlend)
+    rocketPool = {name: rocketStorage.getAddress(contract_key(name)) for name in rocketPoolNames}
+    RPLToken = project.RocketTokenRPL.at(rocketPool['rocketTokenRPL'])
+    rocketNodeStaking = project.RocketNodeStaking.at(rocketPool['rocketNodeStaking'])
+
+    # pool i ends i weeks after the first; each lender creates its pools in multicalls
+    start = round(time.time())
+    pools = []
+    for l, lender in enumerate(lenders):
+        RPLToken.transfer(lender, supply * poolsPerLender, sender=admin)
+        RPLToken.approve(rocketlend, supply * poolsPerLender, sender=lender)
+        params = [dict(interestRate=5 + 5 * (i % 4), endTime=start + (weeks + i) * 7 * day)
+                  for i in range(l * poolsPerLender, (l + 1) * poolsPerLender)]
+        for batch in chunks(params, MAX_MULTICALL):
+            receipt = rocketlend.multicall([rocketlend.createPool.encode_input(p, supply, 0, [0]) for p in batch],
+                                           sender=lender)
+            pools.extend(dict(id=log.id, lender=lender.address, supply=supply, **p)
+                         for log, p in zip(rocketlend.CreatePool.from_receipt(receipt), batch))
+
+    loans = []
+    for j, node in enumerate(nodes):
+        rocketNodeStaking.setNodeETHProvided(node, ethPerNode, sender=admin)
+        rocketStorage.setWithdrawalAddress(node, rocketlend, False, sender=node)
+        # borrowed in end time order, so each new loan goes last in the node's (new) debtPools list:
+        # its item index is k + 1, and its prevIndex is the item before, k
+        nodePools = sorted((pools[(j + k) % poolCount] for k in range(loansPerNode)),
+                           key=lambda pool: (pool['endTime'], pool['id']))
+        args = [(pool['id'], k, borrowAmount, []) for k, pool in enumerate(nodePools)]
+        calls = [rocketlend.joinAsBorrower.encode_input(node)]
+        calls.extend(rocketlend.borrowMany.encode_input(node, batch) for batch in chunks(args, MAX_BORROW_BATCH))
+        rocketlend.multicall(calls, sender=node)
+        loans.extend(dict(poolId=pool['id'], node=node.address, borrowed=borrowAmount) for pool in nodePools)
+
+    return dict(network=networks.provider.network.name,
+                chainId=networks.provider.chain_id,
+                rpc=getattr(networks.provider, 'uri', None),
+                block=networks.provider.get_block('latest').number,
+                rocketlend=rocketlend.address,
+                deployBlock=rocketlend.creation_metadata.block,
+                rocketlendLens=rocketlendLens.address,
+                rocketStorage=rocketStorage.address,
+                rocketPool=rocketPool,
+                admin=account_entry(admin),
+                lenders=[account_entry(lender) for lender in lenders],
+                nodes=[account_entry(node) for node in nodes],
+                pools=pools,
+                loans=loans)
+
+@click.command(cls=ConnectedProviderCommand)
+@click.option('--manifest', type=click.Path(dir_okay=False, writable=True, allow_dash=True),
+              help='Deploy with the Rocket Pool stand-ins and seed it, without interaction, '
+                   'writing the addresses and ids to this JSON file ("-" for standard output)')
+@click.option('--lenders', 'lenderCount', default=2, show_default=True, help='Lenders to create')
+@click.option('--pools', 'poolsPerLender', default=2, show_default=True, help='Pools per lender')
+@click.option('--nodes', 'nodeCount', default=8, show_default=True, type=click.IntRange(1), help='Nodes to join as borrowers')
+@click.option('--loans', 'loansPerNode', default=2, show_default=True, help='Loans per node, from different pools')
+@click.option('--supply', default=100_000, show_default=True, help='RPL supplied to each pool')
+@click.option('--borrow', 'borrowAmount', default=100, show_default=True, help='RPL borrowed per loan')
+@click.option('--eth', 'ethPerNode', default=24, show_default=True, help='ETH provided by each node')
+@click.option('--weeks', default=4, show_default=True, help='Weeks until the first pool ends')
+def cli(manifest, lenderCount, poolsPerLender, nodeCount, loansPerNode, supply, borrowAmount, ethPerNode, weeks):
+    if manifest is None:
+        return interactive()
+    if networks.provider.network.name.endswith('-fork'):
+        raise click.UsageError('Seeding uses the Rocket Pool stand-ins, so needs a local (not forked) network')
+    result = seed(lenderCount, poolsPerLender, nodeCount, loansPerNode,
+                  supply * oneRPL, borrowAmount * oneRPL, ethPerNode * oneETH, weeks)
+    with click.open_file(manifest, 'w') as f:
+        json.dump(result, f, indent=2)
+        f.write('\n')
+    click.echo(f'Deployed Rocket Lend at {result["rocketlend"]} with {len(result["pools"])} pools, '
+               f'{len(result["nodes"])} nodes and {len(result["loans"])} loans', err=True)
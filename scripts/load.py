@@ -0,0 +1,63 @@
+import sys
+import json
+import asyncio
+import click
+from eth_account import Account
+from ape import project, networks
+from ape.cli import ConnectedProviderCommand
+
+sys.path.insert(0, str(project.path))
+from client.load import LoadGenerator, defaultMix, oneRPL
+
+# ape run load --manifest deployment.json [--transactions N --concurrency N ...]
+#   drives a mix of Rocket Lend transactions from the lenders and nodes of a
+#   deployment seeded by `ape run deploy --manifest`, on the same (still running)
+#   chain, and reports the throughput and gas used.
+
+def parse_mix(value):
+    mix = {}
+    for entry in value.split(','):
+        function, _, weight = entry.partition('=')
+        if function not in defaultMix or not weight.isdigit():
+            raise click.BadParameter(f'{entry!r} is not function=weight for one of {", ".join(defaultMix)}')
+        mix[function] = int(weight)
+    return mix
+
+@click.command(cls=ConnectedProviderCommand)
+@click.option('--manifest', required=True, type=click.File(), help='JSON written by ape run deploy --manifest')
+@click.option('--transactions', default=1000, show_default=True, help='Transactions to send and measure')
+@click.option('--concurrency', default=16, show_default=True, type=click.IntRange(1),
+              help='Operations in flight at once')
+@click.option('--mix', callback=lambda ctx, param, value: value and parse_mix(value),
+              help='Weights of the functions, e.g. borrow=6,repay=3 (default: '
+                   + ','.join(f'{function}={weight}' for function, weight in defaultMix.items()) + ')')
+@click.option('--borrow', 'borrowAmount', default=1, show_default=True, help='RPL borrowed per borrow')
+@click.option('--supply', default=10_000, show_default=True, help='RPL supplied to each new pool')
+@click.option('--seed', type=int, help='Seed for the random choices')
+@click.option('--prepare/--no-prepare', default=True, show_default=True,
+              help='Fund the accounts first (--no-prepare if an earlier run did)')
+@click.option('--json', 'output', type=click.Path(dir_okay=False, writable=True, allow_dash=True),
+              help='Also write the report as JSON to this file ("-" for standard output)')
+def cli(manifest, transactions, concurrency, mix, borrowAmount, supply, seed, prepare, output):
+    deployment = json.load(manifest)
+    if deployment['chainId'] != networks.provider.chain_id:
+        raise click.UsageError(f'The manifest is for chain {deployment["chainId"]}, '
+                               f'not the connected {networks.provider.chain_id}')
+    abi = project.rocketlend.contract_type.model_dump(mode='json', by_alias=True)['abi']
+    generator = LoadGenerator(networks.provider.web3, deployment['rocketlend'], abi,
+                              [Account.from_key(lender['privateKey']) for lender in deployment['lenders']],
+                              [Account.from_key(node['privateKey']) for node in deployment['nodes']],
+                              [pool['id'] for pool in deployment['pools']],
+                              mix=mix, amount=borrowAmount * oneRPL, supply=supply * oneRPL,
+                              concurrency=concurrency, seed=seed, log=lambda message: click.echo(message, err=True))
+
+    async def run():
+        if prepare:
+            await generator.prepare(Account.from_key(deployment['admin']['privateKey']))
+        return await generator.run(transactions)
+
+    summary = asyncio.run(run())
+    if output:
+        with click.open_file(output, 'w') as f:
+            json.dump(summary, f, indent=2)
+            f.write('\n')
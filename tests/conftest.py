@@ -0,0 +1,181 @@
+import json
+import pathlib
+import functools
+import pytest
+from client.standins import deploy_rocket_pool
+
+rocketStorageAddresses = dict(
+        mainnet='0x1d8f8f00cfa6758d7bE78336684788Fb0ee0Fa46',
+        holesky='0x594Fb75D3dc2DFa0150Ad03F99F97817747dd4E1')
+
+# indices of the nodes used by the tests in RocketNodeManager's list of nodes
+nodeIndices = dict(
+        fork=dict(node1=4, node2=69, node3=420, nodeWithMPs=252),
+        local=dict(node1=0, node2=1, node3=2, nodeWithMPs=3))
+
+gasBaselinePath = pathlib.Path(__file__).parent / 'gas_baseline.json'
+
+def pytest_addoption(parser):
+    parser.addoption('--rocket-pool', choices=['auto', 'fork', 'local'], default='auto',
+                     help='Use the live Rocket Pool contracts on a forked network, '
+                          'or deploy local stand-ins (default: fork only on a -fork network)')
+    parser.addoption('--gas-update', action='store_true',
+                     help=f'Write the gas used by the benchmarks to {gasBaselinePath.name} instead of checking it')
+    parser.addoption('--gas-tolerance', type=float, default=0.01,
+                     help='Fraction by which a benchmark may exceed its baseline gas (default: 0.01)')
+
+class GasRecorder:
+    """Gas used per benchmark entry, checked against (or written to) the stored baseline."""
+
+    def __init__(self, baseline, tolerance, update):
+        self.baseline = baseline
+        self.tolerance = tolerance
+        self.update = update
+        self.measured = {}
+
+    def record(self, name, receipt):
+        gas = receipt.gas_used
+        self.measured[name] = gas
+        base = self.baseline.get(name)
+        if not self.update and base is not None:
+            assert gas <= base * (1 + self.tolerance), (
+                f'{name} used {gas} gas, more than {self.tolerance:.0%} over its baseline of {base}')
+        return gas
+
+    def write(self):
+        baseline = dict(self.baseline, **self.measured)
+        gasBaselinePath.write_text(json.dumps(dict(sorted(baseline.items())), indent=2) + '\n')
+
+    def report(self):
+        lines = [f'{"entry":<48} {"baseline":>10} {"measured":>10} {"change":>8}']
+        for name, gas in sorted(self.measured.items()):
+            base = self.baseline.get(name)
+            change = f'{(gas - base) / base:+.2%}' if base else 'new'
+            lines.append(f'{name:<48} {base or "-":>10} {gas:>10} {change:>8}')
+        return lines
+
+gasRecorderKey = pytest.StashKey[GasRecorder]()
+
+def pytest_configure(config):
+    config.addinivalue_line('markers', 'fork: needs a forked network (for live contracts other than Rocket Pool, or transaction tracing)')
+    config.addinivalue_line('markers', 'local: needs the local Rocket Pool stand-ins (e.g. to change their state directly)')
+    baseline = json.loads(gasBaselinePath.read_text()) if gasBaselinePath.exists() else {}
+    config.stash[gasRecorderKey] = GasRecorder(baseline,
+                                               config.getoption('--gas-tolerance'),
+                                               config.getoption('--gas-update'))
+
+def pytest_sessionfinish(session):
+    recorder = session.config.stash[gasRecorderKey]
+    if hasattr(session.config, 'workeroutput'):
+        # a pytest-xdist worker: the controller gathers the measurements and reports or writes them
+        session.config.workeroutput['gas'] = recorder.measured
+    elif recorder.update and recorder.measured:
+        recorder.write()
+
+@pytest.hookimpl(optionalhook=True)
+def pytest_testnodedown(node, error):
+    node.config.stash[gasRecorderKey].measured.update(node.workeroutput.get('gas', {}))
+
+def pytest_terminal_summary(terminalreporter, config):
+    recorder = config.stash[gasRecorderKey]
+    if recorder.measured:
+        terminalreporter.section('gas')
+        for line in recorder.report():
+            terminalreporter.write_line(line)
+
+@pytest.fixture(scope='session')
+def gas(pytestconfig):
+    return pytestconfig.stash[gasRecorderKey]
+
+@pytest.fixture(scope='session')
+def rocketPoolMode(request, chain):
+    mode = request.config.getoption('--rocket-pool')
+    if mode == 'auto':
+        mode = 'fork' if chain.provider.network.name.endswith('-fork') else 'local'
+    return mode
+
+@pytest.fixture(autouse=True)
+def skip_by_mode(request, rocketPoolMode):
+    if request.node.get_closest_marker('fork') and rocketPoolMode != 'fork':
+        pytest.skip('needs a forked network')
+    if request.node.get_closest_marker('local') and rocketPoolMode != 'local':
+        pytest.skip('needs the local Rocket Pool stand-ins')
+
+@pytest.fixture(scope='session')
+def nodeIndex(rocketPoolMode):
+    return nodeIndices[rocketPoolMode]
+
+## Chain states
+
+class ChainStates:
+    """The chain states built by chain_state fixtures, on a stack of snapshots so that each is built once.
+
+    Each state is built on top of the ones below it and snapshotted. At the start of a test the chain is
+    reverted to the deepest state whose stack (from the bottom) the test uses entirely, which drops the
+    states above it; the test then builds only the states it uses that are not left on the stack.
+    A state is only pushed if nothing else was sent since the state below it, so its snapshot holds no
+    side effects of other fixtures. This reverting replaces ape's test isolation (off in ape-config.yaml).
+    """
+
+    def __init__(self):
+        self.chain = None
+        self.base = None
+        self.stack = [] # [key, snapshot, value]
+        self.height = None
+
+    def start(self, chain, keys):
+        if self.chain is None:
+            self.chain = chain
+            self.base = chain.snapshot()
+        depth = 0
+        while depth < len(self.stack) and self.stack[depth][0] in keys:
+            depth += 1
+        del self.stack[depth:]
+        top = self.stack[-1] if self.stack else None
+        self.chain.restore(top[1] if top else self.base)
+        # restoring a snapshot consumes it
+        if top:
+            top[1] = self.chain.snapshot()
+        else:
+            self.base = self.chain.snapshot()
+        self.height = self.chain.blocks.height
+
+    def enter(self, key, build):
+        for entryKey, _, value in self.stack:
+            if entryKey == key:
+                return value
+        clean = self.chain.blocks.height == self.height
+        value = build()
+        if clean:
+            self.stack.append([key, self.chain.snapshot(), value])
+            self.height = self.chain.blocks.height
+        return value
+
+chainStates = ChainStates()
+
+def chain_state(function):
+    """Make a (function-scoped) fixture one of the chainStates: built once, and restored from a snapshot after.
+
+    Its value is reused as well, so it must not depend on anything but the chain and other fixtures.
+    """
+    key = f'{function.__module__}.{function.__qualname__}'
+    @functools.wraps(function)
+    def fixture(*args, **kwargs):
+        return chainStates.enter(key, lambda: function(*args, **kwargs))
+    fixture.chainStateKey = key
+    return fixture
+
+@pytest.fixture(autouse=True)
+def chain_states(request, chain, rocketStorage):
+    fixturedefs = request.node._fixtureinfo.name2fixturedefs
+    chainStates.start(chain, {getattr(defs[-1].func, 'chainStateKey', None) for defs in fixturedefs.values() if defs})
+
+## Local stand-ins
+
+@pytest.fixture(scope='session')
+def rocketStorage(rocketPoolMode, chain, project, accounts, Contract):
+    if rocketPoolMode == 'fork':
+        return Contract(rocketStorageAddresses[chain.provider.network.name.removesuffix('-fork')])
+    local = nodeIndices['local']
+    nodes = [accounts[6 + local[name]] for name in sorted(local, key=local.get)]
+    return deploy_rocket_pool(project, accounts[4], nodes, nodes[local['nodeWithMPs']])
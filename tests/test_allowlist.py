@@ -0,0 +1,77 @@
+import pytest
+from client.allowlist import AllowlistTree, verify
+from test_rocketlend import reverts
+from test_gas import (oneRPL, time_from_now, grab_RPL, create_pool,
+                      rp, vault, lender, other, node, rocketlend, joined)
+
+pytestmark = pytest.mark.local
+
+@pytest.fixture()
+def restrictedPoolId(rocketlend, lender, rp, vault):
+    grab_RPL(lender, 1000 * oneRPL, rp, vault, rocketlend)
+    receipt = rocketlend.createPool(dict(interestRate=10, endTime=time_from_now(weeks=2)), 1000 * oneRPL, 0, [], sender=lender)
+    return rocketlend.CreatePool.from_receipt(receipt)[0].id
+
+def tree_with(node, accounts, size):
+    return AllowlistTree([node] + [account.address for account in accounts[6:6 + size - 1]])
+
+@pytest.mark.parametrize('size', [1, 2, 5])
+def test_proofs_verify(joined, accounts, size):
+    tree = tree_with(joined, accounts, size)
+    for account in [joined] + list(accounts[6:6 + size - 1]):
+        assert verify(tree.root, account, tree.proof(account))
+    assert not verify(tree.root, accounts[3], tree.proof(joined))
+    with pytest.raises(ValueError):
+        tree.proof(accounts[3])
+
+def test_not_allowed_without_proof(rocketlend, restrictedPoolId, joined, lender, accounts):
+    tree = tree_with(joined, accounts, 5)
+    rocketlend.setAllowedToBorrowRoot(restrictedPoolId, tree.root, sender=lender)
+    with reverts('r'):
+        rocketlend.borrow(restrictedPoolId, joined, 0, 10 * oneRPL, [], sender=joined)
+
+def test_set_root_other(rocketlend, restrictedPoolId, other):
+    with reverts('a'):
+        rocketlend.setAllowedToBorrowRoot(restrictedPoolId, b'\1' * 32, sender=other)
+
+def test_borrow_with_proof(rocketlend, restrictedPoolId, joined, lender, accounts):
+    tree = tree_with(joined, accounts, 5)
+    rocketlend.setAllowedToBorrowRoot(restrictedPoolId, tree.root, sender=lender)
+    # a proof for another node
+    with reverts('r'):
+        rocketlend.borrow(restrictedPoolId, joined, 0, 10 * oneRPL, tree.proof(accounts[6]), sender=joined)
+    rocketlend.borrow(restrictedPoolId, joined, 0, 10 * oneRPL, tree.proof(joined), sender=joined)
+    assert rocketlend.loans(restrictedPoolId, joined).borrowed == 10 * oneRPL
+
+def test_borrow_many_with_proof(rocketlend, restrictedPoolId, joined, lender, rp, vault, accounts):
+    tree = tree_with(joined, accounts, 5)
+    rocketlend.setAllowedToBorrowRoot(restrictedPoolId, tree.root, sender=lender)
+    laterPoolId = create_pool(rocketlend, lender, rp, vault, time_from_now(weeks=3))
+    # the open pool needs no proof
+    rocketlend.borrowMany(joined, [(restrictedPoolId, 0, 10 * oneRPL, tree.proof(joined)),
+                                   (laterPoolId, 1, 10 * oneRPL, [])], sender=joined)
+    assert rocketlend.loans(restrictedPoolId, joined).borrowed == 10 * oneRPL
+    assert rocketlend.loans(laterPoolId, joined).borrowed == 10 * oneRPL
+
+def test_new_root_needs_new_proof(rocketlend, restrictedPoolId, joined, lender, accounts):
+    tree = tree_with(joined, accounts, 5)
+    rocketlend.setAllowedToBorrowRoot(restrictedPoolId, tree.root, sender=lender)
+    rocketlend.borrow(restrictedPoolId, joined, 0, 10 * oneRPL, tree.proof(joined), sender=joined)
+    newTree = tree_with(joined, accounts, 3)
+    rocketlend.setAllowedToBorrowRoot(restrictedPoolId, newTree.root, sender=lender)
+    with reverts('r'):
+        rocketlend.borrow(restrictedPoolId, joined, 0, 10 * oneRPL, tree.proof(joined), sender=joined)
+    rocketlend.borrow(restrictedPoolId, joined, 0, 10 * oneRPL, newTree.proof(joined), sender=joined)
+    assert rocketlend.loans(restrictedPoolId, joined).borrowed == 20 * oneRPL
+
+def test_signatures_without_proof(rocketlend, lender, rp, vault, joined):
+    # borrow and transferDebt can still be called as before they took a proof
+    assert {len(abi.inputs) for abi in rocketlend.borrow.abis} == {4, 5}
+    assert {len(abi.inputs) for abi in rocketlend.transferDebt.abis} == {8, 9}
+    poolId = create_pool(rocketlend, lender, rp, vault, time_from_now(weeks=2))
+    laterPoolId = create_pool(rocketlend, lender, rp, vault, time_from_now(weeks=3))
+    rocketlend.borrow(poolId, joined, 0, 10 * oneRPL, sender=joined)
+    rocketlend.transferDebt(joined, poolId, 0, laterPoolId, 1, 0, 0, 10 * oneRPL, sender=joined)
+    # interest charged since the borrow is paid first, so a little stays borrowed
+    assert rocketlend.loans(poolId, joined).borrowed < oneRPL // 1000
+    assert rocketlend.loans(laterPoolId, joined).borrowed == 10 * oneRPL
@@ -0,0 +1,57 @@
+import pytest
+from client.debt_pools import DebtPoolHints
+from test_gas import (oneRPL, time_from_now, grab_RPL, create_pool,
+                      rp, vault, lender, other, node, rocketlend, joined)
+
+pytestmark = pytest.mark.local
+
+@pytest.fixture()
+def hints(chain, rocketlend):
+    return DebtPoolHints(chain.provider.web3, rocketlend)
+
+@pytest.fixture()
+def pools(rocketlend, lender, rp, vault):
+    # created out of end time order
+    return [create_pool(rocketlend, lender, rp, vault, time_from_now(weeks=weeks)) for weeks in [3, 2, 5, 4]]
+
+def borrow(rocketlend, hints, node, poolId):
+    receipt = rocketlend.borrow(poolId, node, hints.hint(node, poolId), 10 * oneRPL, [], sender=node)
+    hints.handle_logs(receipt.events)
+
+def test_empty_list(hints, joined, pools):
+    assert hints.items(joined) == []
+    assert hints.insert_hint(joined, pools[0]) == 0
+    with pytest.raises(ValueError):
+        hints.remove_hint(joined, pools[0])
+
+def test_borrow_in_any_order(rocketlend, hints, joined, pools):
+    for poolId in pools:
+        borrow(rocketlend, hints, joined, poolId)
+    byEndTime = [pools[i] for i in [1, 0, 3, 2]]
+    assert [poolId for _, poolId in hints.items(joined)] == byEndTime
+    # hints are item indices (in insertion order), not positions in the list
+    assert hints.items(joined)[:2] == [(2, pools[1]), (1, pools[0])]
+    assert hints.remove_hint(joined, pools[1]) == 0
+    assert hints.remove_hint(joined, pools[0]) == 2
+
+def test_repay_in_full(rocketlend, hints, joined, pools, other, rp, vault):
+    for poolId in pools:
+        borrow(rocketlend, hints, joined, poolId)
+    grab_RPL(other, 100 * oneRPL, rp, vault, rocketlend)
+    for poolId in [pools[3], pools[1]]:
+        receipt = rocketlend.repay(poolId, joined, hints.hint(joined, poolId), 0, 0, sender=other)
+        hints.handle_logs(receipt.events)
+    assert [poolId for _, poolId in hints.items(joined)] == [pools[0], pools[2]]
+    # reuses no items: a new insertion gets a new index
+    borrow(rocketlend, hints, joined, pools[3])
+    assert [poolId for _, poolId in hints.items(joined)] == [pools[0], pools[3], pools[2]]
+    assert hints.items(joined)[1][0] == len(pools) + 1
+
+def test_cached_until_event(rocketlend, hints, joined, pools):
+    borrow(rocketlend, hints, joined, pools[0])
+    assert len(hints.items(joined)) == 1
+    # not handling the logs leaves the stale list (and hint) in place
+    rocketlend.borrow(pools[1], joined, hints.hint(joined, pools[1]), 10 * oneRPL, [], sender=joined)
+    assert len(hints.items(joined)) == 1
+    hints.invalidate(joined)
+    assert len(hints.items(joined)) == 2
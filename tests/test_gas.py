@@ -0,0 +1,290 @@
+import time
+import datetime
+import pytest
+from eth_utils import keccak
+from conftest import chain_state
+
+# Gas benchmarks for every external function of rocketlend.vy, checked against gas_baseline.json.
+# Run with --gas-update to rewrite the baseline. Only meaningful with the local Rocket Pool stand-ins.
+
+oneRPL = 10 ** 18
+oneETH = 10 ** 18
+
+Distribute = 0
+NotRewardsOnly = 1
+Refund = 2
+
+allowedBit = 1 << (20 * 8)
+
+def time_from_now(**kwargs):
+    return round(time.time() + datetime.timedelta(**kwargs).total_seconds())
+
+def skip_time(chain, **kwargs):
+    chain.pending_timestamp += round(datetime.timedelta(**kwargs).total_seconds())
+
+def rocket_pool_contract(rocketStorage, Contract, name):
+    return Contract(rocketStorage.getAddress(keccak(f'contract.address{name}'.encode())))
+
+pytestmark = pytest.mark.local
+
+## Setup
+
+@pytest.fixture()
+def rp(rocketStorage, Contract):
+    return {name: rocket_pool_contract(rocketStorage, Contract, name)
+            for name in ['rocketTokenRPL', 'rocketNodeManager', 'rocketNodeStaking', 'rocketNodeDeposit',
+                         'rocketRewardsPool', 'rocketMerkleDistributorMainnet', 'rocketMinipoolManager',
+                         'rocketNodeDistributorFactory']}
+
+@pytest.fixture()
+def vault(rocketStorage, accounts):
+    return accounts[rocketStorage.getAddress(keccak('contract.addressrocketVault'.encode()))]
+
+@pytest.fixture()
+def lender(accounts):
+    return accounts[2]
+
+@pytest.fixture()
+def other(accounts):
+    return accounts[3]
+
+@pytest.fixture()
+def node(rp, accounts, nodeIndex):
+    return accounts[rp['rocketNodeManager'].getNodeAt(nodeIndex['nodeWithMPs'])]
+
+@pytest.fixture()
+@chain_state
+def rocketlend(project, rocketStorage, accounts):
+    return accounts[5].deploy(project.rocketlend, rocketStorage)
+
+def grab_RPL(who, amount, rp, vault, approveFor):
+    rp['rocketTokenRPL'].transfer(who, amount, sender=vault)
+    if approveFor:
+        rp['rocketTokenRPL'].approve(approveFor, amount, sender=who)
+
+def create_pool(rocketlend, lender, rp, vault, endTime, supply=1000 * oneRPL, interestRate=10):
+    grab_RPL(lender, supply, rp, vault, rocketlend)
+    receipt = rocketlend.createPool(dict(interestRate=interestRate, endTime=endTime), supply, 0, [0], sender=lender)
+    return rocketlend.CreatePool.from_receipt(receipt)[0].id
+
+@pytest.fixture()
+@chain_state
+def poolId(rocketlend, lender, rp, vault):
+    return create_pool(rocketlend, lender, rp, vault, time_from_now(weeks=2))
+
+def join(rocketlend, rocketStorage, node):
+    rocketStorage.setWithdrawalAddress(node, rocketlend, False, sender=node)
+    return rocketlend.joinAsBorrower(node, sender=node)
+
+@pytest.fixture()
+@chain_state
+def joined(rocketlend, rocketStorage, node):
+    join(rocketlend, rocketStorage, node)
+    return node
+
+@pytest.fixture()
+@chain_state
+def borrowed(rocketlend, poolId, joined):
+    rocketlend.borrow(poolId, joined, 0, 100 * oneRPL, [], sender=joined)
+    return joined
+
+def add_minipools(project, rocketStorage, rp, vault, node, count):
+    for _ in range(count):
+        minipool = vault.deploy(project.RocketMinipool, rocketStorage, node)
+        rp['rocketMinipoolManager'].addMinipool(node, minipool, sender=vault)
+
+def fund_minipools(rp, node, indices, funder, amount=oneETH):
+    for index in indices:
+        funder.transfer(rp['rocketMinipoolManager'].getNodeMinipoolAt(node, index), amount)
+
+def distribute_args(indices, action=1 << Distribute):
+    return [[index, action] for index in indices]
+
+def rewards_args(rp, vault, node, intervals, amountRPL, amountETH):
+    # one leaf per interval, so each root is the leaf itself and the proof is empty
+    distributor = rp['rocketMerkleDistributorMainnet']
+    for index in intervals:
+        leaf = keccak(bytes.fromhex(node.address[2:]) + (0).to_bytes(32, 'big') +
+                      amountRPL.to_bytes(32, 'big') + amountETH.to_bytes(32, 'big'))
+        distributor.setMerkleRoot(index, leaf, sender=vault)
+    n = len(intervals)
+    rp['rocketTokenRPL'].transfer(distributor, n * amountRPL, sender=vault)
+    if amountETH:
+        vault.transfer(distributor, n * amountETH)
+    return list(intervals), [amountRPL] * n, [amountETH] * n, [[]] * n
+
+# Rocket Pool addresses
+
+def test_gas_update_rocket_pool_addresses(rocketlend, other, gas):
+    gas.record('updateRocketPoolAddresses', rocketlend.updateRocketPoolAddresses(sender=other))
+
+# Lender functions
+
+def test_gas_create_pool(rocketlend, lender, gas):
+    gas.record('createPool', rocketlend.createPool(dict(interestRate=10, endTime=time_from_now(weeks=2)), 0, 0, [], sender=lender))
+
+def test_gas_create_pool_supply_allowance_borrowers(rocketlend, lender, rp, vault, accounts, gas):
+    grab_RPL(lender, 1000 * oneRPL, rp, vault, rocketlend)
+    borrowers = [account.address for account in accounts[6:10]]
+    receipt = rocketlend.createPool(dict(interestRate=10, endTime=time_from_now(weeks=2)), 1000 * oneRPL, oneRPL, borrowers, sender=lender)
+    gas.record('createPool/supply+allowance+4borrowers', receipt)
+
+def test_gas_transfer_pool(rocketlend, poolId, lender, other, gas):
+    gas.record('transferPool/pending', rocketlend.transferPool(poolId, other, False, sender=lender))
+    gas.record('confirmTransferPool', rocketlend.confirmTransferPool(poolId, sender=other))
+    gas.record('transferPool/confirm', rocketlend.transferPool(poolId, lender, True, sender=other))
+
+def test_gas_change_pool_rpl(rocketlend, poolId, lender, other, rp, vault, gas):
+    grab_RPL(other, 100 * oneRPL, rp, vault, rocketlend)
+    supply = rocketlend.pools(poolId).available
+    gas.record('changePoolRPL/supply', rocketlend.changePoolRPL(poolId, supply + 100 * oneRPL, sender=other))
+    gas.record('changePoolRPL/withdraw', rocketlend.changePoolRPL(poolId, supply, sender=lender))
+
+@pytest.mark.parametrize('count', [1, 16])
+def test_gas_change_allowed_to_borrow(rocketlend, poolId, lender, count, gas):
+    borrowers = [allowedBit | i for i in range(1, count + 1)]
+    gas.record(f'changeAllowedToBorrow/{count}', rocketlend.changeAllowedToBorrow(poolId, borrowers, sender=lender))
+
+def test_gas_allowlist_root(rocketlend, poolId, joined, lender, accounts, gas):
+    from client.allowlist import AllowlistTree
+    tree = AllowlistTree([joined] + [account.address for account in accounts if account != joined][:7])
+    gas.record('setAllowedToBorrowRoot', rocketlend.setAllowedToBorrowRoot(poolId, tree.root, sender=lender))
+    # only the tree's nodes
+    rocketlend.changeAllowedToBorrow(poolId, [0], sender=lender)
+    receipt = rocketlend.borrow(poolId, joined, 0, 100 * oneRPL, tree.proof(joined), sender=joined)
+    gas.record('borrow/first+proof-depth=3', receipt)
+
+def test_gas_set_allowance(rocketlend, poolId, lender, gas):
+    gas.record('setAllowance', rocketlend.setAllowance(poolId, oneRPL, sender=lender))
+
+def test_gas_update_interest_due(rocketlend, poolId, borrowed, other, chain, gas):
+    skip_time(chain, days=1)
+    gas.record('updateInterestDue', rocketlend.updateInterestDue(poolId, borrowed, sender=other))
+
+def test_gas_update_interest_due_many(rocketlend, poolId, borrowed, other, chain, gas):
+    skip_time(chain, days=1)
+    receipt = rocketlend.updateInterestDueMany([(poolId, borrowed), (poolId, borrowed)], sender=other)
+    gas.record('updateInterestDueMany/1+skip', receipt)
+
+def test_gas_force_repay_rpl(rocketlend, poolId, borrowed, other, chain, gas):
+    skip_time(chain, days=29)
+    gas.record('forceRepayRPL/unstake', rocketlend.forceRepayRPL(poolId, borrowed, 0, 20 * oneRPL, sender=other))
+
+def test_gas_force_repay_eth_withdraw(rocketlend, poolId, borrowed, lender, other, rp, chain, gas):
+    fund_minipools(rp, borrowed, [0], other)
+    rocketlend.distributeRefund(borrowed, False, distribute_args([0]), sender=other)
+    skip_time(chain, days=15)
+    gas.record('forceRepayETH', rocketlend.forceRepayETH(poolId, borrowed, 0, sender=lender))
+    reclaimed = rocketlend.pools(poolId).reclaimed
+    gas.record('withdrawEtherFromPool', rocketlend.withdrawEtherFromPool(poolId, reclaimed, sender=lender))
+
+def test_gas_force_repay_rpl_many(rocketlend, poolId, borrowed, other, chain, gas):
+    skip_time(chain, days=29)
+    receipt = rocketlend.forceRepayRPLMany(poolId, [(borrowed, 0, 20 * oneRPL), (other, 0, 0)], sender=other)
+    gas.record('forceRepayRPLMany/unstake+skip', receipt)
+
+def test_gas_force_claim_merkle_rewards(rocketlend, poolId, borrowed, other, rp, vault, chain, gas):
+    args = rewards_args(rp, vault, borrowed, [8], 10 * oneRPL, 0)
+    skip_time(chain, days=15)
+    receipt = rocketlend.forceClaimMerkleRewards(poolId, borrowed, 0, 5 * oneRPL, 0, *args, sender=other)
+    gas.record('forceClaimMerkleRewards/1', receipt)
+
+def test_gas_force_distribute_refund(rocketlend, poolId, borrowed, lender, other, rp, chain, gas):
+    fund_minipools(rp, borrowed, [0, 1], other)
+    rocketlend.distributeRefund(borrowed, False, distribute_args([1]), sender=other)
+    skip_time(chain, days=15)
+    receipt = rocketlend.forceDistributeRefund(poolId, borrowed, 0, False, distribute_args([0]), sender=lender)
+    gas.record('forceDistributeRefund/1', receipt)
+
+# Borrower functions
+
+def test_gas_change_borrower_address(rocketlend, joined, other, gas):
+    gas.record('changeBorrowerAddress/pending', rocketlend.changeBorrowerAddress(joined, other, False, sender=joined))
+    gas.record('confirmChangeBorrowerAddress', rocketlend.confirmChangeBorrowerAddress(joined, sender=other))
+    gas.record('changeBorrowerAddress/confirm', rocketlend.changeBorrowerAddress(joined, joined, True, sender=other))
+
+@pytest.mark.parametrize('intervals', [1, 32, 128])
+def test_gas_join_as_borrower(rocketlend, rocketStorage, node, rp, vault, intervals, gas):
+    rp['rocketRewardsPool'].setRewardIndex(intervals, sender=vault)
+    gas.record(f'joinAsBorrower/intervals={intervals}', join(rocketlend, rocketStorage, node))
+
+def test_gas_leave_as_borrower(rocketlend, joined, gas):
+    gas.record('leaveAsBorrower', rocketlend.leaveAsBorrower(joined, sender=joined))
+
+def test_gas_set_stake_rpl_for_allowed(rocketlend, joined, other, gas):
+    gas.record('setStakeRPLForAllowed', rocketlend.setStakeRPLForAllowed(joined, other, True, sender=joined))
+
+def test_gas_borrow(rocketlend, poolId, joined, chain, gas):
+    gas.record('borrow/first', rocketlend.borrow(poolId, joined, 0, 100 * oneRPL, [], sender=joined))
+    skip_time(chain, days=1)
+    gas.record('borrow/repeat', rocketlend.borrow(poolId, joined, 0, 100 * oneRPL, [], sender=joined))
+
+def test_gas_borrow_many(rocketlend, poolId, joined, lender, rp, vault, gas):
+    laterPoolId = create_pool(rocketlend, lender, rp, vault, time_from_now(weeks=3))
+    receipt = rocketlend.borrowMany(joined, [(poolId, 0, 100 * oneRPL, []), (laterPoolId, 1, 100 * oneRPL, [])], sender=joined)
+    gas.record('borrowMany/2', receipt)
+
+def test_gas_multicall(rocketlend, poolId, joined, gas):
+    receipt = rocketlend.multicall([rocketlend.borrow.encode_input(poolId, joined, 0, 100 * oneRPL, []),
+                                    rocketlend.withdraw.encode_input(joined, 0, 0)], sender=joined)
+    gas.record('multicall/borrow+withdraw', receipt)
+
+def test_gas_borrow_second_pool(rocketlend, poolId, borrowed, lender, rp, vault, gas):
+    laterPoolId = create_pool(rocketlend, lender, rp, vault, time_from_now(weeks=3))
+    gas.record('borrow/second-pool', rocketlend.borrow(laterPoolId, borrowed, 1, 100 * oneRPL, [], sender=borrowed))
+
+def test_gas_repay(rocketlend, poolId, borrowed, other, rp, vault, chain, gas):
+    grab_RPL(other, 200 * oneRPL, rp, vault, rocketlend)
+    skip_time(chain, days=1)
+    gas.record('repay/partial', rocketlend.repay(poolId, borrowed, 0, 0, 50 * oneRPL, sender=other))
+    skip_time(chain, days=1)
+    gas.record('repay/close', rocketlend.repay(poolId, borrowed, 0, 0, 0, sender=other))
+
+def test_gas_repay_in_order(rocketlend, poolId, borrowed, lender, other, rp, vault, chain, gas):
+    laterPoolId = create_pool(rocketlend, lender, rp, vault, time_from_now(weeks=3))
+    rocketlend.borrow(laterPoolId, borrowed, 1, 100 * oneRPL, [], sender=borrowed)
+    grab_RPL(other, 400 * oneRPL, rp, vault, rocketlend)
+    skip_time(chain, days=1)
+    gas.record('repayInOrder/close2', rocketlend.repayInOrder(borrowed, 0, 400 * oneRPL, sender=other))
+
+def test_gas_unstake_withdraw_stake(rocketlend, joined, lender, rp, vault, chain, gas):
+    longPoolId = create_pool(rocketlend, lender, rp, vault, time_from_now(weeks=26))
+    rocketlend.borrow(longPoolId, joined, 0, 100 * oneRPL, [], sender=joined)
+    rocketlend.claimMerkleRewards(joined, *rewards_args(rp, vault, joined, [8], 20 * oneRPL, 0), 0, sender=joined)
+    skip_time(chain, days=29)
+    gas.record('unstakeRPL', rocketlend.unstakeRPL(joined, 20 * oneRPL, sender=joined))
+    gas.record('stakeRPLFor', rocketlend.stakeRPLFor(joined, 10 * oneRPL, sender=joined))
+    gas.record('withdraw/RPL', rocketlend.withdraw(joined, oneRPL, 0, sender=joined))
+
+def test_gas_transfer_debt(rocketlend, poolId, borrowed, lender, rp, vault, chain, gas):
+    toPoolId = create_pool(rocketlend, lender, rp, vault, time_from_now(weeks=3))
+    skip_time(chain, days=1)
+    amount = rocketlend.loans(poolId, borrowed).borrowed
+    receipt = rocketlend.transferDebt(borrowed, poolId, 0, toPoolId, 1, 0, 0, amount, [], sender=borrowed)
+    gas.record('transferDebt/available', receipt)
+
+@pytest.mark.parametrize('intervals', [1, 4])
+def test_gas_claim_merkle_rewards(rocketlend, joined, rp, vault, intervals, gas):
+    args = rewards_args(rp, vault, joined, range(8, 8 + intervals), 10 * oneRPL, oneETH // 10)
+    receipt = rocketlend.claimMerkleRewards(joined, *args, 0, sender=joined)
+    gas.record(f'claimMerkleRewards/{intervals}', receipt)
+
+@pytest.mark.parametrize('minipools', [1, 4, 16])
+def test_gas_distribute_refund(project, rocketStorage, rocketlend, joined, other, rp, vault, minipools, gas):
+    existing = rp['rocketMinipoolManager'].getNodeMinipoolCount(joined)
+    add_minipools(project, rocketStorage, rp, vault, joined, max(0, minipools - existing))
+    fund_minipools(rp, joined, range(minipools), other)
+    receipt = rocketlend.distributeRefund(joined, False, distribute_args(range(minipools)), sender=other)
+    gas.record(f'distributeRefund/minipools={minipools}', receipt)
+
+def test_gas_distribute_refund_fee_distributor(rocketlend, joined, other, rp, gas):
+    other.transfer(rp['rocketNodeDistributorFactory'].getProxyAddress(joined), oneETH)
+    receipt = rocketlend.distributeRefund(joined, True, [], sender=other)
+    gas.record('distributeRefund/distributor', receipt)
+
+def test_gas_withdraw_deposit_eth(rocketlend, joined, other, rp, gas):
+    fund_minipools(rp, joined, [0], other)
+    rocketlend.distributeRefund(joined, False, distribute_args([0]), sender=other)
+    amount = rocketlend.borrowers(joined).ETH // 2
+    gas.record('depositETHFor', rocketlend.depositETHFor(joined, amount, sender=joined))
+    gas.record('withdraw/ETH', rocketlend.withdraw(joined, 0, amount, sender=joined))
@@ -0,0 +1,48 @@
+import pytest
+from client.indexer import Indexer
+from test_gas import (oneRPL, time_from_now, grab_RPL, create_pool, join,
+                      rp, vault, lender, other, node, rocketlend, poolId, joined)
+
+pytestmark = pytest.mark.local
+
+@pytest.fixture()
+def index(chain, rocketlend, tmp_path):
+    def make(**kwargs):
+        abi = rocketlend.contract_type.model_dump(mode='json', by_alias=True)['abi']
+        return Indexer(chain.provider.web3, rocketlend.address, abi, tmp_path / 'rocketlend.sqlite',
+                       startBlock=rocketlend.creation_metadata.block, **kwargs)
+    return make
+
+def test_index_logs(rocketlend, poolId, joined, index):
+    indexer = index()
+    receipt = rocketlend.borrow(poolId, joined, 0, 100 * oneRPL, [], sender=joined)
+    assert 0 < indexer.sync()
+    [(blockNumber, name, args)] = indexer.logs('Borrow')
+    assert blockNumber == receipt.block_number
+    assert args == dict(borrowed=100 * oneRPL, interestDue=0)
+    assert [args['id'] for _, _, args in indexer.logs('CreatePool')] == [poolId]
+    assert indexer.sync() == 0
+
+def test_resume_in_chunks(chain, rocketlend, lender, rp, vault, index):
+    poolIds = [create_pool(rocketlend, lender, rp, vault, time_from_now(weeks=2)) for _ in range(3)]
+    indexer = index(chunkSize=2)
+    indexer.sync(toBlock=chain.blocks.head.number - 2)
+    partial = len(indexer.logs('CreatePool'))
+    indexer.close()
+    indexer = index(chunkSize=2)
+    indexer.sync()
+    assert partial < len(poolIds)
+    assert [args['id'] for _, _, args in indexer.logs('CreatePool')] == poolIds
+
+def test_rollback_reorg(chain, rocketlend, lender, rp, vault, index):
+    indexer = index()
+    create_pool(rocketlend, lender, rp, vault, time_from_now(weeks=2))
+    snapshot = chain.snapshot()
+    create_pool(rocketlend, lender, rp, vault, time_from_now(weeks=3))
+    indexer.sync()
+    assert len(indexer.logs('CreatePool')) == 2
+    chain.restore(snapshot)
+    rocketlend.setAllowance(0, 5, sender=lender)
+    assert indexer.rollback() == 3  # the second pool's CreatePool, SupplyPool and ChangeAllowedToBorrow
+    indexer.sync()
+    assert [name for _, name, _ in indexer.logs()] == ['CreatePool', 'SupplyPool', 'ChangeAllowedToBorrow', 'SetAllowance']
@@ -0,0 +1,86 @@
+import random
+import pytest
+from client.interest import SECONDS_PER_YEAR, charge_interest, project_debt
+from test_gas import (oneRPL, time_from_now, grab_RPL, create_pool,
+                      rp, vault, lender, other, node, rocketlend, joined)
+
+pytestmark = pytest.mark.local
+
+day = 24 * 60 * 60
+
+def charge_interest_scalar(borrowed, startTime, rate, endTime, timestamp):
+    # _chargeInterest written out, one loan at a time
+    if timestamp < endTime:
+        return borrowed * rate * (timestamp - startTime) // 100 // SECONDS_PER_YEAR
+    elif startTime < endTime:
+        return (borrowed * rate * (endTime - startTime) // 100 // SECONDS_PER_YEAR +
+                borrowed * 2 * rate * (timestamp - endTime) // 100 // SECONDS_PER_YEAR)
+    else:
+        return borrowed * 2 * rate * (timestamp - startTime) // 100 // SECONDS_PER_YEAR
+
+@pytest.fixture()
+def loans(chain, rocketlend, lender, rp, vault, joined):
+    pools = [create_pool(rocketlend, lender, rp, vault, time_from_now(days=days), interestRate=rate)
+             for days, rate in [(10, 10), (20, 127), (40, 3)]]
+    # in end time order, so each goes after the previous one (at index i)
+    for i, (poolId, amount) in enumerate(zip(pools, [100, 333, 7])):
+        rocketlend.borrow(poolId, joined, i, amount * oneRPL + 12345, [], sender=joined)
+    # some interest due, and loans accounted until different times
+    chain.pending_timestamp += 3 * day
+    rocketlend.updateInterestDue(pools[1], joined, sender=joined)
+    return pools
+
+def loan_arrays(rocketlend, node, pools):
+    columns = [[] for _ in range(5)]
+    for poolId in pools:
+        loan = rocketlend.loans(poolId, node)
+        params = rocketlend.params(poolId)
+        for column, value in zip(columns, [loan.borrowed, loan.interestDue, loan.accountedUntil,
+                                           params.interestRate, params.endTime]):
+            column.append(value)
+    return columns
+
+@pytest.mark.parametrize('days', [5, 15, 30, 60])
+def test_matches_contract(chain, rocketlend, joined, other, loans, days):
+    borrowed, interestDue, accountedUntil, rate, endTime = loan_arrays(rocketlend, joined, loans)
+    chain.pending_timestamp += days * day
+    # in one transaction, so all are charged at the same timestamp
+    receipt = rocketlend.multicall([rocketlend.updateInterestDue.encode_input(poolId, joined) for poolId in loans],
+                                   sender=other)
+    projected = project_debt(borrowed, interestDue, accountedUntil, rate, endTime, receipt.timestamp)
+    loansAfter = [rocketlend.loans(poolId, joined) for poolId in loans]
+    assert list(projected) == [loan.borrowed + loan.interestDue for loan in loansAfter]
+
+def test_matches_contract_after_end_again(chain, rocketlend, joined, other, loans):
+    # charge once after the end time, so accountedUntil is after it too
+    chain.pending_timestamp += 30 * day
+    rocketlend.updateInterestDue(loans[0], joined, sender=other)
+    borrowed, interestDue, accountedUntil, rate, endTime = loan_arrays(rocketlend, joined, loans[:1])
+    assert endTime[0] < accountedUntil[0]
+    chain.pending_timestamp += 7 * day
+    receipt = rocketlend.updateInterestDue(loans[0], joined, sender=other)
+    projected = project_debt(borrowed, interestDue, accountedUntil, rate, endTime, receipt.timestamp)
+    loan = rocketlend.loans(loans[0], joined)
+    assert list(projected) == [loan.borrowed + loan.interestDue]
+
+def test_table_of_loans_by_timestamp():
+    rng = random.Random(42)
+    count = 200
+    borrowed = [rng.randrange(2 ** 128) for _ in range(count)]
+    accountedUntil = [rng.randrange(2 ** 32) for _ in range(count)]
+    rate = [rng.randrange(128) for _ in range(count)]
+    endTime = [start + rng.randrange(-SECONDS_PER_YEAR, SECONDS_PER_YEAR) for start in accountedUntil]
+    timestamps = [2 ** 32 + rng.randrange(10 * SECONDS_PER_YEAR) for _ in range(7)]
+    table = charge_interest(*[[[value] for value in column] for column in [borrowed, accountedUntil, rate, endTime]],
+                            [timestamps])
+    assert table.shape == (count, len(timestamps))
+    for i in range(count):
+        for j, timestamp in enumerate(timestamps):
+            assert table[i, j] == charge_interest_scalar(borrowed[i], accountedUntil[i], rate[i], endTime[i], timestamp)
+
+def test_reverts_like_contract():
+    with pytest.raises(ValueError):
+        charge_interest(oneRPL, 100, 10, 200, 99)
+    with pytest.raises(ValueError):
+        charge_interest(oneRPL, 100, 128, 200, 200)
+    assert charge_interest(oneRPL, 100, 128, 200, 199) == oneRPL * 128 * 99 // 100 // SECONDS_PER_YEAR
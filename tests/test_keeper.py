@@ -0,0 +1,102 @@
+import asyncio
+import pytest
+from eth_account import Account
+from client.keeper import Keeper
+from client.rewards import RewardsIndex, ClaimBuilder
+from test_gas import (oneRPL, oneETH, time_from_now, skip_time, grab_RPL, create_pool, rewards_args,
+                      rp, vault, lender, other, node, rocketlend, poolId, joined, borrowed)
+from test_rewards import write_rewards_file
+
+pytestmark = pytest.mark.local
+
+@pytest.fixture()
+def defaulted(chain, rocketlend, poolId, borrowed, rp, vault):
+    # 20 RPL and 1 ETH (100 RPL at the local price) in the borrower's Rocket Lend balance
+    rocketlend.claimMerkleRewards(borrowed, *rewards_args(rp, vault, borrowed, [8], 20 * oneRPL, oneETH), 0,
+                                  sender=borrowed)
+    return borrowed
+
+def make_keeper(chain, rocketlend, **kwargs):
+    abi = rocketlend.contract_type.model_dump(mode='json', by_alias=True)['abi']
+    keeper = Keeper(chain.provider.web3, rocketlend.address, abi, log=lambda message: None, **kwargs)
+    return keeper
+
+def test_nothing_before_end(chain, rocketlend, poolId, defaulted, lender):
+    keeper = make_keeper(chain, rocketlend, sender=lender.address, dryRun=True)
+    assert asyncio.run(keeper.run_once()) == []
+
+def test_dry_run_prefers_eth_before_cooldown(chain, rocketlend, poolId, defaulted, lender):
+    skip_time(chain, days=15)
+    chain.mine()
+    keeper = make_keeper(chain, rocketlend, sender=lender.address, dryRun=True)
+    [(action, txHash)] = asyncio.run(keeper.run_once())
+    assert txHash is None
+    # unstaking would recover all of it, but is not possible yet
+    assert action.function == 'forceRepayETH'
+    assert action.recoveredRPL == 100 * oneRPL
+    assert rocketlend.borrowers(defaulted).ETH == oneETH
+
+def test_only_given_pools(chain, rocketlend, poolId, defaulted, lender):
+    skip_time(chain, days=15)
+    chain.mine()
+    keeper = make_keeper(chain, rocketlend, sender=lender.address, dryRun=True, poolIds=[poolId + 1])
+    assert asyncio.run(keeper.run_once()) == []
+
+def test_dry_run_other_only_rpl(chain, rocketlend, poolId, defaulted, other):
+    skip_time(chain, days=15)
+    chain.mine()
+    keeper = make_keeper(chain, rocketlend, sender=other.address, dryRun=True)
+    [(action, _)] = asyncio.run(keeper.run_once())
+    assert action.function == 'forceRepayRPL'
+    assert action.recoveredRPL == 20 * oneRPL
+
+def test_submit_unstake_after_cooldown(chain, rocketlend, poolId, defaulted, lender, other, rp, vault):
+    skip_time(chain, days=30)
+    chain.mine()
+    keeper = make_keeper(chain, rocketlend, account=Account.from_key(lender.private_key))
+    [(action, txHash)] = asyncio.run(keeper.run_once())
+    assert action.function == 'forceRepayRPL' and 0 < action.args[3]
+    receipt = chain.provider.web3.eth.wait_for_transaction_receipt(txHash)
+    assert receipt['status'] == 1
+    # all but the interest charged between the latest block and the transaction's
+    loan = rocketlend.loans(poolId, defaulted)
+    assert loan.borrowed + loan.interestDue < oneRPL // 10 ** 6
+    # the next round recovers the rest, with the next nonce
+    [(action, txHash)] = asyncio.run(keeper.run_once())
+    assert chain.provider.web3.eth.get_transaction(txHash)['nonce'] == lender.nonce - 1
+
+def test_dry_run_counts_refunds(project, chain, rocketlend, poolId, borrowed, lender, other, rp):
+    # a refund left in the minipool by someone else's distribution, and nothing in Rocket Lend
+    minipool = project.RocketMinipool.at(rp['rocketMinipoolManager'].getNodeMinipoolAt(borrowed, 0))
+    other.transfer(minipool, oneETH)
+    minipool.distributeBalance(True, sender=other)
+    refund = minipool.getNodeRefundBalance()
+    assert 0 < refund
+    skip_time(chain, days=15)
+    chain.mine()
+    keeper = make_keeper(chain, rocketlend, sender=lender.address, dryRun=True)
+    [(action, _)] = asyncio.run(keeper.run_once())
+    assert action.function == 'forceDistributeRefund'
+    assert action.args[3:] == (False, [(0, 1 << 2)])
+    # 100 RPL per ETH at the local price
+    assert action.recoveredRPL == 100 * refund
+
+def test_submit_claim_rewards(tmp_path, chain, rocketlend, poolId, defaulted, other, rp, vault):
+    # 50 RPL of unclaimed rewards, on top of the 20 RPL balance
+    distributor = rp['rocketMerkleDistributorMainnet']
+    distributor.setMerkleRoot(9, write_rewards_file(tmp_path, 9, {defaulted.address: (50 * oneRPL, 0)}), sender=vault)
+    rp['rocketTokenRPL'].transfer(distributor, 50 * oneRPL, sender=vault)
+    index = RewardsIndex(':memory:')
+    index.update(tmp_path)
+    abi = rocketlend.contract_type.model_dump(mode='json', by_alias=True)['abi']
+    claims = ClaimBuilder(chain.provider.web3, rocketlend.address, abi, index)
+    skip_time(chain, days=15)
+    chain.mine()
+    keeper = make_keeper(chain, rocketlend, account=Account.from_key(other.private_key), claims=claims)
+    [(action, txHash)] = asyncio.run(keeper.run_once())
+    assert action.function == 'forceClaimMerkleRewards'
+    assert action.recoveredRPL == 70 * oneRPL
+    assert chain.provider.web3.eth.wait_for_transaction_receipt(txHash)['status'] == 1
+    assert rocketlend.intervals(defaulted, 9)
+    assert rocketlend.borrowers(defaulted).RPL == 0
+    assert claims.arguments(defaulted) == []
@@ -0,0 +1,36 @@
+import asyncio
+import pytest
+from eth_account import Account
+from client.load import LoadGenerator, Result, report, length_bucket
+from test_gas import (oneRPL, rp, vault, lender, other, node, rocketlend, poolId, joined, borrowed)
+
+def test_report():
+    results = ([Result('borrow', 100_000 + 900 * length, 1, 0.5, length) for length in range(8)] +
+               [Result('repay', 60_000, 0, 0.25, 2), Result('createPool', 200_000, 1, 1.0)])
+    summary = report(results, 2.0)
+    assert (summary['transactions'], summary['reverted'], summary['tps']) == (10, 1, 5)
+    assert summary['gas']['borrow']['p50'] == 100_000 + 900 * 3
+    assert summary['gas']['borrow']['max'] == 100_000 + 900 * 7
+    assert summary['gas']['repay'] == dict(count=1, reverted=1, latency50=0.25, latency90=0.25)
+    # reverted and createPool (not on a node's list) are left out
+    assert list(summary['debtPools']) == ['borrow']
+    assert summary['debtPools']['borrow']['perItem'] == pytest.approx(900)
+    assert {bucket: entry['count'] for bucket, entry in summary['debtPools']['borrow']['buckets'].items()} == {
+        0: 1, 1: 1, 2: 2, 4: 4}
+    assert [length_bucket(length) for length in [0, 1, 2, 3, 4, 7, 8]] == [0, 1, 2, 2, 4, 4, 8]
+
+@pytest.mark.local
+def test_load(chain, rocketlend, lender, poolId, borrowed, vault):
+    abi = rocketlend.contract_type.model_dump(mode='json', by_alias=True)['abi']
+    generator = LoadGenerator(chain.provider.web3, rocketlend.address, abi,
+                              [Account.from_key(lender.private_key)], [Account.from_key(borrowed.private_key)],
+                              [poolId], supply=1000 * oneRPL, concurrency=4, callThreads=1, seed=1,
+                              log=lambda message: None)
+    asyncio.run(generator.prepare(Account.from_key(vault.private_key)))
+    summary = asyncio.run(generator.run(40))
+    assert summary['transactions'] == 40
+    assert summary['reverted'] == 0
+    assert sum(entry['count'] for entry in summary['gas'].values()) == 40
+    # the pools it created are among those it borrows from
+    assert len(generator.poolIds) == 1 + summary['gas'].get('createPool', {}).get('count', 0)
+    assert 'borrow' in summary['debtPools']
@@ -0,0 +1,58 @@
+import asyncio
+import pytest
+from client.minipools import MinipoolPlanner
+from test_gas import (oneETH, Distribute, NotRewardsOnly, Refund, add_minipools, fund_minipools,
+                      rp, vault, other, node, rocketlend, joined)
+
+pytestmark = pytest.mark.local
+
+@pytest.fixture()
+def planner(chain, rocketlend):
+    abi = rocketlend.contract_type.model_dump(mode='json', by_alias=True)['abi']
+    return MinipoolPlanner(chain.provider.web3, rocketlend.address, abi)
+
+@pytest.fixture()
+def minipools(project, rocketStorage, rocketlend, joined, other, rp, vault):
+    """Indices of four new minipools: rewards to distribute, a full balance, nothing, and a refund."""
+    first = rp['rocketMinipoolManager'].getNodeMinipoolCount(joined)
+    add_minipools(project, rocketStorage, rp, vault, joined, 4)
+    indices = list(range(first, first + 4))
+    fund_minipools(rp, joined, [indices[0], indices[3]], other)
+    fund_minipools(rp, joined, [indices[1]], other, 32 * oneETH)
+    # distributed by someone other than the owner, so the node's share waits for a refund
+    minipool = rp['rocketMinipoolManager'].getNodeMinipoolAt(joined, indices[3])
+    project.RocketMinipool.at(minipool).distributeBalance(True, sender=other)
+    return indices
+
+def planned(plan, indices):
+    return [(index, action) for index, action in plan.minipools if index in indices]
+
+def test_plan_only_minipools_with_eth(planner, joined, minipools):
+    plan = asyncio.run(planner.plan(joined))
+    assert planned(plan, minipools) == [(minipools[0], 1 << Distribute),
+                                        (minipools[1], (1 << Distribute) | (1 << NotRewardsOnly)),
+                                        (minipools[3], 1 << Refund)]
+    assert plan.needsOwner
+    assert 33 * oneETH < plan.ETH
+
+def test_plan_without_owner_actions(planner, joined, minipools):
+    plan = asyncio.run(planner.plan(joined, ownerActions=False))
+    assert planned(plan, minipools) == [(minipools[0], 1 << Distribute)]
+    assert not plan.needsOwner
+
+def test_plan_executes(rocketlend, planner, joined, minipools):
+    plan = asyncio.run(planner.plan(joined))
+    [gas] = asyncio.run(planner.estimate_gas(plan))
+    ETH = rocketlend.borrowers(joined).ETH
+    [(distribute, arguments)] = list(plan.batches())
+    receipt = rocketlend.distributeRefund(joined, distribute, arguments, sender=joined)
+    assert receipt.gas_used <= gas
+    assert ETH < rocketlend.borrowers(joined).ETH
+    # nothing left to move
+    assert asyncio.run(planner.plan(joined)).minipools == []
+
+def test_batches(planner, joined, minipools):
+    plan = asyncio.run(planner.plan(joined))
+    batches = list(plan.batches(2))
+    assert [arguments for _, arguments in batches] == [plan.minipools[i:i + 2] for i in range(0, len(plan.minipools), 2)]
+    assert [distribute for distribute, _ in batches[1:]] == [False] * (len(batches) - 1)
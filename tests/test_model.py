@@ -0,0 +1,160 @@
+import random
+import pytest
+from client.interest import charge_interest
+from client.model import (Model, Borrower, Differential, Revert, ZERO_ADDRESS, oneEther, random_operations)
+from test_gas import (oneRPL, oneETH, grab_RPL, join, rp, vault, lender, other, node, rocketlend, joined)
+
+day = 24 * 60 * 60
+
+lenders = ['0x' + '%040x' % i for i in (1, 2)]
+others = ['0x' + '%040x' % i for i in (3,)]
+nodes = ['0x' + '%040x' % i for i in (10, 11)]
+
+def new_model(time=1_700_000_000):
+    model = Model(time=time)
+    for address in nodes:
+        model.add_node(address, ETHProvided=24 * oneEther)
+        model.borrowerRecords[address] = Borrower()
+        model.borrowerRecords[address].address = address
+    return model
+
+def create_pool(model, days=10, rate=10, supply=1000 * oneRPL, lender=lenders[0]):
+    return model.createPool(lender, (rate, model.time + days * day), supply, 0, [ZERO_ADDRESS])
+
+def reverts(reason):
+    return pytest.raises(Revert, match=f'^{reason}$')
+
+def check_invariants(model):
+    # more is held if transferDebt lent more than it repaid
+    assert model.RPL >= (sum(pool.available for pool in model.poolRecords.values()) +
+                         sum(borrower.RPL for borrower in model.borrowerRecords.values()))
+    for poolId, pool in model.poolRecords.items():
+        assert pool.borrowed == sum(loan.borrowed for (loanPoolId, _), loan in model.loanRecords.items()
+                                    if loanPoolId == poolId)
+        poolNodes = {model.poolNodes[poolId, i] for i in range(pool.nodeCount)}
+        assert poolNodes == {address for address in nodes if not model._loanEmpty(poolId, address)}
+    for address in nodes:
+        loans = {poolId: loan for (poolId, loanNode), loan in model.loanRecords.items()
+                 if loanNode == address and (loan.borrowed or loan.interestDue)}
+        assert model.borrowers(address).borrowed == sum(loan.borrowed for loan in loans.values())
+        assert model.borrowers(address).interestDue == sum(loan.interestDue for loan in loans.values())
+        items = [poolId for _, poolId in model.debt_pool_items(address)]
+        assert sorted(items) == sorted(loans)
+        endTimes = [model.params(poolId).endTime for poolId in items]
+        assert endTimes == sorted(endTimes)
+
+def test_interest_matches_projection():
+    model = new_model()
+    poolId = create_pool(model, rate=37)
+    model.borrow(nodes[0], poolId, nodes[0], 0, 333 * oneRPL + 12345, [])
+    start = model.time
+    for days in [3, 5, 30]:
+        model.time = start + days * day
+        loan = model.loans(poolId, nodes[0])
+        [expected] = charge_interest([loan.borrowed], [loan.accountedUntil], [37],
+                                     [model.params(poolId).endTime], [model.time])
+        model.updateInterestDue(others[0], poolId, nodes[0])
+        assert model.loans(poolId, nodes[0]).interestDue == loan.interestDue + expected
+
+def test_revert_leaves_state_unchanged():
+    model = new_model()
+    poolId = create_pool(model)
+    model.borrow(nodes[0], poolId, nodes[0], 0, 100 * oneRPL, [])
+    other = create_pool(model, days=5, supply=2000 * oneRPL)
+    before = (model.pools(other), model.loans(other, nodes[0]), model.borrowers(nodes[0]),
+              model.debt_pool_items(nodes[0]), model.nodeRecords[nodes[0]].staked, model.RPL)
+    # the limit is 1200 RPL (24 ETH at 0.01 ETH per RPL, 50%), and the insertion happened before the check
+    with reverts('bl'):
+        model.borrow(nodes[0], other, nodes[0], 0, 1101 * oneRPL, [])
+    assert before == (model.pools(other), model.loans(other, nodes[0]), model.borrowers(nodes[0]),
+                      model.debt_pool_items(nodes[0]), model.nodeRecords[nodes[0]].staked, model.RPL)
+    assert model.debtPools(nodes[0], 0) == (1, 1)
+
+def test_transfer_debt_authorization():
+    model = new_model()
+    fromPool = create_pool(model, days=5, rate=10)
+    higher = create_pool(model, days=20, rate=20)
+    lower = create_pool(model, days=20, rate=5)
+    model.borrow(nodes[0], fromPool, nodes[0], 0, 100 * oneRPL, [])
+    # not before the end time, not from another lender, not to a higher rate
+    with reverts('a'):
+        model.transferDebt(lenders[0], nodes[0], fromPool, 0, lower, 1, 0, 0, 0, [])
+    model.time += 6 * day
+    with reverts('a'):
+        model.transferDebt(lenders[1], nodes[0], fromPool, 0, lower, 1, 0, 0, 0, [])
+    with reverts('a'):
+        model.transferDebt(lenders[0], nodes[0], fromPool, 0, higher, 1, 0, 0, 0, [])
+    # lower ends after fromPool, so goes after it (at index 1) in the list
+    with reverts('n'):
+        model.transferDebt(lenders[0], nodes[0], fromPool, 0, lower, 0, 0, 0, 1, [])
+    debt = sum(model.loans(fromPool, nodes[0])[:2]) + model.accruedInterest(fromPool, nodes[0])
+    model.transferDebt(lenders[0], nodes[0], fromPool, 0, lower, 1, 0, 0, debt, [])
+    assert model.loans(fromPool, nodes[0]).borrowed == 0
+    assert model.loans(lower, nodes[0]).borrowed == debt
+    assert model.debt_pool_items(nodes[0]) == [(2, lower)]
+    assert model.pools(fromPool).available == 900 * oneRPL + debt
+
+def test_pool_interest_matches_loans():
+    model = new_model()
+    poolId = create_pool(model, days=10, rate=25)
+    model.borrow(nodes[0], poolId, nodes[0], 0, 300 * oneRPL + 7, [])
+    model.time += 2 * day
+    model.borrow(nodes[1], poolId, nodes[1], 0, 123 * oneRPL, [])
+
+    def loans_interest():
+        return sum(model.loans(poolId, node).interestDue + model.accruedInterest(poolId, node) for node in nodes)
+
+    # past the end time, where the rate doubles
+    for days in [3, 9, 4]:
+        model.time += days * day
+        assert 0 <= model.poolInterest(poolId) - loans_interest() <= len(nodes)
+        model.repay(nodes[0], poolId, nodes[0], 0, 0, oneRPL)
+    for node in nodes:
+        model.repay(others[0], poolId, node, 0, 0, 0)
+    assert model.poolInterest(poolId) <= len(nodes)
+
+@pytest.mark.parametrize('seed', range(4))
+def test_random_invariants(seed):
+    model = new_model()
+    rng = random.Random(seed)
+    for operation in random_operations(model, rng, lenders, nodes, others, 1000):
+        try:
+            model.apply(operation)
+        except Revert:
+            pass
+        check_invariants(model)
+
+## Differential testing against the contract
+
+@pytest.fixture()
+def node2(accounts, rp, rocketlend, rocketStorage, vault, nodeIndex):
+    address = accounts[rp['rocketNodeManager'].getNodeAt(nodeIndex['node1'])]
+    join(rocketlend, rocketStorage, address)
+    rp['rocketNodeStaking'].setNodeETHProvided(address, 8 * oneETH, sender=vault)
+    return address
+
+@pytest.fixture()
+def differential(chain, accounts, rocketlend, rp, vault, lender, other, joined, node2):
+    from ape.exceptions import ContractLogicError
+    for account in [lender, accounts[1], other, joined, node2]:
+        grab_RPL(account, 1_000_000 * oneRPL, rp, vault, rocketlend)
+
+    def send(operation):
+        chain.pending_timestamp = operation.time
+        try:
+            getattr(rocketlend, operation.name)(*operation.args, sender=accounts[operation.sender])
+        except ContractLogicError as e:
+            return e.message or ''
+
+    abi = rocketlend.contract_type.model_dump(mode='json', by_alias=True)['abi']
+    return Differential(chain.provider.web3, rocketlend.address, abi, send, [joined, node2])
+
+@pytest.mark.local
+@pytest.mark.parametrize('seed', range(3))
+def test_differential(differential, accounts, lender, other, joined, node2, seed):
+    operations = random_operations(differential.model, random.Random(seed),
+                                   [lender.address, accounts[1].address], [joined.address, node2.address],
+                                   [other.address], 100)
+    reverted = differential.replay(operations)
+    assert reverted < 100
+    assert differential.model.nextPoolId
@@ -0,0 +1,84 @@
+import json
+import pytest
+from client.allowlist import MerkleTree
+from client.rewards import RewardsIndex, ClaimBuilder, MissingRoot, leaf
+from test_gas import (oneRPL, oneETH, rp, vault, node, rocketlend, joined)
+
+pytestmark = pytest.mark.local
+
+otherNode = '0x000000000000000000000000000000000000dEaD'
+
+def write_rewards_file(directory, interval, rewards):
+    """A rewards file for interval, with rewards a {node: (amountRPL, amountETH)}, returning its root."""
+    nodes = list(rewards)
+    tree = MerkleTree(leaf(node, 0, *rewards[node]) for node in nodes)
+    nodeRewards = {node: dict(rewardNetwork=0, collateralRpl=str(amountRPL), oracleDaoRpl='0',
+                              smoothingPoolEth=str(amountETH),
+                              merkleProof=['0x' + item.hex() for item in tree.proof_at(i)])
+                   for i, (node, (amountRPL, amountETH)) in enumerate(rewards.items())}
+    path = directory / f'rp-rewards-devnet-{interval}.json'
+    path.write_text(json.dumps(dict(index=interval, merkleRoot='0x' + tree.root.hex(), nodeRewards=nodeRewards)))
+    return tree.root
+
+@pytest.fixture()
+def rewardsFiles(tmp_path, joined, rp, vault):
+    distributor = rp['rocketMerkleDistributorMainnet']
+    for interval in range(8, 13):
+        rewards = {joined.address: (interval * oneRPL, oneETH // 10), otherNode: (oneRPL, 0)}
+        distributor.setMerkleRoot(interval, write_rewards_file(tmp_path, interval, rewards), sender=vault)
+    rp['rocketTokenRPL'].transfer(distributor, 100 * oneRPL, sender=vault)
+    vault.transfer(distributor, oneETH)
+    return tmp_path
+
+@pytest.fixture()
+def builder(chain, rocketlend, rewardsFiles):
+    index = RewardsIndex(':memory:')
+    index.update(rewardsFiles)
+    abi = rocketlend.contract_type.model_dump(mode='json', by_alias=True)['abi']
+    return ClaimBuilder(chain.provider.web3, rocketlend.address, abi, index)
+
+def test_update_only_changed(tmp_path, rewardsFiles):
+    index = RewardsIndex(str(tmp_path / 'rewards.db'))
+    assert index.update(rewardsFiles) == list(range(8, 13))
+    assert index.update(rewardsFiles) == []
+    write_rewards_file(rewardsFiles, 9, {otherNode: (2 * oneRPL, 0)})
+    assert index.update(rewardsFiles) == [9]
+    assert [reward.interval for reward in index.rewards(otherNode)] == list(range(8, 13))
+    assert index.rewards(otherNode)[1].amountRPL == 2 * oneRPL
+
+def test_claim_in_batches(rocketlend, builder, joined):
+    batches = builder.arguments(joined, size=2)
+    assert [rewardIndex for rewardIndex, *_ in batches] == [[8, 9], [10, 11], [12]]
+    for args in batches:
+        rocketlend.claimMerkleRewards(joined, *args, 0, sender=joined)
+    assert all(rocketlend.intervals(joined, interval) for interval in range(8, 13))
+    assert rocketlend.borrowers(joined).RPL == sum(range(8, 13)) * oneRPL
+    # claimed intervals are skipped
+    assert builder.arguments(joined) == []
+
+def test_skips_claimed(rocketlend, builder, joined):
+    [args] = builder.arguments(joined)
+    rocketlend.claimMerkleRewards(joined, *(arg[:1] for arg in args), 0, sender=joined)
+    assert [rewardIndex for rewardIndex, *_ in builder.arguments(joined)] == [[9, 10, 11, 12]]
+
+def test_skips_claimed_at_distributor(rp, builder, joined):
+    # claimed directly, so Rocket Lend has not seen it yet
+    rp['rocketMerkleDistributorMainnet'].setClaimed(10, joined, True, sender=joined)
+    assert not builder.contract.functions.intervals(joined.address, 10).call()
+    assert [rewardIndex for rewardIndex, *_ in builder.arguments(joined)] == [[8, 9, 11, 12]]
+
+def test_invalid_proof(builder, rewardsFiles, joined):
+    # a file whose root does not match its proofs
+    path = rewardsFiles / 'rp-rewards-devnet-10.json'
+    tree = json.loads(path.read_text())
+    tree['merkleRoot'] = '0x' + '11' * 32
+    path.write_text(json.dumps(tree))
+    builder.index.add_file(path)
+    with pytest.raises(ValueError):
+        builder.arguments(joined)
+
+def test_missing_root(builder, joined):
+    with builder.index.db:
+        builder.index.db.execute('delete from roots where interval = 11')
+    with pytest.raises(MissingRoot):
+        builder.arguments(joined)
@@ -1,17 +1,15 @@
+import re
 import time
 import datetime
 import pytest
 from eth_utils import keccak
-from ape import reverts
+from conftest import chain_state
+import ape
 
 # Setup
 
 ## Constants
 
-rocketStorageAddresses = dict(
-        mainnet='0x1d8f8f00cfa6758d7bE78336684788Fb0ee0Fa46',
-        holesky='0x594Fb75D3dc2DFa0150Ad03F99F97817747dd4E1')
-
 SECONDS_PER_YEAR = 365 * 24 * 60 * 60
 
 nullAddress = '0x0000000000000000000000000000000000000000'
@@ -33,11 +31,15 @@ def mark_not_allowed(nodes):
 def time_from_now(**kwargs):
     return round(time.time() + datetime.timedelta(**kwargs).total_seconds())
 
+# forked networks report revert reasons as 'revert: <reason>', the local test provider as '<reason>'
+def reverts(message=None):
+    if message is not None:
+        message = re.compile(f'(revert: )?{re.escape(message.removeprefix("revert: "))}$')
+    return ape.reverts(message)
+
 ## Rocket Pool contracts
 
-@pytest.fixture()
-def rocketStorage(chain, Contract):
-    return Contract(rocketStorageAddresses[chain.provider.network.name.removesuffix('-fork')])
+# rocketStorage (live or local stand-in, see --rocket-pool) is in conftest.py
 
 @pytest.fixture()
 def minipoolABI(rocketStorage, Contract):
@@ -111,8 +113,9 @@ def lender2(accounts):
     return accounts[2]
 
 @pytest.fixture()
-def node1(rocketNodeManager, rocketStorage, accounts):
-    nodeAddress = rocketNodeManager.getNodeAt(4)
+@chain_state
+def node1(rocketNodeManager, rocketStorage, accounts, nodeIndex):
+    nodeAddress = rocketNodeManager.getNodeAt(nodeIndex['node1'])
     node = accounts[nodeAddress]
     if node.balance < 10 ** 18:
       accounts[3].transfer(nodeAddress, '1 ETH')
@@ -124,21 +127,23 @@ def node1(rocketNodeManager, rocketStorage, accounts):
     return node
 
 @pytest.fixture()
-def node2(rocketNodeManager, accounts):
-    nodeAddress = rocketNodeManager.getNodeAt(69)
+def node2(rocketNodeManager, accounts, nodeIndex):
+    nodeAddress = rocketNodeManager.getNodeAt(nodeIndex['node2'])
     return accounts[nodeAddress]
 
 @pytest.fixture()
-def node3(rocketNodeManager, accounts):
-    nodeAddress = rocketNodeManager.getNodeAt(420)
+@chain_state
+def node3(rocketNodeManager, accounts, nodeIndex):
+    nodeAddress = rocketNodeManager.getNodeAt(nodeIndex['node3'])
     node = accounts[nodeAddress]
     if node.balance < 10 ** 18:
       accounts[3].transfer(nodeAddress, '1 ETH')
     return node
 
 @pytest.fixture()
-def nodeWithMPs(rocketNodeManager, rocketMinipoolManager, accounts):
-    nodeAddress = rocketNodeManager.getNodeAt(252)
+@chain_state
+def nodeWithMPs(rocketNodeManager, rocketMinipoolManager, accounts, nodeIndex):
+    nodeAddress = rocketNodeManager.getNodeAt(nodeIndex['nodeWithMPs'])
     node = accounts[nodeAddress]
     if node.balance < 10 ** 18:
       accounts[3].transfer(nodeAddress, '1 ETH')
@@ -148,13 +153,20 @@ def nodeWithMPs(rocketNodeManager, rocketMinipoolManager, accounts):
 ## Deployment and basic tests post-deployment
 
 @pytest.fixture()
+@chain_state
 def rocketlend(project, rocketStorage, deployer):
     return deployer.deploy(project.rocketlend, rocketStorage)
 
+@pytest.fixture()
+@chain_state
+def rocketlendLens(project, rocketlend, deployer):
+    return deployer.deploy(project.rocketlendLens, rocketlend)
+
 def test_send_eth_other(rocketlend, other):
     with reverts('revert: a'):
         other.transfer(rocketlend, 20)
 
+@pytest.mark.fork
 def test_set_name_other(rocketlend, other, Contract):
     receipt = rocketlend.setName(sender=other)
     ensRegistry = Contract('0x00000000000C2E074eC69A0dFb2997BA6C7d2e1e')
@@ -175,29 +187,32 @@ def test_set_name_other(rocketlend, other, Contract):
 ## Pool creation
 
 @pytest.fixture()
+@chain_state
 def rocketlendp(rocketlend, RPLToken, rocketVaultImpersonated, lender2):
     amount = 200 * 10 ** RPLToken.decimals()
     grab_RPL(lender2, amount, RPLToken, rocketVaultImpersonated, rocketlend)
     endTime=time_from_now(weeks=2)
     params = dict(interestRate=10, endTime=endTime)
     receipt = rocketlend.createPool(params, amount, 0, [0], sender=lender2)
-    poolId = receipt.return_value
+    poolId = rocketlend.CreatePool.from_receipt(receipt)[0].id
     return dict(receipt=receipt, lender=lender2, rocketlend=rocketlend, poolId=poolId, endTime=endTime, amount=amount)
 
 # same as above but with longer endtime
 @pytest.fixture()
+@chain_state
 def rocketlendpl(rocketlend, RPLToken, rocketVaultImpersonated, lender2):
     amount = 200 * 10 ** RPLToken.decimals()
     grab_RPL(lender2, amount, RPLToken, rocketVaultImpersonated, rocketlend)
     endTime=time_from_now(days=31*6)
     params = dict(interestRate=10, endTime=endTime)
     receipt = rocketlend.createPool(params, amount, 0, [0], sender=lender2)
-    poolId = receipt.return_value
+    poolId = rocketlend.CreatePool.from_receipt(receipt)[0].id
     return dict(receipt=receipt, lender=lender2, rocketlend=rocketlend, poolId=poolId, endTime=endTime, amount=amount)
 
 ## Borrower joining
 
 @pytest.fixture()
+@chain_state
 def borrower1(rocketlendp, node1, rocketStorage, accounts):
     current_wa = accounts[rocketStorage.getNodeWithdrawalAddress(node1)]
     rocketlend = rocketlendp['rocketlend']
@@ -206,6 +221,7 @@ def borrower1(rocketlendp, node1, rocketStorage, accounts):
     return dict(node=node1, borrower=current_wa, rocketlend=rocketlend)
 
 @pytest.fixture()
+@chain_state
 def nodeWithMPsJoined(rocketlend, rocketStorage, other, nodeWithMPs, accounts):
     current_wa = accounts[rocketStorage.getNodeWithdrawalAddress(nodeWithMPs)]
     rocketStorage.setWithdrawalAddress(nodeWithMPs, rocketlend, False, sender=current_wa)
@@ -215,6 +231,7 @@ def nodeWithMPsJoined(rocketlend, rocketStorage, other, nodeWithMPs, accounts):
 ## Borrowing
 
 @pytest.fixture()
+@chain_state
 def borrower1b(rocketlendp, RPLToken, rocketNodeDeposit, borrower1, other):
     rocketlend = rocketlendp['rocketlend']
     poolId = rocketlendp['poolId']
@@ -222,10 +239,11 @@ def borrower1b(rocketlendp, RPLToken, rocketNodeDeposit, borrower1, other):
     borrower = borrower1['borrower']
     amount = 50 * 10 ** RPLToken.decimals()
     rocketNodeDeposit.depositEthFor(node, value='8 ether', sender=other)
-    receipt = rocketlend.borrow(poolId, node, 0, amount, sender=borrower)
+    receipt = rocketlend.borrow(poolId, node, 0, amount, [], sender=borrower)
     return dict(borrower1, poolId=poolId, lender=rocketlendp['lender'], amount=amount, receipt=receipt)
 
 @pytest.fixture()
+@chain_state
 def borrower1bl(rocketlendpl, RPLToken, rocketNodeDeposit, borrower1, other):
     rocketlend = rocketlendpl['rocketlend']
     poolId = rocketlendpl['poolId']
@@ -233,12 +251,13 @@ def borrower1bl(rocketlendpl, RPLToken, rocketNodeDeposit, borrower1, other):
     borrower = borrower1['borrower']
     amount = 50 * 10 ** RPLToken.decimals()
     rocketNodeDeposit.depositEthFor(node, value='8 ether', sender=other)
-    receipt = rocketlend.borrow(poolId, node, 0, amount, sender=borrower)
+    receipt = rocketlend.borrow(poolId, node, 0, amount, [], sender=borrower)
     return dict(borrower1, poolId=poolId, lender=rocketlendpl['lender'], amount=amount, receipt=receipt)
 
 ## Repayment
 
 @pytest.fixture()
+@chain_state
 def partialRepayment(borrower1b, other, RPLToken, rocketVaultImpersonated):
     rocketlend = borrower1b['rocketlend']
     poolId = borrower1b['poolId']
@@ -252,6 +271,7 @@ def partialRepayment(borrower1b, other, RPLToken, rocketVaultImpersonated):
 ## Rewards
 
 @pytest.fixture()
+@chain_state
 def distributedRewards(rocketlend, nodeWithMPsJoined, rocketMinipoolManager, Contract, minipoolABI, accounts):
     node = nodeWithMPsJoined['node']
     minipool = None
@@ -350,13 +370,45 @@ def test_intervals_set_first_10(borrower1, rocketRewardsPool, rocketMerkleDistri
     current_index = rocketRewardsPool.getRewardIndex()
     assert rocketlend.borrowers(node).index == current_index
     for i in range(max(current_index, 10)):
-        rocketlend.intervals(node, i) == rocketMerkleDistributor.isClaimed(i, node)
+        assert rocketlend.intervals(node, i) == rocketMerkleDistributor.isClaimed(i, node)
+
+@pytest.mark.local
+def test_intervals_across_words(rocketlend, rocketStorage, rocketRewardsPool, rocketMerkleDistributor, node1, admin, accounts):
+    claimed = [0, 3, 255, 256, 257, 511, 512, 599]
+    for i in claimed:
+        rocketMerkleDistributor.setClaimed(i, node1, True, sender=admin)
+    rocketRewardsPool.setRewardIndex(600, sender=admin)
+    current_wa = accounts[rocketStorage.getNodeWithdrawalAddress(node1)]
+    rocketStorage.setWithdrawalAddress(node1, rocketlend, False, sender=current_wa)
+    rocketlend.joinAsBorrower(node1, sender=current_wa)
+    assert rocketlend.borrowers(node1).index == 600
+    for i in range(610):
+        assert rocketlend.intervals(node1, i) == (i in claimed)
 
 ### rocketStorage
 
 def test_rocketstorage_address(rocketlend, rocketStorage):
     assert rocketlend.rocketStorage() == rocketStorage.address
 
+def test_cached_addresses(rocketlend, rocketNodeStaking, rocketNodeDeposit, rocketNodeManager,
+                          rocketMerkleDistributor, rocketRewardsPool, rocketNetworkPrices, rocketMinipoolManager):
+    assert rocketlend.rocketNodeStaking() == rocketNodeStaking.address
+    assert rocketlend.rocketNodeDeposit() == rocketNodeDeposit.address
+    assert rocketlend.rocketNodeManager() == rocketNodeManager.address
+    assert rocketlend.rocketMerkleDistributor() == rocketMerkleDistributor.address
+    assert rocketlend.rocketRewardsPool() == rocketRewardsPool.address
+    assert rocketlend.rocketNetworkPrices() == rocketNetworkPrices.address
+    assert rocketlend.rocketMinipoolManager() == rocketMinipoolManager.address
+
+@pytest.mark.local
+def test_update_cached_addresses(rocketlend, rocketStorage, other):
+    key = keccak('contract.addressrocketNetworkPrices'.encode())
+    old = rocketStorage.getAddress(key)
+    rocketStorage.setAddress(key, other, sender=other)
+    assert rocketlend.rocketNetworkPrices() == old
+    rocketlend.updateRocketPoolAddresses(sender=other)
+    assert rocketlend.rocketNetworkPrices() == other.address
+
 ### RPL
 
 def test_RPL_token_address(rocketlend, RPLToken):
@@ -366,6 +418,7 @@ def test_RPL_token_address(rocketlend, RPLToken):
 
 ### createPool
 
+@pytest.mark.fork
 def test_create_expired_pool(rocketlend, lender1):
     params = dict(interestRate=0, endTime=0)
     receipt = rocketlend.createPool(params, 0, 0, [0], sender=lender1)
@@ -373,6 +426,7 @@ def test_create_expired_pool(rocketlend, lender1):
     assert len(logs) == 1
     assert logs[0].id == receipt.return_value
 
+@pytest.mark.fork
 def test_create_pool(rocketlend, lender2):
     params = dict(interestRate=1, endTime=time_from_now(days=3))
     receipt = rocketlend.createPool(params, 0, 0, [0], sender=lender2)
@@ -380,6 +434,7 @@ def test_create_pool(rocketlend, lender2):
     assert len(logs) == 1
     assert logs[0].id == receipt.return_value
 
+@pytest.mark.fork
 def test_create_pool_with_supply(rocketlend, RPLToken, rocketVaultImpersonated, lender2):
     amount = 20 * 10 ** RPLToken.decimals()
     grab_RPL(lender2, amount, RPLToken, rocketVaultImpersonated, rocketlend)
@@ -459,6 +514,13 @@ def test_set_allowance_nonzero(rocketlendp):
     assert len(logs) == 1
     assert logs[0].old == 0
 
+def test_set_allowance_unlimited(rocketlendp):
+    rocketlend = rocketlendp['rocketlend']
+    poolId = rocketlendp['poolId']
+    lender = rocketlendp['lender']
+    rocketlend.setAllowance(poolId, 2 ** 256 - 1, sender=lender)
+    assert rocketlend.pools(poolId).allowance == 2 ** 128 - 1
+
 ### changeAllowedToBorrow
 
 def test_change_allowed_to_borrow_other(rocketlendp, other):
@@ -585,11 +647,41 @@ def test_withdraw_ether_from_pool_none(rocketlendp):
     poolId = rocketlendp['poolId']
     lender = rocketlendp['lender']
     assert rocketlend.pools(poolId).reclaimed == 0
-    with reverts(): # ('Integer underflow'): TODO why this message changed?
+    with reverts('revert: ov'):
         rocketlend.withdrawEtherFromPool(poolId, 20, sender=lender)
 
 #### TODO: successful withdraw of ETH
 
+### updateInterestDueMany
+
+def test_update_interest_due_many(rocketlendp, borrower1b, other, chain):
+    rocketlend = rocketlendp['rocketlend']
+    poolId = rocketlendp['poolId']
+    node = borrower1b['node']
+    chain.pending_timestamp += round(datetime.timedelta(days=3).total_seconds())
+    # the repeated loan is skipped, having been charged in this block
+    receipt = rocketlend.updateInterestDueMany([(poolId, node), (poolId, node), (poolId, other)], sender=other)
+    logs = rocketlend.UpdateInterestDueMany.from_receipt(receipt)
+    assert len(logs) == 1
+    assert logs[0].count == 2
+    assert 0 < logs[0].charged == rocketlend.loans(poolId, node).interestDue
+    assert rocketlend.ChargeInterest.from_receipt(receipt) == []
+    receipt = rocketlend.updateInterestDue(poolId, node, sender=other)
+    assert rocketlend.loans(poolId, node).interestDue - logs[0].charged == rocketlend.ChargeInterest.from_receipt(receipt)[0].charged
+
+### poolInterest
+
+def test_pool_interest(rocketlendp, borrower1b, other, chain):
+    rocketlend = rocketlendp['rocketlend']
+    poolId = rocketlendp['poolId']
+    node = borrower1b['node']
+    assert rocketlend.poolInterest(poolId) == 0
+    # past the end time, where the rate doubles
+    chain.pending_timestamp += round(datetime.timedelta(weeks=3).total_seconds())
+    rocketlend.updateInterestDue(poolId, node, sender=other)
+    interestDue = rocketlend.loans(poolId, node).interestDue
+    assert 0 < interestDue <= rocketlend.poolInterest(poolId) <= interestDue + 1
+
 ### forceRepayRPL
 
 def test_force_repay_rpl_not_ended(rocketlendp, borrower1b):
@@ -646,7 +738,7 @@ def test_force_eth_repay(rocketlendp, distributedRewards, RPLToken, rocketVaultI
     borrower = accounts[rocketlend.borrowers(node).address]
 
     amount = 50 * 10 ** RPLToken.decimals()
-    rocketlend.borrow(poolId, node, 0, amount, sender=borrower)
+    rocketlend.borrow(poolId, node, 0, amount, [], sender=borrower)
 
     # wait for pool to end
     chain.pending_timestamp += round(datetime.timedelta(weeks=2, days=1).total_seconds())
@@ -668,6 +760,78 @@ def test_force_eth_repay(rocketlendp, distributedRewards, RPLToken, rocketVaultI
     paidRPL = (paidEth * 10 ** 18) // rocketNetworkPrices.getRPLPrice()
     assert paidRPL * 0.99 <= prevDebt - afterDebt <= paidRPL * 1.01
 
+### forceRepayRPLMany, forceRepayETHMany
+
+def test_force_repay_rpl_many_not_ended(rocketlendp, borrower1b):
+    rocketlend = rocketlendp['rocketlend']
+    with reverts('revert: tm'):
+        rocketlend.forceRepayRPLMany(rocketlendp['poolId'], [(borrower1b['node'], 0, 0)], sender=rocketlendp['lender'])
+
+def test_force_repay_eth_many_other(rocketlendp, borrower1b, other):
+    rocketlend = rocketlendp['rocketlend']
+    with reverts('revert: a'):
+        rocketlend.forceRepayETHMany(rocketlendp['poolId'], [(borrower1b['node'], 0, 0)], sender=other)
+
+def test_force_repay_many_skips(rocketlendp, borrower1b, other, chain):
+    rocketlend = rocketlendp['rocketlend']
+    poolId = rocketlendp['poolId']
+    lender = rocketlendp['lender']
+    node = borrower1b['node']
+    chain.pending_timestamp += round(datetime.timedelta(weeks=2, days=1).total_seconds())
+    # node has nothing to repay with, other has no loan
+    args = [(node, 0, 0), (other, 0, 0)]
+    receipt = rocketlend.forceRepayRPLMany(poolId, args, sender=other)
+    assert [log['total'] for log in rocketlend.ForceRepayRPLMany.from_receipt(receipt)] == [0]
+    receipt = rocketlend.forceRepayETHMany(poolId, args, sender=lender)
+    assert [log['total'] for log in rocketlend.ForceRepayETHMany.from_receipt(receipt)] == [0]
+    assert rocketlend.loans(poolId, node).borrowed == borrower1b['amount']
+
+def test_force_repay_rpl_many_unstake(rocketlendp, borrower1b, other, chain, rocketNodeStaking):
+    rocketlend = rocketlendp['rocketlend']
+    poolId = rocketlendp['poolId']
+    node = borrower1b['node']
+    amount = borrower1b['amount'] // 5
+    # past the end time and the unstaking cooldown
+    chain.pending_timestamp += round(datetime.timedelta(days=30).total_seconds())
+    stakeBefore = rocketNodeStaking.getNodeRPLStake(node)
+    receipt = rocketlend.forceRepayRPLMany(poolId, [(node, 0, amount)], sender=other)
+    assert stakeBefore - rocketNodeStaking.getNodeRPLStake(node) == amount
+    assert [log['total'] for log in rocketlend.ForceRepayRPLMany.from_receipt(receipt)] == [amount]
+    assert rocketlend.loans(poolId, node).interestDue == 0
+    assert rocketlend.borrowers(node).RPL == 0
+
+def test_force_repay_rpl_many_bad_entries(rocketlendp, borrower1b, other, chain, rocketNodeStaking):
+    rocketlend = rocketlendp['rocketlend']
+    poolId = rocketlendp['poolId']
+    node = borrower1b['node']
+    chain.pending_timestamp += round(datetime.timedelta(days=30).total_seconds())
+    chain.mine()
+    stakeBefore = rocketNodeStaking.getNodeRPLStake(node)
+    # a wrong prevIndex is skipped, and an unstake of more than the debt (or the stake) is reduced
+    args = [(node, 1, 1), (other, 0, 0), (node, 0, 10 * borrower1b['amount'])]
+    receipt = rocketlend.forceRepayRPLMany(poolId, args, sender=other)
+    [log] = rocketlend.ForceRepayRPLMany.from_receipt(receipt)
+    assert borrower1b['amount'] <= log['total']
+    assert stakeBefore - rocketNodeStaking.getNodeRPLStake(node) == log['total']
+    assert rocketlend.borrowers(node).RPL == 0
+    loan = rocketlend.loans(poolId, node)
+    assert rocketNodeStaking.getNodeRPLStake(node) == 0 or loan.borrowed + loan.interestDue == 0
+
+def test_force_repay_eth_many(rocketlendp, distributedRewards, RPLToken, chain, accounts):
+    node = distributedRewards['node']
+    rocketlend = distributedRewards['rocketlend']
+    poolId = rocketlendp['poolId']
+    lender = rocketlendp['lender']
+    borrower = accounts[rocketlend.borrowers(node).address]
+    rocketlend.borrow(poolId, node, 0, 50 * 10 ** RPLToken.decimals(), [], sender=borrower)
+    chain.pending_timestamp += round(datetime.timedelta(weeks=2, days=1).total_seconds())
+    prevEth = rocketlend.borrowers(node).ETH
+    receipt = rocketlend.forceRepayETHMany(poolId, [(node, 0, 0)], sender=lender)
+    paidEth = prevEth - rocketlend.borrowers(node).ETH
+    assert 0 < paidEth
+    assert rocketlend.pools(poolId).reclaimed == paidEth
+    assert [log['total'] for log in rocketlend.ForceRepayETHMany.from_receipt(receipt)] == [paidEth]
+
 
 ### forceClaimMerkleRewards
 #### TODO
@@ -957,7 +1121,7 @@ def test_borrow_not_joined(rocketlendp, node1):
     rocketlend = rocketlendp['rocketlend']
     poolId = rocketlendp['poolId']
     with reverts('revert: a'):
-        rocketlend.borrow(poolId, node1, 0, 123, sender=node1)
+        rocketlend.borrow(poolId, node1, 0, 123, [], sender=node1)
 
 def test_borrow_from_node(rocketlendp, borrower1):
     rocketlend = rocketlendp['rocketlend']
@@ -965,7 +1129,7 @@ def test_borrow_from_node(rocketlendp, borrower1):
     node = borrower1['node']
     assert node.address != borrower1['borrower'].address
     with reverts('revert: a'):
-        rocketlend.borrow(poolId, node, 0, 123, sender=node)
+        rocketlend.borrow(poolId, node, 0, 123, [], sender=node)
 
 def test_borrow_limited(rocketlendp, borrower1, rocketNodeStaking, rocketNodeDeposit):
     rocketlend = rocketlendp['rocketlend']
@@ -974,7 +1138,7 @@ def test_borrow_limited(rocketlendp, borrower1, rocketNodeStaking, rocketNodeDep
     borrower = borrower1['borrower']
     assert rocketNodeStaking.getNodeETHProvided(node) + rocketNodeDeposit.getNodeEthBalance(node) == 0
     with reverts('revert: bl'):
-        rocketlend.borrow(poolId, node, 0, 123, sender=borrower)
+        rocketlend.borrow(poolId, node, 0, 123, [], sender=borrower)
 
 def test_borrow_against_credit(rocketlendp, borrower1, RPLToken, other, rocketNodeDeposit):
     rocketlend = rocketlendp['rocketlend']
@@ -983,13 +1147,206 @@ def test_borrow_against_credit(rocketlendp, borrower1, RPLToken, other, rocketNo
     borrower = borrower1['borrower']
     amount = 10 * 10 ** RPLToken.decimals()
     rocketNodeDeposit.depositEthFor(node, value='4 ether', sender=other)
-    receipt = rocketlend.borrow(poolId, node, 0, amount, sender=borrower)
+    receipt = rocketlend.borrow(poolId, node, 0, amount, [], sender=borrower)
     logs = rocketlend.Borrow.from_receipt(receipt)
     assert len(logs) == 1
     log = logs[0]
     assert log['borrowed'] == amount
     assert log['interestDue'] == 0
 
+### borrowMany
+
+def test_borrow_many_other(rocketlendp, borrower1, other):
+    rocketlend = rocketlendp['rocketlend']
+    with reverts('revert: a'):
+        rocketlend.borrowMany(borrower1['node'], [(rocketlendp['poolId'], 0, 123, [])], sender=other)
+
+def test_borrow_many(rocketlendLens, rocketlendp, rocketlendpl, borrower1, RPLToken, other, rocketNodeDeposit, rocketNodeStaking):
+    rocketlend = rocketlendp['rocketlend']
+    node = borrower1['node']
+    borrower = borrower1['borrower']
+    amount = 10 * 10 ** RPLToken.decimals()
+    rocketNodeDeposit.depositEthFor(node, value='8 ether', sender=other)
+    stake = rocketNodeStaking.getNodeRPLStake(node)
+    # the shorter pool goes in front of the longer one, inserted earlier in the same call
+    receipt = rocketlend.borrowMany(node, [(rocketlendpl['poolId'], 0, 2 * amount, []),
+                                           (rocketlendp['poolId'], 0, amount, [])], sender=borrower)
+    assert rocketNodeStaking.getNodeRPLStake(node) == stake + 3 * amount
+    assert rocketlend.loans(rocketlendp['poolId'], node).borrowed == amount
+    assert rocketlend.loans(rocketlendpl['poolId'], node).borrowed == 2 * amount
+    assert [loan.poolId for loan in rocketlendLens.position(node, 0).loans] == [rocketlendp['poolId'], rocketlendpl['poolId']]
+    logs = rocketlend.BorrowMany.from_receipt(receipt)
+    assert [(log['amount'], log['borrowed'], log['interestDue']) for log in logs] == [(3 * amount, 3 * amount, 0)]
+    assert rocketlend.Borrow.from_receipt(receipt) == []
+
+def test_borrow_many_limited(rocketlendp, rocketlendpl, borrower1, RPLToken, other, rocketNodeDeposit):
+    rocketlend = rocketlendp['rocketlend']
+    node = borrower1['node']
+    borrower = borrower1['borrower']
+    amount = 10 * 10 ** RPLToken.decimals()
+    rocketNodeDeposit.depositEthFor(node, value='1 ether', sender=other)
+    with reverts('revert: bl'):
+        rocketlend.borrowMany(node, [(rocketlendp['poolId'], 0, amount, []),
+                                     (rocketlendpl['poolId'], 1, 10 * amount, [])], sender=borrower)
+    assert rocketlend.borrowers(node).borrowed == 0
+
+### multicall
+
+def test_multicall_borrow_twice(rocketlendp, borrower1, RPLToken, other, rocketNodeDeposit):
+    rocketlend = rocketlendp['rocketlend']
+    poolId = rocketlendp['poolId']
+    node = borrower1['node']
+    borrower = borrower1['borrower']
+    amount = 10 * 10 ** RPLToken.decimals()
+    rocketNodeDeposit.depositEthFor(node, value='8 ether', sender=other)
+    receipt = rocketlend.multicall([
+        rocketlend.borrow.encode_input(poolId, node, 0, amount, []),
+        rocketlend.borrow.encode_input(poolId, node, 0, amount, []),
+    ], sender=borrower)
+    assert [log['borrowed'] for log in rocketlend.Borrow.from_receipt(receipt)] == [amount, 2 * amount]
+    assert rocketlend.borrowers(node).borrowed == 2 * amount
+
+def test_multicall_other(rocketlendp, borrower1, other):
+    rocketlend = rocketlendp['rocketlend']
+    node = borrower1['node']
+    with reverts('revert: a'):
+        rocketlend.multicall([rocketlend.withdraw.encode_input(node, 0, 0)], sender=other)
+
+def test_multicall_reverts_all(rocketlendp, borrower1, RPLToken, other, rocketNodeDeposit):
+    rocketlend = rocketlendp['rocketlend']
+    poolId = rocketlendp['poolId']
+    node = borrower1['node']
+    borrower = borrower1['borrower']
+    amount = 10 * 10 ** RPLToken.decimals()
+    rocketNodeDeposit.depositEthFor(node, value='1 ether', sender=other)
+    with reverts('revert: bl'):
+        rocketlend.multicall([
+            rocketlend.borrow.encode_input(poolId, node, 0, amount, []),
+            rocketlend.borrow.encode_input(poolId, node, 0, 10 * amount, []),
+        ], sender=borrower)
+    assert rocketlend.borrowers(node).borrowed == 0
+
+def test_multicall_limits(rocketlendp, borrower1):
+    rocketlend = rocketlendp['rocketlend']
+    poolId = rocketlendp['poolId']
+    lender = rocketlendp['lender']
+    node = borrower1['node']
+    # a call just under MAX_CALL_SIZE (16 KiB), room for e.g. a claim of 16 intervals with depth-20 proofs
+    disallow = rocketlend.changeAllowedToBorrow.encode_input(poolId, list(range(1, 509)))
+    assert len(disallow) <= 16384 < len(disallow) + 32
+    # and MAX_MULTICALL (32) calls in all
+    calls = [disallow] + [rocketlend.updateInterestDue.encode_input(poolId, node)] * 31
+    receipt = rocketlend.multicall(calls, sender=lender)
+    assert len(rocketlend.ChangeAllowedToBorrow.from_receipt(receipt)) == 508
+    with reverts():
+        rocketlend.multicall(calls + calls[-1:], sender=lender)
+    with reverts():
+        rocketlend.multicall([disallow + bytes(32)], sender=lender)
+
+### position
+
+def test_position_no_loans(rocketlendLens, rocketlendp, borrower1):
+    rocketlend = rocketlendp['rocketlend']
+    position = rocketlendLens.position(borrower1['node'], 0)
+    assert position.loans == []
+    assert position.borrowLimit == 0
+    assert position.RPL == 0
+    assert position.ETH == 0
+
+def test_position_accrues_interest(rocketlendLens, rocketlendp, borrower1b, rocketNetworkPrices, chain):
+    rocketlend = rocketlendp['rocketlend']
+    poolId = rocketlendp['poolId']
+    endTime = rocketlendp['endTime']
+    node = borrower1b['node']
+    amount = borrower1b['amount']
+    startTime = borrower1b['receipt'].timestamp
+    chain.pending_timestamp += 30 * 24 * 60 * 60
+    chain.mine()
+    now = chain.blocks.head.timestamp
+    interest = (amount * 10 * (endTime - startTime) // 100 // SECONDS_PER_YEAR +
+                amount * 20 * (now - endTime) // 100 // SECONDS_PER_YEAR)
+    # not yet charged
+    assert rocketlend.loans(poolId, node).interestDue == 0
+    position = rocketlendLens.position(node, 0)
+    assert [(loan.poolId, loan.borrowed, loan.interestDue, loan.endTime)
+            for loan in position.loans] == [(poolId, amount, interest, endTime)]
+    assert position.borrowLimit == 8 * 10 ** 18 * 10 ** 18 * 50 // 100 // rocketNetworkPrices.getRPLPrice()
+
+def test_position_by_end_time(rocketlendLens, rocketlendp, rocketlendpl, borrower1b, RPLToken):
+    rocketlend = rocketlendp['rocketlend']
+    node = borrower1b['node']
+    borrower = borrower1b['borrower']
+    amount = 5 * 10 ** RPLToken.decimals()
+    # the longer pool goes after the first one (at index 1)
+    rocketlend.borrow(rocketlendpl['poolId'], node, 1, amount, [], sender=borrower)
+    position = rocketlendLens.position(node, 0)
+    assert [(loan.poolId, loan.borrowed) for loan in position.loans] == [
+        (rocketlendp['poolId'], borrower1b['amount']), (rocketlendpl['poolId'], amount)]
+
+def test_position_pages(rocketlendLens, rocketlendp, borrower1b, RPLToken, rocketVaultImpersonated, other):
+    rocketlend = rocketlendp['rocketlend']
+    lender = rocketlendp['lender']
+    node = borrower1b['node']
+    borrower = borrower1b['borrower']
+    amount = 10 ** RPLToken.decimals()
+    # 65 loans in all, each later pool ending after the one before
+    grab_RPL(lender, 64 * amount, RPLToken, rocketVaultImpersonated, rocketlend)
+    poolIds = [rocketlendp['poolId']]
+    for i in range(64):
+        params = dict(interestRate=10, endTime=rocketlendp['endTime'] + i + 1)
+        receipt = rocketlend.createPool(params, amount, 0, [0], sender=lender)
+        poolIds.append(rocketlend.CreatePool.from_receipt(receipt)[0].id)
+    for start in range(1, 65, 32):
+        rocketlend.borrowMany(node, [(poolId, start + i, amount, []) for i, poolId in enumerate(poolIds[start:start + 32])],
+                              sender=borrower)
+    first = rocketlendLens.position(node, 0)
+    assert [loan.poolId for loan in first.loans] == poolIds[:64]
+    assert first.more == 64
+    rest = rocketlendLens.position(node, first.more)
+    assert [loan.poolId for loan in rest.loans] == poolIds[64:]
+    assert rest.more == 0
+    assert (rest.borrowLimit, rest.RPL, rest.ETH) == (first.borrowLimit, first.RPL, first.ETH)
+    # the last page is also the whole list from its start
+    assert [loan.poolId for loan in rocketlendLens.position(node, 60).loans] == poolIds[60:]
+    grab_RPL(other, 2 * amount, RPLToken, rocketVaultImpersonated, rocketlend)
+    rocketlend.repay(poolIds[1], node, 1, 0, 0, sender=other)
+    with reverts('revert: i'):
+        rocketlendLens.position(node, 2)
+
+### paged views
+
+def test_get_pools(rocketlendLens, rocketlendp, rocketlendpl):
+    rocketlend = rocketlendp['rocketlend']
+    pools = rocketlendLens.getPools(0, 10)
+    assert len(pools) == rocketlend.nextPoolId()
+    info = pools[rocketlendpl['poolId']]
+    assert info.params.endTime == rocketlendpl['endTime']
+    assert info.params.interestRate == 10
+    assert info.state.available == rocketlendpl['amount']
+    assert info.state.lenderAddress == rocketlendpl['lender']
+    assert [info.params.endTime for info in rocketlendLens.getPools(rocketlendpl['poolId'], 1)] == [rocketlendpl['endTime']]
+    assert rocketlendLens.getPools(rocketlend.nextPoolId(), 10) == []
+
+def test_get_pool_loans(rocketlendLens, rocketlendp, borrower1b):
+    rocketlend = rocketlendp['rocketlend']
+    poolId = rocketlendp['poolId']
+    node = borrower1b['node']
+    assert rocketlend.poolNodeCount(poolId) == 1
+    loans = rocketlendLens.getPoolLoans(poolId, 0, 10)
+    assert [(loan.node, loan.loan.borrowed) for loan in loans] == [(node, borrower1b['amount'])]
+    # the node's position in the list does not show in accountedUntil
+    assert loans[0].loan.accountedUntil == borrower1b['receipt'].timestamp
+    assert rocketlendLens.getPoolLoans(poolId, 1, 10) == []
+
+def test_get_pool_loans_repaid(rocketlendLens, borrower1b, other, RPLToken, rocketVaultImpersonated):
+    rocketlend = borrower1b['rocketlend']
+    poolId = borrower1b['poolId']
+    node = borrower1b['node']
+    grab_RPL(other, 2 * borrower1b['amount'], RPLToken, rocketVaultImpersonated, rocketlend)
+    rocketlend.repay(poolId, node, 0, 0, 0, sender=other)
+    assert rocketlend.poolNodeCount(poolId) == 0
+    assert rocketlendLens.getPoolLoans(poolId, 0, 10) == []
+
 ### repay
 
 def test_repay_partial_supply_unapproved(rocketlendp, RPLToken, rocketVaultImpersonated, borrower1b):
@@ -1094,10 +1451,91 @@ def test_repay_withdraw_supply_unauth(rocketlendp, borrower1b, RPLToken, rocketV
     with reverts('revert: a'):
         rocketlend.repay(poolId, node, 0, amount, amount + supply, sender=other)
 
+### repayInOrder
+
+def test_repay_in_order_unstake_unauth(borrower1b, other):
+    rocketlend = borrower1b['rocketlend']
+    with reverts('revert: a'):
+        rocketlend.repayInOrder(borrower1b['node'], 1, 1, sender=other)
+
+def test_repay_in_order_partial(rocketlendp, rocketlendpl, borrower1b, RPLToken, rocketVaultImpersonated, other):
+    rocketlend = rocketlendp['rocketlend']
+    node = borrower1b['node']
+    borrower = borrower1b['borrower']
+    amount = 5 * 10 ** RPLToken.decimals()
+    rocketlend.borrow(rocketlendpl['poolId'], node, 1, amount, [], sender=borrower)
+    grab_RPL(other, amount, RPLToken, rocketVaultImpersonated, rocketlend)
+    balance = RPLToken.balanceOf(other)
+    receipt = rocketlend.repayInOrder(node, 0, amount, sender=other)
+    assert balance - RPLToken.balanceOf(other) == amount
+    # the earlier pool is repaid first (its interest, then borrowed)
+    assert rocketlend.loans(rocketlendpl['poolId'], node).borrowed == amount
+    loan = rocketlend.loans(rocketlendp['poolId'], node)
+    assert loan.interestDue == 0
+    assert 0 < borrower1b['amount'] - loan.borrowed <= amount
+    logs = rocketlend.RepayInOrder.from_receipt(receipt)
+    assert [log['amount'] for log in logs] == [amount]
+
+def test_repay_in_order_all(rocketlendp, rocketlendpl, borrower1b, RPLToken, rocketVaultImpersonated, other, chain):
+    rocketlend = rocketlendp['rocketlend']
+    node = borrower1b['node']
+    borrower = borrower1b['borrower']
+    amount = 5 * 10 ** RPLToken.decimals()
+    rocketlend.borrow(rocketlendpl['poolId'], node, 1, amount, [], sender=borrower)
+    supply = 2 * (borrower1b['amount'] + amount)
+    grab_RPL(other, supply, RPLToken, rocketVaultImpersonated, rocketlend)
+    balance = RPLToken.balanceOf(other)
+    chain.pending_timestamp += round(datetime.timedelta(days=28).total_seconds())
+    receipt = rocketlend.repayInOrder(node, 0, supply, sender=other)
+    assert rocketlend.debtPools(node, 0).next == 0
+    assert rocketlend.borrowers(node).borrowed == 0
+    assert rocketlend.borrowers(node).interestDue == 0
+    # only what was owed is taken
+    repaid = rocketlend.RepayInOrder.from_receipt(receipt)[0]['amount']
+    assert borrower1b['amount'] + amount < repaid < supply
+    assert balance - RPLToken.balanceOf(other) == repaid
+    assert rocketlend.RepayInOrder.from_receipt(receipt)[0]['pools'] == 2
+
+def test_repay_in_order_zero_all(rocketlendp, rocketlendpl, borrower1b, RPLToken, rocketVaultImpersonated, other):
+    rocketlend = rocketlendp['rocketlend']
+    node = borrower1b['node']
+    borrower = borrower1b['borrower']
+    amount = 5 * 10 ** RPLToken.decimals()
+    rocketlend.borrow(rocketlendpl['poolId'], node, 1, amount, [], sender=borrower)
+    grab_RPL(other, 2 * (borrower1b['amount'] + amount), RPLToken, rocketVaultImpersonated, rocketlend)
+    balance = RPLToken.balanceOf(other)
+    receipt = rocketlend.repayInOrder(node, 0, 0, sender=other)
+    assert rocketlend.debtPools(node, 0).next == 0
+    assert rocketlend.borrowers(node).borrowed + rocketlend.borrowers(node).interestDue == 0
+    [log] = rocketlend.RepayInOrder.from_receipt(receipt)
+    assert log['pools'] == 2
+    assert balance - RPLToken.balanceOf(other) == log['amount']
+
+def test_repay_in_order_by_withdraw(rocketlendp, borrower1b, RPLToken, rocketNodeStaking, chain):
+    rocketlend = rocketlendp['rocketlend']
+    node = borrower1b['node']
+    borrower = borrower1b['borrower']
+    amount = 2 * 10 ** RPLToken.decimals()
+    stakeBefore = rocketNodeStaking.getNodeRPLStake(node)
+    # past the unstaking cooldown after the stake the borrow made
+    chain.pending_timestamp += round(datetime.timedelta(days=30).total_seconds())
+    rocketlend.repayInOrder(node, 2 * amount, amount, sender=borrower)
+    assert stakeBefore - rocketNodeStaking.getNodeRPLStake(node) == 2 * amount
+    assert rocketlend.borrowers(node).RPL == amount
 
 ### transferDebt
 #### TODO
 
+### claimMerkleRewards
+
+def test_claim_merkle_rewards_overflow(borrower1):
+    rocketlend = borrower1['rocketlend']
+    # checked before the distributor is called, so the amounts need no proof
+    with reverts('revert: ov'):
+        rocketlend.claimMerkleRewards(borrower1['node'], [0], [2 ** 128], [0], [[]], 0, sender=borrower1['borrower'])
+    with reverts('revert: ov'):
+        rocketlend.claimMerkleRewards(borrower1['node'], [0], [0], [2 ** 128], [[]], 0, sender=borrower1['borrower'])
+
 ### distributeRefund
 
 def test_distribute_rewards_two_MPs_from_other(rocketlend, nodeWithMPsJoined, rocketMinipoolManager, other, accounts, Contract, minipoolABI):
@@ -1150,6 +1588,18 @@ def test_other_distribute_minipool_then_refund(rocketlend, nodeWithMPsJoined, ot
     assert minipool.balance == 0
     assert rocketlend.borrowers(node).ETH == prevBorrowerETH + refundBalance
 
+def test_distribute_fee_distributor_once(rocketlend, nodeWithMPsJoined, rocketStorage, other, Contract):
+    node = nodeWithMPsJoined['node']
+    factory = Contract(rocketStorage.getAddress(keccak('contract.addressrocketNodeDistributorFactory'.encode())))
+    other.transfer(factory.getProxyAddress(node), 10 ** 18)
+    prevBorrowerETH = rocketlend.borrowers(node).ETH
+    prevBalance = rocketlend.balance
+    receipt = rocketlend.distributeRefund(node, True, [], sender=other)
+    logs = rocketlend.DistributeRefund.from_receipt(receipt)
+    assert len(logs) == 1
+    assert 0 < logs[0].amount == rocketlend.balance - prevBalance
+    assert rocketlend.borrowers(node).ETH == prevBorrowerETH + logs[0].amount == logs[0].total
+
 #### TODO: test multiple minipools refund
 
 ### withdraw
@@ -1247,7 +1697,7 @@ def test_deposit_eth_none(rocketlendp, borrower1, rocketNodeDeposit):
     node = borrower1['node']
     borrower = borrower1['borrower']
     assert rocketlend.borrowers(node).ETH == 0
-    with reverts(): # TODO ('Integer underflow'):
+    with reverts('revert: ov'):
         rocketlend.depositETHFor(node, 20, sender=borrower)
 
 def test_borrow_again(rocketlendp, RPLToken, borrower1b):
@@ -1258,7 +1708,7 @@ def test_borrow_again(rocketlendp, RPLToken, borrower1b):
     startTime = borrower1b['receipt'].timestamp
     oneRPL = 10 ** RPLToken.decimals()
     amount = 19 * oneRPL
-    receipt = rocketlend.borrow(poolId, node, 0, amount, sender=borrower)
+    receipt = rocketlend.borrow(poolId, node, 0, amount, [], sender=borrower)
     duration = receipt.timestamp - startTime
     logs = rocketlend.Borrow.from_receipt(receipt)
     assert len(logs) == 1